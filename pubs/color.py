@@ -115,22 +115,31 @@ def generate_colors(stream, color=True, bold=True, italic=True, force_colors=Fal
     return colors
 
 
+def compile_colors(colors):
+    """Precompute the (prefix, suffix) pair surrounding text of each color"""
+    return {name: (code, colors['end']) for name, code in colors.items()}
+
+
 COLORS_OUT = generate_colors(sys.stdout, color=False, bold=False, italic=False)
 COLORS_ERR = generate_colors(sys.stderr, color=False, bold=False, italic=False)
+DYES_OUT = compile_colors(COLORS_OUT)
+DYES_ERR = compile_colors(COLORS_ERR)
 
 
 def dye_out(s, color='end'):
     """Color a string for output on stdout"""
-    return u'{}{}{}'.format(COLORS_OUT[color], s, COLORS_OUT['end'])
+    prefix, suffix = DYES_OUT[color]
+    return u'{}{}{}'.format(prefix, s, suffix)
 
 def dye_err(s, color='end'):
     """Color a string for output on stderr"""
-    return u'{}{}{}'.format(COLORS_ERR[color], s, COLORS_OUT['end'])
+    prefix, suffix = DYES_ERR[color]
+    return u'{}{}{}'.format(prefix, s, suffix)
 
 
 def setup(conf, force_colors=False):
     """Prepare color for stdout and stderr"""
-    global COLORS_OUT, COLORS_ERR
+    global COLORS_OUT, COLORS_ERR, DYES_OUT, DYES_ERR
     COLORS_OUT = generate_colors(sys.stdout, force_colors=force_colors,
                                  color =conf['formating']['color'],
                                  bold  =conf['formating']['bold'],
@@ -142,6 +151,8 @@ def setup(conf, force_colors=False):
     for key, value in conf['theme'].items():
         COLORS_OUT[key] = COLORS_OUT.get(value, '')
         COLORS_ERR[key] = COLORS_ERR.get(value, '')
+    DYES_OUT = compile_colors(COLORS_OUT)
+    DYES_ERR = compile_colors(COLORS_ERR)
 
 
 # undye
@@ -1,19 +1,2 @@
-# core
-from . import init_cmd
-from . import conf_cmd
-
-from . import add_cmd
-from . import rename_cmd
-from . import remove_cmd
-from . import list_cmd
-# doc
-from . import doc_cmd
-from . import tag_cmd
-from . import note_cmd
-# bulk
-from . import export_cmd
-from . import import_cmd
-# bonus
-from . import websearch_cmd
-
-from . import edit_cmd
+# Command modules are imported on demand by pubs_cmd.CORE_CMDS, so that
+# only the selected command (and its dependencies) is loaded.
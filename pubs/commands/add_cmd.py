@@ -4,7 +4,6 @@ from .. import content
 from .. import repo
 from .. import paper
 from .. import templates
-from .. import apis
 from .. import color
 from .. import pretty
 
@@ -73,6 +72,7 @@ def command(conf, args):
         if args.doi is None and args.isbn is None:
             bibentry = bibentry_from_editor(conf, ui, rp)
         else:
+            from .. import apis  # slow to import
             if args.doi is not None:
                 bibentry_raw = apis.doi2bibtex(args.doi)
                 bibentry = rp.databroker.verify(bibentry_raw)
@@ -0,0 +1,70 @@
+import sys
+import shlex
+
+from .. import repo
+from .. import pubs_cmd
+from ..uis import get_ui
+from ..content import read_text_file
+
+
+# commands that cannot run inside a batch or a shell
+NESTED_CMDS = ('batch', 'shell', 'daemon')
+
+
+def parser(subparsers, conf):
+    parser = subparsers.add_parser(
+        'batch',
+        help='run pubs commands read from a file or standard input')
+    parser.add_argument('-x', '--stop-on-error', action='store_true',
+                        default=False, dest='stop_on_error',
+                        help='stop at the first command that fails.')
+    parser.add_argument('path', nargs='?', default=None,
+                        help='file with one command per line, without the '
+                             'leading "pubs" (default: standard input)')
+    return parser
+
+
+def split_command(line):
+    """Return the arguments of a command line, without a leading 'pubs'.
+    Quoting and comments follow the shell syntax."""
+    args = shlex.split(line, comments=True)
+    if len(args) > 0 and args[0] == 'pubs':
+        args = args[1:]
+    return args
+
+
+def run_line(conf, line):
+    """Run a command line; return its exit status."""
+    args = split_command(line)
+    if len(args) == 0:
+        return 0
+    if args[0] in NESTED_CMDS:
+        get_ui().error(u'`pubs {}` cannot be run here.'.format(args[0]))
+        return 1
+    return pubs_cmd.run_command(conf, args)
+
+
+def command(conf, args):
+
+    ui = get_ui()
+    if args.path is None:
+        # read everything first, so that prompts do not consume commands.
+        lines = sys.stdin.read().splitlines()
+    else:
+        lines = read_text_file(args.path).splitlines()
+
+    failed = 0
+    with repo.shared_repository(conf):
+        for lineno, line in enumerate(lines, 1):
+            try:
+                status = run_line(conf, line)
+            except ValueError as e:  # shlex
+                ui.error(u'line {}: {}'.format(lineno, e))
+                status = 1
+            if status != 0:
+                failed += 1
+                if args.stop_on_error:
+                    ui.error(u'line {}: command failed, stopping.'.format(lineno))
+                    break
+    if failed > 0:
+        ui.exit(1)
@@ -12,18 +12,19 @@ def parser(subparsers, conf):
 def command(conf, args):
     uis.init_ui(conf)
     ui = uis.get_ui()
+    confpath = config.get_confpath()
+    old_conf_text = content.read_binary_file(confpath)
 
     while True:
         # get modif from user
-        ui.edit_file(config.get_confpath(), temporary=False)
+        ui.edit_file(confpath, temporary=False)
 
-        new_conf = config.load_conf()
         try:
-            config.check_conf(new_conf)
+            config.load_conf()  # validates the configuration
             ui.message('The configuration file was updated.')
             break
         except AssertionError as e: # TODO better error message
-            ui.error('Error reading the modified configuration file [' + e.message + '].')
+            ui.error('Error reading the modified configuration file [' + str(e) + '].')
             options = ['edit_again', 'abort']
             choice = options[ui.input_choice(
                 options, ['e', 'a'],
@@ -31,6 +32,6 @@ def command(conf, args):
                 )]
 
             if choice == 'abort':
-                config.save_conf(conf)
+                content.write_file(confpath, old_conf_text, mode='wb')
                 ui.message('The changes have been reverted.')
                 break
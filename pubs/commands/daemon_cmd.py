@@ -0,0 +1,54 @@
+import os
+
+from .. import daemon
+from ..uis import get_ui
+
+
+def parser(subparsers, conf):
+    parser = subparsers.add_parser(
+        'daemon',
+        help="keep pubs loaded in memory, to run commands faster")
+    parser.add_argument('action', nargs='?', default='status',
+                        choices=['start', 'stop', 'status'],
+                        help='start or stop the daemon, or report if it is running')
+    parser.add_argument('-f', '--foreground', action='store_true', default=False,
+                        help='do not detach the daemon from the terminal')
+    return parser
+
+
+def command(conf, args):
+
+    ui = get_ui()
+    if not daemon.supported():
+        ui.error('the pubs daemon requires Python 3.')
+        ui.exit()
+    conf_path = conf.filename
+    reply = daemon.request(conf_path, 'status')
+
+    if args.action == 'status':
+        if reply is None:
+            ui.message('No pubs daemon is running.')
+        else:
+            ui.message('pubs daemon running (pid {}), serving {}.'.format(
+                reply['pid'], reply['pubsdir']))
+    elif args.action == 'start':
+        if reply is not None:
+            ui.error('a pubs daemon is already running (pid {}).'.format(
+                reply['pid']))
+            ui.exit()
+        if args.foreground:
+            ui.info('pubs daemon running in the foreground (pid {}).'.format(
+                os.getpid()))
+            daemon.start(conf_path, foreground=True)
+            return
+        pid = daemon.start(conf_path)
+        if pid is None:
+            ui.error('the pubs daemon failed to start.')
+            ui.exit()
+        ui.info('pubs daemon started (pid {}).'.format(pid))
+    elif args.action == 'stop':
+        if reply is None:
+            ui.error('no pubs daemon is running.')
+            ui.exit()
+        daemon.request(conf_path, 'stop')
+        ui.info('pubs daemon stopped.')
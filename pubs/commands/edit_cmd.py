@@ -2,7 +2,6 @@ from ..paper import Paper
 from .. import repo
 
 from ..uis import get_ui
-from ..endecoder import EnDecoder
 from ..utils import resolve_citekey
 from ..completion import CiteKeyCompletion
 
@@ -29,6 +28,7 @@ def command(conf, args):
     citekey = resolve_citekey(rp, args.citekey, ui=ui, exit_on_fail=True)
     paper = rp.pull_paper(citekey)
 
+    from ..endecoder import EnDecoder  # slow to import
     coder = EnDecoder()
     if meta:
         encode = coder.encode_metadata
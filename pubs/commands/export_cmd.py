@@ -2,7 +2,6 @@ from __future__ import print_function
 
 from .. import repo
 from ..uis import get_ui
-from .. import endecoder
 from ..utils import resolve_citekey_list
 from ..completion import CiteKeyCompletion
 
@@ -16,6 +15,14 @@ def parser(subparsers, conf):
     return parser
 
 
+def _unique(papers):
+    seen = set()
+    for p in papers:
+        if p.citekey not in seen:
+            seen.add(p.citekey)
+            yield p
+
+
 def command(conf, args):
     """
     """
@@ -31,12 +38,9 @@ def command(conf, args):
         for key in resolve_citekey_list(repo=rp, citekeys=args.citekeys, ui=ui, exit_on_fail=True):
             papers.append(rp.pull_paper(key))
 
-    bib = {}
-    for p in papers:
-        bib[p.citekey] = p.bibdata
-
+    from .. import endecoder  # slow to import
     exporter = endecoder.EnDecoder()
-    bibdata_raw = exporter.encode_bibdata(bib)
-    ui.message(bibdata_raw)
+    ui.message_lines((exporter.encode_bibdata({p.citekey: p.bibdata})
+                      for p in _unique(papers)), page=True)
 
     rp.close()
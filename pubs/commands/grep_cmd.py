@@ -0,0 +1,141 @@
+import re
+import mmap
+
+from .. import repo
+from .. import color
+from ..utils import imap_in_pool
+from ..uis import get_ui
+
+
+SHARD_SIZE = 64
+
+# field names giving context to matches, in bibtex and yaml files
+FIELD_RES = {'bib': re.compile(br'^\s*([\w-]+)\s*=', re.MULTILINE),
+             'meta': re.compile(br'^([\w-]+):', re.MULTILINE),
+             }
+
+
+def parser(subparsers, conf):
+    parser = subparsers.add_parser(
+        'grep',
+        help="search the bibtex, metadata and note files with a regular expression")
+    parser.add_argument('-i', '--ignore-case', action='store_true',
+            default=False, dest='ignore_case',
+            help='case insensitive matching (ascii letters only).')
+    parser.add_argument('-k', '--citekeys-only', action='store_true',
+            default=False, dest='citekeys',
+            help='only print the citekeys of papers with matches.')
+    parser.add_argument('--bib', action='append_const', const='bib',
+            dest='kinds', help='search bibtex files.')
+    parser.add_argument('--meta', action='append_const', const='meta',
+            dest='kinds', help='search metadata files.')
+    parser.add_argument('--notes', action='append_const', const='notes',
+            dest='kinds', help='search notes.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+            help='number of worker processes (default: one per core).')
+    parser.add_argument('pattern', help='regular expression (python syntax)')
+    return parser
+
+
+def _grep_file(regex, kind, path):
+    """Return the (lineno, field, line, spans) of the lines of a file
+    matching regex. The file is memory-mapped rather than read."""
+    try:
+        with open(path, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                return []
+    except (IOError, OSError):  # e.g. papers without notes
+        return []
+    try:
+        field_re = FIELD_RES.get(kind)
+        matches = []
+        lineno, pos = 1, 0
+        field, field_pos = None, 0
+        for m in regex.finditer(data):
+            start = data.rfind(b'\n', 0, m.start()) + 1
+            if start < pos:  # line already reported
+                line_start = pos - len(matches[-1][2])
+                matches[-1][3].append((m.start() - line_start, m.end() - line_start))
+                continue
+            lineno += data[pos:start].count(b'\n')
+            end = data.find(b'\n', m.end())
+            if end == -1:
+                end = len(data)
+            if field_re is not None:
+                for fm in field_re.finditer(data, field_pos, end):
+                    if fm.start() > m.start():
+                        break
+                    field, field_pos = fm.group(1), fm.end()
+            matches.append((lineno, field, data[start:end],
+                            [(m.start() - start, m.end() - start)]))
+            lineno += data[start:end].count(b'\n')
+            pos = end
+        return matches
+    finally:
+        data.close()
+
+
+def _grep_shard(job):
+    """Grep a list of (citekey, kind, path) files; run in worker processes."""
+    pattern, flags, files = job
+    regex = re.compile(pattern, flags)
+    return [(citekey, kind, _grep_file(regex, kind, path))
+            for citekey, kind, path in files]
+
+
+def _highlight(line, spans):
+    parts, last = [], 0
+    for start, end in spans:
+        parts.append(line[last:start].decode('utf-8', 'replace'))
+        parts.append(color.dye_out(line[start:end].decode('utf-8', 'replace'),
+                                   'bold'))
+        last = end
+    parts.append(line[last:].decode('utf-8', 'replace'))
+    return u''.join(parts)
+
+
+def command(conf, args):
+
+    ui = get_ui()
+    rp = repo.Repository(conf)
+    kinds = args.kinds or ['bib', 'meta', 'notes']
+    try:
+        pattern = args.pattern.encode('utf-8')
+        flags = re.IGNORECASE if args.ignore_case else 0
+        re.compile(pattern, flags)
+    except re.error as e:
+        ui.error(u'invalid pattern: {}'.format(e))
+        ui.exit()
+
+    filebroker = rp.databroker.databroker.filebroker
+    paths = {'bib': filebroker.bib_path,
+             'meta': filebroker.meta_path,
+             'notes': lambda c: rp.databroker.real_notepath(
+                 c, conf['main']['note_extension'])}
+    files = [(citekey, kind, paths[kind](citekey))
+             for citekey in sorted(rp.citekeys) for kind in kinds]
+    jobs = [(pattern, flags, files[i:i + SHARD_SIZE])
+            for i in range(0, len(files), SHARD_SIZE)]
+
+    found = set()
+    for results in imap_in_pool(_grep_shard, jobs, args.jobs):
+        for citekey, kind, matches in results:
+            if len(matches) == 0:
+                continue
+            if args.citekeys:
+                if citekey not in found:
+                    found.add(citekey)
+                    ui.message(citekey)
+                continue
+            for lineno, field, line, spans in matches:
+                where = kind if field is None else u'{}:{}'.format(
+                    kind, field.decode('utf-8'))
+                if kind == 'notes':
+                    where = u'{}:{}'.format(kind, lineno)
+                ui.message(u'{} {}: {}'.format(
+                    color.dye_out(citekey, 'citekey'),
+                    color.dye_out(where, 'filepath'),
+                    _highlight(line, spans).strip()))
+    rp.close()
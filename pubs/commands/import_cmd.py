@@ -2,7 +2,6 @@ import os
 import datetime
 
 from .. import repo
-from .. import endecoder
 from .. import bibstruct
 from .. import color
 from ..paper import Paper
@@ -33,6 +32,7 @@ def many_from_path(bibpath):
         if loading of entry failed, the excpetion is returned in the
         dictionary in place of the paper
     """
+    from .. import endecoder  # slow to import
     coder = endecoder.EnDecoder()
 
     bibpath = system_path(bibpath)
@@ -73,18 +73,23 @@ def command(conf, args):
     # Extract papers from bib
     papers = many_from_path(bibpath)
     keys = args.keys or papers.keys()
-    for k in keys:
-        p = papers[k]
-        if isinstance(p, Exception):
-            ui.error(u'Could not load entry for citekey {}.'.format(k))
-        else:
-            rp.push_paper(p)
-            ui.info(u'{} imported.'.format(color.dye_out(p.citekey, 'citekey')))
-            docfile = bibstruct.extract_docfile(p.bibdata)
-            if docfile is None:
-                ui.warning("No file for {}.".format(p.citekey))
+    imported = []
+    # documents are copied once all papers are imported
+    with rp.transaction():
+        for k in keys:
+            p = papers[k]
+            if isinstance(p, Exception):
+                ui.error(u'Could not load entry for citekey {}.'.format(k))
             else:
-                rp.push_doc(p.citekey, docfile, copy=copy)
-                #FIXME should move the file if configured to do so.
+                rp.push_paper(p)
+                imported.append(p.citekey)
+                docfile = bibstruct.extract_docfile(p.bibdata)
+                if docfile is None:
+                    ui.warning("No file for {}.".format(p.citekey))
+                else:
+                    rp.push_doc(p.citekey, docfile, copy=copy)
+                    #FIXME should move the file if configured to do so.
+    for citekey in imported:
+        ui.info(u'{} imported.'.format(color.dye_out(citekey, 'citekey')))
 
     rp.close()
@@ -1,9 +1,14 @@
+import re
+import json
+import shlex
+import argparse
+import collections
 from datetime import datetime
 
 from .. import repo
-from .. import pretty
 from .. import bibstruct
 from ..uis import get_ui
+from ..completion import QueryCompletion, QueryOptionCompletion
 
 
 class InvalidQuery(ValueError):
@@ -25,12 +30,38 @@ def parser(subparsers, conf):
     parser.add_argument('--no-docs', action='store_true',
             dest='nodocs', default=False,
             help='list only pubs without attached documents.')
+    parser.add_argument('--format', choices=FORMATS, default='oneliner',
+            help='output format; json, jsonl and tsv are uncolored, one '
+                 'record per paper.')
+    parser.add_argument('--fields', type=lambda s: s.split(','), default=None,
+            help='comma-separated fields of the records (default: {}).'.format(
+                 ','.join(DEFAULT_FIELDS)))
 
     parser.add_argument('query', nargs='*',
-            help='Paper query ("author:Einstein", "title:learning", "year:2000" or "tags:math")')
+            help='Paper query ("author:Einstein", "title:learning", "year:2000" or "tags:math")'
+            ).completer = QueryCompletion(conf)
     return parser
 
 
+def add_query_option(parser, conf, help):
+    """Add the --query option of the commands changing the papers matching
+    a query. The query is a single argument, split as by a shell, so that
+    the positional arguments of the command are never taken for blocks."""
+    parser.add_argument('-q', '--query', type=split_query, default=None,
+                        metavar='QUERY',
+                        help=help + ', in the syntax of the list command, '
+                                    'e.g. "author:smith year:2020"'
+                        ).completer = QueryOptionCompletion(conf)
+
+
+def split_query(value):
+    """Split a query given as a single argument into its blocks."""
+    try:
+        return shlex.split(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(u'invalid query: {}'.format(e))
+
+
 def date_added(p):
     return p.added or datetime(1, 1, 1)
 
@@ -38,23 +69,122 @@ def date_added(p):
 def command(conf, args):
     ui = get_ui()
     rp = repo.Repository(conf)
-    papers = filter(lambda p: filter_paper(p, args.query,
-                                           case_sensitive=args.case_sensitive),
-                    rp.all_papers())
-    if args.nodocs:
-        papers = [p for p in papers if p.docpath is None]
-    if args.alphabetical:
-        papers = sorted(papers, key=lambda p: p.citekey)
+    if args.format == 'oneliner' and args.fields is not None:
+        ui.error('--fields requires one of the formats json, jsonl or tsv.')
+        ui.exit()
+    key = query_key(args)
+    with rp.reading():  # read, but not paged, in one state of the repository
+        citekeys = rp.databroker.pull_query(key)
+        if citekeys is None:
+            papers = filter(lambda p: filter_paper(p, args.query,
+                                                   case_sensitive=args.case_sensitive),
+                            rp.all_papers())
+            if args.nodocs:
+                papers = [p for p in papers if p.docpath is None]
+            if args.alphabetical:
+                papers = sorted(papers, key=lambda p: p.citekey)
+            else:
+                papers = sorted(papers, key=date_added)
+            citekeys = [p.citekey for p in papers]
+            rp.databroker.push_query(key, citekeys)
+        if args.format != 'oneliner':
+            fields = args.fields or (['citekey'] if args.citekeys else DEFAULT_FIELDS)
+            records = [paper_record(rp, c, fields) for c in citekeys]
+        elif not args.citekeys:
+            lines = [rp.paper_oneliner(c) for c in citekeys]
+    if args.format != 'oneliner':
+        ui.message_lines(FORMATS[args.format](records, fields), page=True)
+    elif args.citekeys:
+        ui.message_lines(citekeys, page=True)
     else:
-        papers = sorted(papers, key=date_added)
-    if len(papers) > 0:
-        ui.message('\n'.join(
-            pretty.paper_oneliner(p, citekey_only=args.citekeys)
-            for p in papers))
+        ui.message_lines(lines, page=True)
 
     rp.close()
 
 
+# records
+
+DEFAULT_FIELDS = ('citekey', 'author', 'title', 'year', 'tags')
+TSV_SPECIAL_CHARS = re.compile(u'[\t\n\r]')
+
+
+def paper_record(rp, citekey, fields):
+    """Return the values of the fields of a paper, in order."""
+    paper = None
+    if any(FIELD_ALIASES.get(f, f) != 'citekey' for f in fields):
+        paper = rp.pull_paper(citekey)
+    return collections.OrderedDict((f, _field(paper, citekey, f))
+                                   for f in fields)
+
+
+def _field(paper, citekey, field):
+    field = FIELD_ALIASES.get(field, field)
+    if field == 'citekey':
+        return citekey
+    elif field == 'tag':
+        return sorted(paper.tags)
+    elif field == 'added':
+        return paper.added.isoformat() if paper.added else None
+    elif field == 'docfile':
+        return paper.docpath
+    value = paper.bibdata.get(field)
+    if isinstance(value, dict):  # journal
+        value = value.get('name')
+    return value
+
+
+def json_lines(records, fields):
+    """A JSON array, one record per line."""
+    yield u'['
+    previous = None
+    for record in records:
+        if previous is not None:
+            yield previous + u','
+        previous = json.dumps(record, ensure_ascii=False)
+    if previous is not None:
+        yield previous
+    yield u']'
+
+
+def jsonl_lines(records, fields):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False)
+
+
+def tsv_lines(records, fields):
+    """Tab-separated values, with a header. Lists are joined with '; '."""
+    yield u'\t'.join(fields)
+    for record in records:
+        yield u'\t'.join(_tsv_value(v) for v in record.values())
+
+
+def _tsv_value(value):
+    if value is None:
+        return u''
+    if isinstance(value, list):
+        value = u'; '.join(value)
+    return TSV_SPECIAL_CHARS.sub(u' ', u'{}'.format(value))
+
+
+FORMATS = collections.OrderedDict([
+    ('oneliner', None),
+    ('json', json_lines),
+    ('jsonl', jsonl_lines),
+    ('tsv', tsv_lines),
+    ])
+
+
+def query_key(args):
+    """Normalize the query of a list command, to cache its results.
+
+    Query blocks are and-ed together, so that their order is irrelevant.
+    """
+    blocks = sorted(set(u'{}:{}'.format(*_get_field_value(block))
+                        for block in args.query))
+    return (u'list', tuple(blocks), args.case_sensitive, args.nodocs,
+            args.alphabetical)
+
+
 FIELD_ALIASES = {
     'a': 'author',
     'authors': 'author',
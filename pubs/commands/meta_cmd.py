@@ -0,0 +1,95 @@
+from .. import repo
+from ..uis import get_ui
+from ..p3 import ustr
+from .list_cmd import filter_paper, add_query_option
+
+
+# meta --+- set [-q $query] $field=$value [$field=$value [...]]
+#        +- unset [-q $query] $field [$field [...]]
+
+# fields managed by other commands
+RESERVED_FIELDS = {'docfile': 'doc', 'tags': 'tag', 'added': None}
+
+
+def parser(subparsers, conf):
+    meta_parser = subparsers.add_parser(
+        'meta',
+        help='set or unset metadata fields of many publications')
+    meta_subparsers = meta_parser.add_subparsers(
+        title='metadata actions', dest='action',
+        help='actions on the metadata of the publications matching the '
+             'query (of all publications, without query)')
+    meta_subparsers.required = True
+
+    set_parser = meta_subparsers.add_parser(
+        'set', help='set fields, e.g. project=thesis or read=true, with '
+                    'values in YAML as in the metadata files')
+    set_parser.add_argument('fields', nargs='+', metavar='FIELD=VALUE',
+                            help='fields to set')
+    add_query_option(set_parser, conf, 'only change the papers matching the query')
+
+    unset_parser = meta_subparsers.add_parser('unset', help='remove fields')
+    unset_parser.add_argument('fields', nargs='+', metavar='FIELD',
+                              help='fields to remove')
+    add_query_option(unset_parser, conf, 'only change the papers matching the query')
+
+    return meta_parser
+
+
+def command(conf, args):
+
+    ui = get_ui()
+    rp = repo.Repository(conf)
+
+    try:
+        fields = parse_fields(args.action, args.fields)
+    except ValueError as e:
+        ui.error(ustr(e))
+        ui.exit()
+    for field in fields:
+        if field in RESERVED_FIELDS:
+            ui.error(u"The '{}' field can't be changed with the meta "
+                     u"command.".format(field)
+                     + (u' Use the {} command.'.format(RESERVED_FIELDS[field])
+                        if RESERVED_FIELDS[field] else u''))
+            ui.exit()
+
+    papers = [p for p in rp.all_papers() if filter_paper(p, args.query or [])]
+    changed = 0
+    with rp.transaction():
+        for p in papers:
+            metadata = dict(p.metadata)
+            if args.action == 'set':
+                metadata.update(fields)
+            else:
+                for field in fields:
+                    metadata.pop(field, None)
+            if metadata != p.metadata:
+                p.metadata = metadata
+                rp.push_metadata(p)
+                changed += 1
+    ui.info('Metadata changed for {} of the {} matching paper(s).'.format(
+        changed, len(papers)))
+
+    rp.close()
+
+
+def parse_fields(action, arguments):
+    """Parse the fields of an action, with their values for `set`.
+
+    :returns:  a dict of the fields and their values for `set`, a list of
+               the fields for `unset`.
+    :raise ValueError: if a value is missing or invalid.
+    """
+    if action == 'unset':
+        return list(arguments)
+    fields = []
+    for argument in arguments:
+        if '=' not in argument or argument.index('=') == 0:
+            raise ValueError(u"'{}' is not field=value.".format(argument))
+        fields.append(tuple(argument.split('=', 1)))
+    import yaml  # slow to import
+    try:
+        return dict((field, yaml.safe_load(value)) for field, value in fields)
+    except yaml.YAMLError as e:
+        raise ValueError(u'invalid value: {}'.format(e))
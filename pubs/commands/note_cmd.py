@@ -19,4 +19,5 @@ def command(conf, args):
     citekey = resolve_citekey(rp, args.citekey, ui=ui, exit_on_fail=True)
     notepath = rp.databroker.real_notepath(citekey, rp.conf['main']['note_extension'])
     ui.edit_file(notepath, temporary=False)
+    rp.update_fulltext(citekey)
     rp.close()
@@ -0,0 +1,274 @@
+import os
+import sys
+import contextlib
+
+from .. import repo
+from .. import color
+from .. import bibstruct
+from ..uis import get_ui
+from .list_cmd import date_added, _get_field_value, InvalidQuery
+
+
+PROMPT = u'> '
+HELP = u'type to filter, tab to select, enter to print citekeys, esc to quit'
+HISTORY = 64  # filtered queries kept to narrow the next ones
+# columns built at startup, rather than on the first keystroke using them
+PRELOADED = ('citekey', 'text', 'author', 'tag', 'title', 'year', 'journal')
+
+
+def parser(subparsers, conf):
+    parser = subparsers.add_parser(
+        'pick',
+        help='pick papers interactively, and print their citekeys')
+    parser.add_argument('query', nargs='*',
+            help='initial query, in the syntax of the list command, '
+                 'where bare words match the whole description')
+    return parser
+
+
+def command(conf, args):
+    ui = get_ui()
+    rp = repo.Repository(conf)
+    with rp.reading():
+        papers = rp.all_papers()
+        lines = [color.undye(rp.paper_oneliner(p.citekey)) for p in papers]
+    rp.close()
+    index = PickIndex(papers, lines)
+
+    try:
+        with _terminal():
+            citekeys = Picker(index, u' '.join(args.query)).run()
+    except (OSError, IOError):
+        ui.error('pubs pick requires a terminal.')
+        ui.exit()
+    except ImportError:
+        ui.error('pubs pick requires the curses module.')
+        ui.exit()
+    if citekeys is None:
+        ui.exit()
+    ui.message_lines(citekeys)
+
+
+class PickIndex(object):
+    """Compact in-memory index of the papers, filtered on every keystroke.
+
+    Field values are stored by columns, aligned with the list of citekeys,
+    and lowercased once; the most common ones are built at startup. A query
+    that extends a previous one, as when typing, is only matched against the
+    results of the previous one.
+    """
+
+    def __init__(self, papers, lines):
+        order = sorted(range(len(papers)), key=lambda i: date_added(papers[i]))
+        papers = [papers[i] for i in order]
+        self.citekeys = [p.citekey for p in papers]
+        self.lines = [lines[i] for i in order]
+        self._bibdata = [p.bibdata for p in papers]
+        self._columns = {
+            'citekey': self.citekeys,
+            'text': self.lines,
+            'author': [u'\n'.join(bibstruct.author_last(a)
+                                  for a in p.bibdata.get('author', [])) or None
+                       for p in papers],
+            'tag': [u'\n'.join(sorted(p.tags)) or None for p in papers],
+            }
+        self._lowered = {}
+        self._history = []
+        for field in PRELOADED:
+            self.column(field, lower=True)
+
+    def __len__(self):
+        return len(self.citekeys)
+
+    def column(self, field, lower=False):
+        """Values of a field for all papers, None where it is missing."""
+        if field not in self._columns:
+            self._columns[field] = [self._value(b.get(field))
+                                    for b in self._bibdata]
+        if not lower:
+            return self._columns[field]
+        if field not in self._lowered:
+            self._lowered[field] = [None if v is None else v.lower()
+                                    for v in self._columns[field]]
+        return self._lowered[field]
+
+    @staticmethod
+    def _value(value):
+        if isinstance(value, dict):  # journal
+            value = value.get('name')
+        if isinstance(value, list):  # author, editor
+            return u'\n'.join(value)
+        return None if value is None else u'{}'.format(value)
+
+    def filter(self, query):
+        """Return the indexes of the papers matching a query, in order.
+
+        :raise InvalidQuery: if a block of the query is not valid.
+        """
+        blocks = parse_query(query)
+        candidates = None
+        for previous, results in reversed(self._history):
+            if previous == blocks:
+                return results
+            if narrows(previous, blocks):
+                candidates = results
+                break
+        if candidates is None:
+            candidates = range(len(self.citekeys))
+        for field, value, case_sensitive in blocks:
+            column = self.column(field, lower=not case_sensitive)
+            candidates = [i for i in candidates
+                          if column[i] is not None and value in column[i]]
+        candidates = list(candidates)
+        self._history.append((blocks, candidates))
+        del self._history[:-HISTORY]
+        return candidates
+
+
+def parse_query(query):
+    """Return the (field, value, case sensitive) blocks of a query.
+
+    Blocks follow the list command syntax, except that blocks without a
+    field match the whole description of papers. Case is ignored, unless
+    the value has uppercase characters.
+    """
+    blocks = []
+    for word in query.split():
+        if ':' in word:
+            field, value = _get_field_value(word)
+        else:
+            field, value = 'text', word
+        case_sensitive = not value.islower()
+        blocks.append((field, value, case_sensitive))
+    return tuple(blocks)
+
+
+def narrows(previous, blocks):
+    """Whether all the papers matching blocks also match previous."""
+    if not previous:
+        return True
+    n = len(previous) - 1
+    if len(blocks) <= n or previous[:n] != blocks[:n]:
+        return False
+    return (previous[n][0] == blocks[n][0]
+            and blocks[n][1].startswith(previous[n][1]))
+
+
+@contextlib.contextmanager
+def _terminal():
+    """Use the terminal as standard input and output, so that the output of
+    pubs pick can be redirected, as in `pubs edit $(pubs pick)`."""
+    tty = os.open('/dev/tty', os.O_RDWR)
+    sys.stdout.flush()
+    saved = [os.dup(0), os.dup(1)]
+    os.dup2(tty, 0)
+    os.dup2(tty, 1)
+    os.close(tty)
+    try:
+        yield
+    finally:
+        os.dup2(saved[0], 0)
+        os.dup2(saved[1], 1)
+        for fd in saved:
+            os.close(fd)
+
+
+class Picker(object):
+    """Curses interface of pubs pick."""
+
+    def __init__(self, index, query=u''):
+        self.index = index
+        self.query = query
+        self.results = []
+        self.error = None
+        self.cursor = 0
+        self.offset = 0
+        self.selected = set()
+
+    def run(self):
+        """Return the picked citekeys, or None if cancelled."""
+        import curses
+        os.environ.setdefault('ESCDELAY', '25')
+        try:
+            return curses.wrapper(self._loop)
+        except KeyboardInterrupt:
+            return None
+
+    def update(self):
+        try:
+            self.results = self.index.filter(self.query)
+            self.error = None
+        except InvalidQuery as e:
+            self.results = []
+            self.error = u'{}'.format(e)
+        self.cursor = min(self.cursor, max(len(self.results) - 1, 0))
+
+    def picked(self):
+        if self.selected:
+            return [c for c in self.index.citekeys if c in self.selected]
+        if self.results:
+            return [self.index.citekeys[self.results[self.cursor]]]
+        return []
+
+    def _loop(self, screen):
+        import curses
+        curses.use_default_colors()
+        self.update()
+        while True:
+            self._draw(screen, curses)
+            key = self._key(screen)
+            if key in (u'\n', u'\r', curses.KEY_ENTER):
+                return self.picked()
+            elif key in (u'\x1b', u'\x03', u'\x07'):  # esc, ^C, ^G
+                return None
+            elif key in (curses.KEY_UP, u'\x10'):  # ^P
+                self.cursor = max(self.cursor - 1, 0)
+            elif key in (curses.KEY_DOWN, u'\x0e'):  # ^N
+                self.cursor = min(self.cursor + 1, max(len(self.results) - 1, 0))
+            elif key == u'\t':
+                if self.results:
+                    self.selected ^= set([self.index.citekeys[self.results[self.cursor]]])
+                    self.cursor = min(self.cursor + 1, len(self.results) - 1)
+            elif key in (curses.KEY_BACKSPACE, u'\x7f', u'\b'):
+                self.query = self.query[:-1]
+                self.update()
+            elif key == u'\x15':  # ^U
+                self.query = u''
+                self.update()
+            elif not isinstance(key, int) and key >= u' ':
+                self.query += key
+                self.update()
+
+    @staticmethod
+    def _key(screen):
+        if hasattr(screen, 'get_wch'):
+            return screen.get_wch()
+        key = screen.getch()  # python 2: no wide characters
+        return key if key > 255 else chr(key).decode('latin-1')
+
+    def _draw(self, screen, curses):
+        height, width = screen.getmaxyx()
+        rows = height - 2
+        if self.cursor < self.offset:
+            self.offset = self.cursor
+        elif self.cursor >= self.offset + rows:
+            self.offset = self.cursor - rows + 1
+        screen.erase()
+        status = self.error or u'{}/{}{}  {}'.format(
+            len(self.results), len(self.index),
+            u' ({} selected)'.format(len(self.selected)) if self.selected else u'',
+            HELP)
+        self._addstr(screen, 1, 0, status, width, curses.A_DIM)
+        for row, i in enumerate(self.results[self.offset:self.offset + rows]):
+            mark = u'* ' if self.index.citekeys[i] in self.selected else u'  '
+            attr = curses.A_REVERSE if self.offset + row == self.cursor else 0
+            self._addstr(screen, row + 2, 0, mark + self.index.lines[i], width, attr)
+        self._addstr(screen, 0, 0, PROMPT + self.query, width, curses.A_BOLD)
+        screen.refresh()
+
+    @staticmethod
+    def _addstr(screen, y, x, s, width, attr=0):
+        try:
+            screen.addstr(y, x, s[:width - 1], attr)
+        except Exception:  # too small a screen
+            pass
@@ -1,16 +1,20 @@
+import collections
+
 from .. import repo
 from .. import color
 from ..uis import get_ui
 from ..utils import resolve_citekey_list
 from ..p3 import ustr
 from ..completion import CiteKeyCompletion
+from .list_cmd import filter_paper, add_query_option
 
 
 def parser(subparsers, conf):
     parser = subparsers.add_parser('remove', help='removes a publication')
     parser.add_argument('-f', '--force', action='store_true', default=None,
                         help="does not prompt for confirmation.")
-    parser.add_argument('citekeys', nargs='+',
+    add_query_option(parser, conf, 'also remove the papers matching the query')
+    parser.add_argument('citekeys', nargs='*',
                         help="one or several citekeys"
                         ).completer = CiteKeyCompletion(conf)
     return parser
@@ -22,26 +26,34 @@ def command(conf, args):
     force = args.force
     rp = repo.Repository(conf)
 
+    if not args.citekeys and args.query is None:
+        ui.error('a citekey or a query is required.')
+        ui.exit()
     keys = resolve_citekey_list(repo=rp, citekeys=args.citekeys, ui=ui, exit_on_fail=True)
+    if args.query is not None:
+        keys.extend(sorted(p.citekey for p in rp.all_papers()
+                           if filter_paper(p, args.query)))
+        if not keys:
+            ui.message('No publication matches the query.')
+            rp.close()
+            return
+    keys = list(collections.OrderedDict.fromkeys(keys))  # without duplicates
 
     if force is None:
         are_you_sure = (("Are you sure you want to delete the publication(s) [{}]"
             " (this will also delete associated documents)?")
-            .format(', '.join([color.dye_out(c, 'citekey') for c in args.citekeys])))
+            .format(', '.join([color.dye_out(c, 'citekey') for c in keys])))
         sure = ui.input_yn(question=are_you_sure, default='n')
     if force or sure:
-        failed = False  # Whether something failed
-        for c in keys:
-            try:
-                rp.remove_paper(c)
-            except Exception as e:
-                ui.error(ustr(e))
-                failed = True
+        try:
+            rp.remove_papers(keys)
+        except Exception as e:
+            ui.error(ustr(e))
+            ui.exit()  # Exit with nonzero error code
+        finally:
+            rp.close()
         ui.message('The publication(s) [{}] were removed'.format(
             ', '.join([color.dye_out(c, 'citekey') for c in keys])))
-        if failed:
-            ui.exit()  # Exit with nonzero error code
-        # FIXME: print should check that removal proceeded well.
     else:
         ui.message('The publication(s) [{}] were {} removed'.format(
             ', '.join([color.dye_out(c, 'citekey') for c in keys]),
@@ -3,14 +3,23 @@ from .. import color
 from .. import repo
 from ..utils import resolve_citekey
 from ..completion import CiteKeyCompletion
+from .list_cmd import filter_paper, date_added, add_query_option
 
 
 def parser(subparsers, conf):
     parser = subparsers.add_parser('rename',
                                    help='rename the citekey of a repository')
-    parser.add_argument('citekey', help='current citekey'
+    parser.add_argument('citekey', nargs='?', help='current citekey'
                         ).completer = CiteKeyCompletion(conf)
-    parser.add_argument('new_citekey', help='new citekey')
+    parser.add_argument('new_citekey', nargs='?', help='new citekey')
+    parser.add_argument('-g', '--regenerate', action='store_true', default=False,
+                        help='generate again the citekeys of all papers, or of '
+                             'the papers matching the query, from their authors '
+                             'and year')
+    add_query_option(parser, conf, 'with --regenerate, only the papers '
+                                   'matching the query')
+    parser.add_argument('-n', '--dry-run', action='store_true', default=False,
+                        help='with --regenerate, only show the new citekeys')
     return parser
 
 
@@ -23,6 +32,21 @@ def command(conf, args):
     ui = get_ui()
     rp = repo.Repository(conf)
 
+    if args.regenerate:
+        if args.citekey is not None:
+            ui.error('--regenerate takes no citekey; use --query to select '
+                     'the papers.')
+            ui.exit()
+        regenerate(rp, args.query or [], dry_run=args.dry_run)
+        rp.close()
+        return
+    if args.query is not None:
+        ui.error('--query requires --regenerate.')
+        ui.exit()
+    if args.citekey is None or args.new_citekey is None:
+        ui.error('a citekey and a new citekey are required.')
+        ui.exit()
+
     # TODO: here should be a test whether the new citekey is valid
     key = resolve_citekey(repo=rp, citekey=args.citekey, ui=ui, exit_on_fail=True)
     paper = rp.pull_paper(key)
@@ -32,3 +56,20 @@ def command(conf, args):
         color.dye_out(args.new_citekey, 'citekey')))
 
     rp.close()
+
+
+def regenerate(rp, query, dry_run=False):
+    """Plan all the renames first, then run them in a single batch, and print
+    the old and new citekeys, tab-separated."""
+    ui = get_ui()
+    papers = sorted((p for p in rp.all_papers() if filter_paper(p, query)),
+                    key=date_added)  # older papers get the lower suffixes
+    renames, skipped = rp.regenerated_citekeys(papers)
+    for paper in skipped:
+        ui.warning(u"No author nor editor for '{}': citekey kept.".format(
+            color.dye_err(paper.citekey, 'citekey')))
+    lines = [u'{}\t{}'.format(paper.citekey, new_citekey)
+             for paper, new_citekey in renames]
+    if not dry_run:
+        rp.rename_papers(renames)
+    ui.message_lines(lines)
@@ -0,0 +1,35 @@
+from .. import repo
+from ..uis import get_ui
+
+
+def parser(subparsers, conf):
+    parser = subparsers.add_parser(
+        'search',
+        help="search papers by title, author and journal, or by text")
+    parser.add_argument('-k', '--citekeys-only', action='store_true',
+            default=False, dest='citekeys',
+            help='Only returns citekeys of matching papers.')
+    parser.add_argument('-t', '--text', action='store_true',
+            default=False, dest='fulltext',
+            help='rank papers on the text of their title, abstract, note '
+                 'and document rather than on fuzzy title, author and '
+                 'journal.')
+    parser.add_argument('-n', '--limit', type=int, default=20,
+            help='maximum number of results (default: 20).')
+    parser.add_argument('query', nargs='+',
+            help='search words (misspellings are tolerated, except with --text)')
+    return parser
+
+
+def command(conf, args):
+    ui = get_ui()
+    rp = repo.Repository(conf)
+    if args.fulltext:
+        citekeys = rp.search_text(' '.join(args.query), limit=args.limit)
+    else:
+        citekeys = rp.search(' '.join(args.query), limit=args.limit)
+    if args.citekeys:
+        ui.message_lines(citekeys, page=True)
+    else:
+        ui.message_lines((rp.paper_oneliner(c) for c in citekeys), page=True)
+    rp.close()
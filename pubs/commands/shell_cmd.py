@@ -0,0 +1,46 @@
+from .. import p3
+from .. import repo
+from ..uis import get_ui
+from .batch_cmd import run_line
+
+
+PROMPT = 'pubs> '
+
+
+def parser(subparsers, conf):
+    parser = subparsers.add_parser(
+        'shell',
+        help='run pubs commands interactively, in a single process')
+    return parser
+
+
+def command(conf, args):
+
+    ui = get_ui()
+    try:
+        import readline  # history and line editing, if available
+    except ImportError:
+        pass
+    ui.message(u'Type pubs commands without the leading "pubs"; '
+               u'"help" for help, "exit" or Ctrl-D to quit.')
+    with repo.shared_repository(conf) as rp:
+        while True:
+            try:
+                line = p3.input(PROMPT)
+            except EOFError:
+                ui.message(u'')
+                break
+            except KeyboardInterrupt:
+                ui.message(u'')
+                continue
+            if line.strip() in ('exit', 'quit'):
+                break
+            if line.strip() == 'help':
+                line = '--help'
+            try:
+                run_line(conf, line)
+            except ValueError as e:  # shlex
+                ui.error(e)
+            except KeyboardInterrupt:
+                ui.message(u'')
+            rp.flush()  # do not keep other processes waiting
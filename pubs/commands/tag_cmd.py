@@ -15,16 +15,18 @@ The different use cases are :
     If 'math' is not a citekey, then display all papers with the tag 'math'
 7. > pubs tag -war+math+romance
     display all papers with the tag 'math', 'romance' but not 'war'
+8. > pubs tag --query "author:smith year:2020" math-war
+    Add 'math' to, and remove 'war' from, all the papers matching the query
 """
 
 import re
 
 from ..repo import Repository
 from ..uis import get_ui
-from .. import pretty
 from .. import color
 from ..utils import resolve_citekey
 from ..completion import CiteKeyOrTagCompletion, TagModifierCompletion
+from .list_cmd import filter_paper, add_query_option
 
 
 def parser(subparsers, conf):
@@ -35,6 +37,9 @@ def parser(subparsers, conf):
                         help='If the previous argument was a citekey, then '
                              'a list of tags separated by + and -.'
                         ).completer = TagModifierCompletion(conf)
+    add_query_option(parser, conf,
+                     'change the tags of all the papers matching the query; '
+                     'the first argument is then the tags to add and remove')
     # TODO find a way to display clear help for multiple command semantics,
     #      indistinguisable for argparse. (fabien, 201306)
     return parser
@@ -82,7 +87,12 @@ def command(conf, args):
 
     rp = Repository(conf)
 
-    if citekeyOrTag is None:
+    if args.query is not None:
+        if citekeyOrTag is None or tags is not None:
+            ui.error('--query requires a single list of tags separated by + and -.')
+            ui.exit()
+        tag_query(rp, args.query, citekeyOrTag)
+    elif citekeyOrTag is None:
         ui.message(color.dye_out(' '.join(sorted(rp.get_tags())), 'tag'))
     else:
         not_citekey = False
@@ -100,7 +110,7 @@ def command(conf, args):
                     p.add_tag(tag)
                 for tag in remove_tags:
                     p.remove_tag(tag)
-                rp.push_paper(p, overwrite=True)
+                rp.push_metadata(p)
         elif tags is not None:
             ui.error(ui.error('No entry found for citekey {}.'.format(citekeyOrTag)))
             ui.exit()
@@ -108,13 +118,28 @@ def command(conf, args):
             ui.info('Assuming {} to be a tag.'.format(color.dye_out(citekeyOrTag)))
             # case where we want to find papers with specific tags
             included, excluded = _tag_groups(_parse_tag_seq(citekeyOrTag))
-            papers_list = []
-            for p in rp.all_papers():
-                if (p.tags.issuperset(included) and
-                    len(p.tags.intersection(excluded)) == 0):
-                    papers_list.append(p)
+            papers = (p for p in rp.all_papers()
+                      if p.tags.issuperset(included)
+                      and len(p.tags.intersection(excluded)) == 0)
+            ui.message_lines((rp.paper_oneliner(p.citekey) for p in papers),
+                             page=True)
+
+    rp.close()
 
-            ui.message('\n'.join(pretty.paper_oneliner(p)
-                                 for p in papers_list))
 
-        rp.close()
+def tag_query(rp, query, tags):
+    """Add and remove tags to the papers matching the query. Only their
+    metadata files are written, in a single transaction."""
+    ui = get_ui()
+    add_tags, remove_tags = _tag_groups(_parse_tag_seq(tags))
+    papers = [p for p in rp.all_papers() if filter_paper(p, query)]
+    changed = 0
+    with rp.transaction():
+        for p in papers:
+            new_tags = (p.tags | add_tags) - remove_tags
+            if new_tags != p.tags:
+                p.tags = new_tags
+                rp.push_metadata(p)
+                changed += 1
+    ui.info('Tags changed for {} of the {} matching paper(s).'.format(
+        changed, len(papers)))
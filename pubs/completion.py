@@ -1,4 +1,8 @@
+import os
 import re
+
+from .p3 import pickle
+
 try:
     import argcomplete
 except ImportError:
@@ -14,18 +18,60 @@ except ImportError:
 
     argcomplete = FakeModule()
 
-from . import repo
+
+# name of the cache file of the completion snapshot
+SNAPSHOT_CACHE = 'completion'
 
 
 def autocomplete(parser):
     argcomplete.autocomplete(parser)
 
 
+def load_snapshot(pubsdir):
+    """Read the completion snapshot of a repository, written by
+    Repository.completion_snapshot, with the standard library only.
+
+    :returns:  the snapshot, or None if it is missing, or if the repository
+               changed since it was written (see FileBroker.fingerprint).
+    """
+    pubsdir = os.path.expanduser(pubsdir)
+    cachedir = os.path.join(pubsdir, '.cache')
+    try:
+        with open(os.path.join(cachedir, SNAPSHOT_CACHE), 'rb') as f:
+            snapshot = pickle.load(f)
+        try:
+            with open(os.path.join(cachedir, 'generation'), 'rb') as f:
+                generation = f.read()
+        except IOError:
+            generation = None
+        fingerprint = (generation,
+                       os.path.getmtime(os.path.join(pubsdir, 'bib')),
+                       os.path.getmtime(os.path.join(pubsdir, 'meta')))
+    except Exception:  # no or bad snapshot
+        return None
+    if snapshot.get('fingerprint') != fingerprint:
+        return None
+    return snapshot
+
+
 class BaseCompleter(object):
 
     def __init__(self, conf):
         self.conf = conf
 
+    def _snapshot(self):
+        """Return the completion snapshot of the repository, that spares
+        reading the papers on each completion. It is refreshed whenever a
+        command changes the repository, and only rebuilt here if it is
+        missing or outdated, e.g. after the files were edited by hand."""
+        snapshot = load_snapshot(self.conf['main']['pubsdir'])
+        if snapshot is None:
+            from . import repo  # slow to import
+            rp = repo.Repository(self.conf)
+            snapshot = rp.completion_snapshot()
+            rp.close()
+        return snapshot
+
     def __call__(self, **kwargs):
         try:
             return self._complete(**kwargs)
@@ -36,15 +82,14 @@ class BaseCompleter(object):
 class CiteKeyCompletion(BaseCompleter):
 
     def _complete(self, **kwargs):
-        rp = repo.Repository(self.conf)
-        return rp.citekeys
+        return self._snapshot()['citekeys']
 
 
 class CiteKeyOrTagCompletion(BaseCompleter):
 
     def _complete(self, **kwargs):
-        rp = repo.Repository(self.conf)
-        return rp.citekeys.union(rp.get_tags())
+        snapshot = self._snapshot()
+        return snapshot['citekeys'] + snapshot['tags']
 
 
 class TagModifierCompletion(BaseCompleter):
@@ -52,8 +97,32 @@ class TagModifierCompletion(BaseCompleter):
     regxp = r"[^:+-]*$"  # prefix of tag after last separator
 
     def _complete(self, prefix, **kwargs):
-        tags = repo.Repository(self.conf).get_tags()
+        tags = self._snapshot()['tags']
         start, _ = re.search(self.regxp, prefix).span()
         partial_expr = prefix[:start]
         t_prefix = prefix[start:]
         return [partial_expr + t for t in tags if t.startswith(t_prefix)]
+
+
+class QueryCompletion(BaseCompleter):
+    """Completes query fields, then their most common values."""
+
+    def _complete(self, prefix, **kwargs):
+        from .commands.list_cmd import FIELD_ALIASES
+        snapshot = self._snapshot()
+        if ':' not in prefix:
+            return [f + ':' for f in snapshot['fields'] if f.startswith(prefix)]
+        field, v_prefix = prefix.split(':', 1)
+        values = snapshot['values'].get(FIELD_ALIASES.get(field, field), [])
+        v_prefix = v_prefix.lower()
+        return [u'{}:{}'.format(field, v) for v in values
+                if v.lower().startswith(v_prefix)]
+
+
+class QueryOptionCompletion(QueryCompletion):
+    """Completes the last block of a query given as a single argument."""
+
+    def _complete(self, prefix, **kwargs):
+        head, sep, last = prefix.rpartition(' ')
+        return [head + sep + c
+                for c in super(QueryOptionCompletion, self)._complete(last, **kwargs)]
@@ -1,14 +1,17 @@
 import os
-import platform
-
-import configobj
-import validate
+import hashlib
 
 from .spec import configspec
+from ..p3 import pickle
+from .. import __version__
 
 
 DFT_CONFIG_PATH = os.path.expanduser('~/.pubsrc')
 
+# configobj and validate are only imported when the configuration is not
+# found in the cache: they are slow to import, and validation is slow.
+SPEC_DIGEST = hashlib.sha1('\n'.join(configspec).encode('utf-8')).hexdigest()
+
 
 class ConfigurationNotFound(IOError):
 
@@ -21,14 +24,38 @@ class ConfigurationNotFound(IOError):
 
 def post_process_conf(conf):
     """Do some post processing on the configuration"""
+    conf = _as_configobj(conf)
     check_conf(conf)
     if conf['main']['docsdir'] == 'docsdir://':
         conf['main']['docsdir'] = os.path.join(conf['main']['pubsdir'], 'doc')
     return conf
 
 
+class CachedConf(dict):
+    """A validated configuration, loaded from the cache.
+
+    Sections are plain dictionaries; the configobj machinery (comments,
+    validation) is only available on configurations read from file.
+    """
+
+    def __init__(self, data, filename):
+        super(CachedConf, self).__init__(data)
+        self.filename = filename
+
+
+def _as_configobj(conf):
+    """Return a CachedConf as a ConfigObj, other configurations unchanged."""
+    if hasattr(conf, 'validate'):
+        return conf
+    import configobj
+    conf_obj = configobj.ConfigObj(dict(conf), configspec=configspec)
+    conf_obj.filename = conf.filename
+    return conf_obj
+
+
 def load_default_conf():
     """Load the default configuration"""
+    import configobj
     default_conf = configobj.ConfigObj(configspec=configspec)
     default_conf = post_process_conf(default_conf)
     return default_conf
@@ -52,6 +79,7 @@ def get_confpath(verify=True):
 
 def check_conf(conf):
     """Type check a configuration"""
+    import validate
     validator = validate.Validator()
     results = conf.validate(validator, copy=True)
     assert (results is True), '{}'.format(results)  # TODO: precise error dialog when parsing error
@@ -63,14 +91,50 @@ def load_conf(path=None):
         path = get_confpath(verify=True)
     if not os.path.exists(path):
         raise ConfigurationNotFound(path)
-    conf = configobj.ConfigObj(path, configspec=configspec)
-    conf.filename = path
-    conf = post_process_conf(conf)
+    key = _cache_key(path)
+    conf = _pull_cached_conf(path, key)
+    if conf is None:
+        import configobj
+        conf = configobj.ConfigObj(path, configspec=configspec)
+        conf.filename = path
+        conf = post_process_conf(conf)
+        _push_cached_conf(path, key, conf)
     return conf
 
 
+def _cache_path(path):
+    """Cache of the configuration at path: `~/.pubsrc` is cached in
+    `~/.pubsrc.cache`."""
+    return path + '.cache'
+
+
+def _cache_key(path):
+    stats = os.stat(path)
+    return (stats.st_mtime, stats.st_size, __version__, SPEC_DIGEST)
+
+
+def _pull_cached_conf(path, key):
+    try:
+        with open(_cache_path(path), 'rb') as f:
+            cached = pickle.load(f)
+        if cached['key'] == key:
+            return CachedConf(cached['conf'], path)
+    except Exception:  # take no prisonners; if something is wrong, no cache.
+        pass
+    return None
+
+
+def _push_cached_conf(path, key, conf):
+    try:
+        with open(_cache_path(path), 'wb') as f:
+            pickle.dump({'key': key, 'conf': conf.dict()}, f, protocol=2)
+    except (IOError, OSError):  # e.g. read-only directory: run uncached.
+        pass
+
+
 def save_conf(conf, path=None):
     """Save the configuration."""
+    conf = _as_configobj(conf)
     if path is not None:
         conf.filename = path
     elif conf.filename is None:
@@ -81,6 +145,7 @@ def save_conf(conf, path=None):
 
 def default_open_cmd():
     """Chooses the default command to open documents"""
+    import platform  # slow to import, and only needed here
     if platform.system() == 'Darwin':
         return 'open'
     elif platform.system() == 'Linux':
@@ -24,6 +24,10 @@ open_cmd = string(default=None)
 # variable $EDITOR.
 edit_cmd = string(default='')
 
+# the pager for long outputs (list, export, ...) on a terminal, e.g.
+# "less -FRX". If set to an empty string (default), output is not paged.
+pager_cmd = string(default='')
+
 # Which default extension to use when creating a note file.
 note_extension = string(default='txt')
 
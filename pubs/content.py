@@ -1,5 +1,6 @@
 import sys
 import os
+import errno
 import shutil
 
 from .p3 import urlparse, HTTPConnection, urlopen
@@ -93,6 +94,36 @@ def remove_file(filepath):
     os.remove(filepath)
 
 
+# removing fewer files is not worth starting threads
+REMOVE_THREADS = 8
+REMOVE_IN_THREADS_MIN = 32
+
+
+def remove_files(filepaths):
+    """Remove files, ignoring those that do not exist. Many files are
+    removed from a pool of threads: removals are slow on network
+    filesystems, but do not hold the interpreter lock."""
+    if len(filepaths) < REMOVE_IN_THREADS_MIN:
+        for filepath in filepaths:
+            _remove_existing_file(filepath)
+        return
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(REMOVE_THREADS)
+    try:
+        pool.map(_remove_existing_file, filepaths)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _remove_existing_file(filepath):
+    try:
+        os.remove(system_path(filepath))
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
 def write_file(filepath, data, mode='w'):
     """Write data to file.
 
@@ -108,6 +139,35 @@ def write_file(filepath, data, mode='w'):
         f.write(data)
 
 
+def sync_file(filepath):
+    """Flush the content of a file to disk."""
+    fd = os.open(system_path(filepath), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_directory(dirpath):
+    """Flush the entries of a directory (e.g. after a rename) to disk.
+    Silently does nothing where directories cannot be opened."""
+    try:
+        fd = os.open(system_path(dirpath), os.O_RDONLY)
+    except (IOError, OSError):
+        return
+    try:
+        os.fsync(fd)
+    except (IOError, OSError):
+        pass
+    finally:
+        os.close(fd)
+
+
+def replace_file(source, target):
+    """Rename source to target, atomically replacing target if it exists."""
+    getattr(os, 'replace', os.rename)(system_path(source), system_path(target))
+
+
 # dealing with formatless content
 
 def content_type(path):
@@ -158,13 +218,20 @@ def get_content(path, ui=None):
 
 
 def move_content(source, target, overwrite=False):
+    """Move a file: a rename, whatever its size, unless the target is on
+    another filesystem."""
     source = system_path(source)
     target = system_path(target)
     if source == target:
         return
     if not overwrite and os.path.exists(target):
         raise IOError(u'target file exists')
-    shutil.move(source, target)
+    try:
+        replace_file(source, target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(source, target)
 
 
 def copy_content(source, target, overwrite=False):
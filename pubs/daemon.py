@@ -0,0 +1,354 @@
+"""Long-running pubs process, serving commands over a Unix socket.
+
+The daemon keeps the modules, the configuration and the repository caches
+loaded, and forks a child for each command. The client passes its standard
+streams to the child, that runs the command as a local invocation would:
+prompts, editors and colors work unchanged.
+
+Messages are json objects, one per line. The client sends the request,
+along with its stdin, stdout and stderr file descriptors; the child replies
+with its pid, then with the exit status of the command.
+"""
+import os
+import sys
+import json
+
+
+SOCKET_SUFFIX = '.sock'
+MAX_FDS = 3
+
+# commands never forwarded to the daemon
+LOCAL_CMDS = ('init', 'daemon')
+
+
+def socket_path(conf_path):
+    """Return the path of the socket of the daemon serving a configuration."""
+    return os.path.abspath(os.path.expanduser(conf_path)) + SOCKET_SUFFIX
+
+
+def supported():
+    """Python 2 cannot pass file descriptors over sockets."""
+    import socket
+    return hasattr(socket, 'AF_UNIX') and hasattr(socket.socket, 'sendmsg')
+
+
+def _send(sock, msg, fds=()):
+    import socket
+    import array
+    data = json.dumps(msg).encode('utf-8') + b'\n'
+    if fds:
+        sent = sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                                      array.array('i', fds))])
+        data = data[sent:]
+    if data:  # the peer may have replied, and closed, already
+        sock.sendall(data)
+
+
+class _Reader(object):
+    """Reads messages, and the file descriptors sent along, from a socket."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b''
+        self.fds = []
+
+    def recv(self):
+        """Return the next message, or None if the connection is closed."""
+        import socket
+        import array
+        while b'\n' not in self.buffer:
+            fds = array.array('i')
+            data, ancdata, _, _ = self.sock.recvmsg(
+                4096, socket.CMSG_SPACE(MAX_FDS * fds.itemsize))
+            for level, kind, cdata in ancdata:
+                if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                    cdata = cdata[:len(cdata) - (len(cdata) % fds.itemsize)]
+                    fds.frombytes(cdata)
+            self.fds.extend(fds)
+            if not data:
+                return None
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return json.loads(line.decode('utf-8'))
+
+
+def _exit_status(code):
+    """Convert a SystemExit code to an exit status, as the interpreter does."""
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    sys.stderr.write('{}\n'.format(code))
+    return 1
+
+
+# client
+
+def _parse_args(args):
+    """Return the configuration path and the command name of pubs arguments.
+
+    Mirrors the parsing of the global options by pubs_cmd.execute, so that
+    the client does not have to import it.
+    """
+    conf_path = None
+    args = list(args)
+    while args and args[0].startswith('-'):
+        arg = args.pop(0)
+        if arg in ('-c', '--config') and args:
+            conf_path = args.pop(0)
+        elif arg.startswith('--config='):
+            conf_path = arg[len('--config='):]
+        elif arg.startswith('-c') and not arg.startswith('--'):
+            conf_path = arg[2:]
+    if conf_path is None:  # as config.get_confpath
+        conf_path = os.environ.get('PUBSCONF', '~/.pubsrc')
+    return conf_path, (args[0] if args else None)
+
+
+def forward(argv, path=None):
+    """Run a command in the daemon, if one is running for its configuration.
+
+    :param path: the socket of the process to run the command; by default,
+                 the one of the daemon serving its configuration.
+    :returns: the exit status of the command, or None if no daemon could
+              take the command, which should then be run locally.
+    """
+    if path is None:
+        conf_path, command = _parse_args(argv[1:])
+        if command in LOCAL_CMDS or '_ARGCOMPLETE' in os.environ:
+            return None
+        path = socket_path(conf_path)
+    if not os.path.exists(path) or not supported():
+        return None
+    import socket
+    import signal
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        _send(sock, {'request': 'run', 'argv': argv, 'cwd': os.getcwd(),
+                     'env': dict(os.environ)}, fds=[0, 1, 2])
+        reader = _Reader(sock)
+        reply = reader.recv()
+    except (socket.error, OSError, ValueError):  # stale socket, closed fd...
+        sock.close()
+        return None
+    if reply is None or 'pid' not in reply:
+        sock.close()
+        return None
+
+    # interruptions from the terminal are passed on to the command.
+    def interrupt(signum, frame):
+        try:
+            os.kill(reply['pid'], signum)
+        except OSError:
+            pass
+    handlers = {signum: signal.signal(signum, interrupt)
+                for signum in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        reply = reader.recv()
+    except (socket.error, ValueError):
+        reply = None
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+        sock.close()
+    if reply is None or 'status' not in reply:
+        sys.stderr.write('error: connection to the pubs daemon lost.\n')
+        return 1
+    return reply['status']
+
+
+def forward_main(path):
+    """Entry point of the `pubs` shell function of shell aliases, that runs
+    the command in the pubs process running the alias, listening on path
+    (see pubs.plugs.alias)."""
+    status = forward(['pubs'] + sys.argv[1:], path=path)
+    if status is None:
+        sys.stderr.write('error: the pubs process running the alias is gone.\n')
+        status = 1
+    sys.exit(status)
+
+
+def request(conf_path, name):
+    """Send a control request ('status' or 'stop') to the daemon.
+
+    :returns: the reply, or None if no daemon is running.
+    """
+    import socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path(conf_path))
+        _send(sock, {'request': name})
+        return _Reader(sock).recv()
+    except socket.error:
+        return None
+    finally:
+        sock.close()
+
+
+# server
+
+def preload_commands():
+    """Import the modules commands need, once for all the children forked
+    to run them."""
+    import importlib
+    from . import pubs_cmd
+    from . import endecoder
+    for name in pubs_cmd.CORE_CMDS.values():
+        importlib.import_module('pubs.commands.' + name)
+    import dateutil.parser
+
+
+class Daemon(object):
+
+    def __init__(self, conf_path):
+        self.conf_path = os.path.abspath(os.path.expanduser(conf_path))
+        self.path = socket_path(conf_path)
+        self._state = None
+
+    def preload(self):
+        """Import the modules commands need."""
+        from . import pubs_cmd
+        preload_commands()
+        self.pubs_cmd = pubs_cmd
+
+    def refresh(self):
+        """Load the repository caches, if the repository changed since
+        they were last loaded."""
+        from . import config
+        from .repo import Repository
+        conf = config.load_conf(path=self.conf_path)
+        rp = Repository(conf)
+        state = (conf['main']['pubsdir'],
+                 rp.databroker.databroker.fingerprint())
+        if state != self._state:
+            for paper in rp.all_papers():  # updates outdated cache entries
+                pass
+            rp.completion_snapshot()
+            self._state = state
+        rp.close()
+
+    def serve(self):
+        import socket
+        import signal
+        from . import databroker
+        databroker.keep_caches_in_memory()
+        self.preload()
+        self.refresh()
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if os.path.exists(self.path):
+            os.remove(self.path)  # checked to be stale by the caller
+        umask = os.umask(0o077)  # only the user can connect
+        try:
+            server.bind(self.path)
+        finally:
+            os.umask(umask)
+        server.listen(16)
+
+        def terminate(signum, frame):
+            raise SystemExit(0)
+        signal.signal(signal.SIGTERM, terminate)
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # children are reaped
+        try:
+            while True:
+                conn, _ = server.accept()
+                try:
+                    if not self.handle(server, conn):
+                        break
+                except Exception:  # a bad request should not kill the daemon
+                    pass
+                finally:
+                    conn.close()
+        finally:
+            server.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def handle(self, server, conn):
+        """Handle a connection. Returns False if the daemon should stop."""
+        reader = _Reader(conn)
+        try:
+            msg = reader.recv()
+            if msg is None:
+                return True
+            if msg['request'] == 'stop':
+                _send(conn, {'pid': os.getpid()})
+                return False
+            elif msg['request'] == 'status':
+                _send(conn, {'pid': os.getpid(),
+                             'pubsdir': self._state and self._state[0]})
+            elif msg['request'] == 'run' and len(reader.fds) == 3:
+                try:
+                    self.refresh()
+                except Exception:  # the command will report the error
+                    self._state = None
+                sys.stdout.flush()
+                sys.stderr.flush()
+                if os.fork() == 0:
+                    server.close()
+                    self.run(conn, msg, reader.fds)  # never returns
+            return True
+        finally:
+            for fd in reader.fds:
+                os.close(fd)
+
+    def run(self, conn, msg, fds):
+        """Run a command in a forked child, then exit."""
+        import signal
+        import traceback
+        status = 1
+        try:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            for i, fd in enumerate(fds):
+                os.dup2(fd, i)
+            os.chdir(msg['cwd'])
+            os.environ.clear()
+            os.environ.update(msg['env'])
+            _send(conn, {'pid': os.getpid()})
+            try:
+                self.pubs_cmd.execute(msg['argv'])
+                status = 0
+            except SystemExit as e:
+                status = _exit_status(e.code)
+            except BaseException:
+                traceback.print_exc()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            _send(conn, {'status': status})
+        finally:
+            os._exit(status)
+
+
+def start(conf_path, foreground=False):
+    """Start a daemon for a configuration. Unless in the foreground, the
+    daemon is detached, and this returns once it accepts connections.
+
+    :returns: the pid of the daemon.
+    """
+    daemon = Daemon(conf_path)
+    if foreground:
+        daemon.serve()
+        return os.getpid()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.setsid()
+            if os.fork() != 0:
+                os._exit(0)
+            os.chdir('/')
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            daemon.serve()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    import time
+    for _ in range(100):
+        reply = request(conf_path, 'status')
+        if reply is not None:
+            return reply['pid']
+        time.sleep(0.05)
+    return None
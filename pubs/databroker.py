@@ -1,6 +1,20 @@
 from . import filebroker
-from . import endecoder
 from .p3 import pickle
+from .content import move_content
+
+
+# Unpickled cache data, kept in memory by long-running processes only
+# (see daemon.py): (cachedir, name) -> ((mtime, size), data).
+_memory = None
+
+
+def keep_caches_in_memory():
+    """Keep the caches loaded by any DataBroker in memory, as long as their
+    file is not modified. Data is shared between brokers: only use it in a
+    process that forks a child for each command."""
+    global _memory
+    if _memory is None:
+        _memory = {}
 
 
 class DataBroker(object):
@@ -12,23 +26,53 @@ class DataBroker(object):
 
     def __init__(self, pubsdir, docsdir, create=False):
         self.filebroker = filebroker.FileBroker(pubsdir, create=create)
-        self.endecoder  = endecoder.EnDecoder()
+        self._endecoder = None
         self.docbroker  = filebroker.DocBroker(docsdir, scheme='docsdir', subdir='')
         self.notebroker = filebroker.DocBroker(pubsdir, scheme='notesdir', subdir='notes')
 
+    @property
+    def endecoder(self):
+        # imported on first use: bibtexparser and yaml are slow to load.
+        if self._endecoder is None:
+            from . import endecoder
+            self._endecoder = endecoder.EnDecoder()
+        return self._endecoder
+
     # cache
 
     def close(self):
-        pass
+        return self.filebroker.close()
+
+    def fingerprint(self):
+        return self.filebroker.fingerprint()
+
+    def transaction(self):
+        return self.filebroker.transaction()
+
+    def lock(self, exclusive=False):
+        return self.filebroker.lock(exclusive=exclusive)
 
     def pull_cache(self, name):
         """Load cache data from distk. Exceptions are handled by the caller."""
-        data_raw = self.filebroker.pull_cachefile(name)
-        return pickle.loads(data_raw)
+        if _memory is not None:
+            key = (self.filebroker.cachedir, name)
+            stamp = self.filebroker.stat_cachefile(name)
+            if key in _memory and _memory[key][0] == stamp:
+                return _memory[key][1]
+        with self.filebroker.lock():
+            data_raw = self.filebroker.pull_cachefile(name)
+        data = pickle.loads(data_raw)
+        if _memory is not None:
+            _memory[key] = (stamp, data)
+        return data
 
     def push_cache(self, name, data):
         data_raw = pickle.dumps(data)
-        self.filebroker.push_cachefile(name, data_raw)
+        with self.filebroker.lock(exclusive=True):
+            self.filebroker.push_cachefile(name, data_raw)
+            if _memory is not None:
+                _memory[(self.filebroker.cachedir, name)] = (
+                    self.filebroker.stat_cachefile(name), data)
 
     # filebroker+endecoder
 
@@ -42,11 +86,11 @@ class DataBroker(object):
 
     def push_metadata(self, citekey, metadata):
         metadata_raw = self.endecoder.encode_metadata(metadata)
-        self.filebroker.push_metafile(citekey, metadata_raw)
+        return self.filebroker.push_metafile(citekey, metadata_raw)
 
     def push_bibentry(self, citekey, bibdata):
         bibdata_raw = self.endecoder.encode_bibdata(bibdata)
-        self.filebroker.push_bibfile(citekey, bibdata_raw)
+        return self.filebroker.push_bibfile(citekey, bibdata_raw)
 
     def push(self, citekey, metadata, bibdata):
         self.filebroker.push(citekey, metadata, bibdata)
@@ -54,6 +98,9 @@ class DataBroker(object):
     def remove(self, citekey):
         self.filebroker.remove(citekey)
 
+    def rename(self, old_citekey, new_citekey):
+        self.filebroker.rename(old_citekey, new_citekey)
+
     def exists(self, citekey, meta_check=False):
         """ Checks wether the bibtex of a citekey exists.
 
@@ -66,7 +113,8 @@ class DataBroker(object):
         return set(listings['bibfiles'])
 
     def listing(self, filestats=True):
-        return self.filebroker.listing(filestats=filestats)
+        with self.filebroker.lock():  # not amid the commit of a transaction
+            return self.filebroker.listing(filestats=filestats)
 
     def verify(self, bibdata_raw):
         """Will return None if bibdata_raw can't be decoded"""
@@ -87,13 +135,25 @@ class DataBroker(object):
         return self.docbroker.real_docpath(docpath)
 
     def add_doc(self, citekey, source_path, overwrite=False):
-        return self.docbroker.add_doc(citekey, source_path, overwrite=overwrite)
+        """Copy a document to the docsdir, and return its location. In a
+        transaction, it is only copied once the transaction is committed."""
+        if not self.filebroker.in_transaction:
+            return self.docbroker.add_doc(citekey, source_path, overwrite=overwrite)
+        target_path = self.docbroker.check_add_doc(citekey, source_path,
+                                                   overwrite=overwrite)
+        self.filebroker.on_commit(lambda: self.docbroker.add_doc(
+            citekey, source_path, overwrite=overwrite))
+        return target_path
 
     def remove_doc(self, docpath, silent=True):
         return self.docbroker.remove_doc(docpath, silent=silent)
 
     def rename_doc(self, docpath, new_citekey):
-        return self.docbroker.rename_doc(docpath, new_citekey)
+        """Move a document inside the docsdir. In a transaction, it is moved
+        back if the transaction is discarded."""
+        new_docpath = self.docbroker.rename_doc(docpath, new_citekey)
+        self._move_back_on_discard(self.docbroker, docpath, new_docpath)
+        return new_docpath
 
     # notesbroker
 
@@ -108,5 +168,15 @@ class DataBroker(object):
                                           silent=silent)
 
     def rename_note(self, old_citekey, new_citekey, extension):
-        return self.notebroker.rename_doc(
-            self._notepath(old_citekey, extension), new_citekey)
+        """Move a note. In a transaction, it is moved back if the transaction
+        is discarded."""
+        notepath = self._notepath(old_citekey, extension)
+        new_notepath = self.notebroker.rename_doc(notepath, new_citekey)
+        self._move_back_on_discard(self.notebroker, notepath, new_notepath)
+        return new_notepath
+
+    def _move_back_on_discard(self, broker, docpath, new_docpath):
+        if self.filebroker.in_transaction:
+            source = broker.real_docpath(new_docpath)
+            target = broker.real_docpath(docpath)
+            self.filebroker.on_discard(lambda: move_content(source, target))
@@ -1,5 +1,7 @@
 import os
 import time
+import contextlib
+import collections
 
 from . import databroker
 
@@ -27,6 +29,8 @@ class CacheEntrySet(object):
         else:
             raise ValueError
         self._entries = None
+        self._changed = set()  # citekeys updated, and removed, since pulled
+        self._removed = set()
         self.modified = False
         # does the filesystem supports subsecond stat time?
         self.nsec_support = os.stat('.').st_mtime != int(os.stat('.').st_mtime)
@@ -38,8 +42,22 @@ class CacheEntrySet(object):
         return self._entries
 
     def flush(self, force=False):
+        """Write the cache to disk, merged with the one found there, that
+        other processes may have updated since it was read: their entries
+        are kept, unless this cache has more recent ones."""
         if force or self.modified:
-            self.databroker.push_cache(self.name, self.entries)
+            with self.databroker.lock(exclusive=True):
+                entries = self._try_pull_cache()
+                for citekey in self._removed:
+                    entries.pop(citekey, None)
+                for citekey in self._changed:
+                    theirs = entries.get(citekey)
+                    if (theirs is None or theirs.timestamp
+                            <= self.entries[citekey].timestamp):
+                        entries[citekey] = self.entries[citekey]
+                self.databroker.push_cache(self.name, entries)
+            self._entries = entries
+            self._changed, self._removed = set(), set()
             self.modified = False
 
     def pull(self, citekey):
@@ -47,26 +65,43 @@ class CacheEntrySet(object):
             # if we get here, we must update the cache.
             t = time.time()
             data = self._pull_fun(citekey)
-            self.entries[citekey] = CacheEntry(data, t)
-            self.modified = True
+            self._set(citekey, CacheEntry(data, t))
         return self.entries[citekey].data
 
     def push(self, citekey, data):
-        self._push_fun(citekey, data)
-        self.push_to_cache(citekey, data)
+        """Push to file and cache. Returns False if the file was unchanged,
+        in which case its cache entry is kept as is."""
+        written = self._push_fun(citekey, data)
+        if written or citekey not in self.entries:
+            self.push_to_cache(citekey, data)
+        return written
 
     def push_to_cache(self, citekey, data):
         """Push to cash only."""
         mtime = self._mtime_fun(citekey)
-        self.entries[citekey] = CacheEntry(data, mtime)
-        self.modified = True
+        self._set(citekey, CacheEntry(data, mtime))
 
     def remove_from_cache(self, citekey):
         """Removes from cache only."""
         if citekey in self.entries:
             self.entries.pop(citekey)
+            self._changed.discard(citekey)
+            self._removed.add(citekey)
             self.modified = True
 
+    def rename_in_cache(self, old_citekey, new_citekey):
+        """Move an entry to a new citekey, for a file moved on disk."""
+        if old_citekey in self.entries:
+            entry = self.entries[old_citekey]
+            self.remove_from_cache(old_citekey)
+            self._set(new_citekey, entry)
+
+    def _set(self, citekey, entry):
+        self.entries[citekey] = entry
+        self._changed.add(citekey)
+        self._removed.discard(citekey)
+        self.modified = True
+
     def _try_pull_cache(self):
         try:
             return self.databroker.pull_cache(self.name)
@@ -82,6 +117,181 @@ class CacheEntrySet(object):
             return True
 
 
+class QueryCache(object):
+    """Results of the most recently used queries, as ordered lists of
+    citekeys.
+
+    Results are only valid for the repository fingerprint they were
+    computed with: when it changes, the whole cache is dropped. The least
+    recently used results are evicted beyond `max_entries` results, or
+    `max_citekeys` citekeys in total. When flushed, results are merged with
+    the ones cached meanwhile by other processes, for the same fingerprint.
+    Cache hits only reorder the results in memory: the cache is written
+    when results are added, and then records the order of use as well.
+    """
+
+    name = 'querycache'
+    max_entries = 64
+    max_citekeys = 100000
+
+    def __init__(self, databroker):
+        self.databroker = databroker
+        self._data = None
+        self._used = collections.OrderedDict()  # keys pulled or pushed, by use
+        self.modified = False
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._try_pull_cache()
+        return self._data
+
+    def _try_pull_cache(self):
+        try:
+            return self.databroker.pull_cache(self.name)
+        except Exception:  # take no prisonners; if something is wrong, no cache.
+            return {'fingerprint': None, 'entries': collections.OrderedDict()}
+
+    def flush(self, force=False):
+        if force or self.modified:
+            with self.databroker.lock(exclusive=True):
+                theirs = self._try_pull_cache()
+                if (theirs is not self.data  # unchanged, kept in memory
+                        and theirs['fingerprint'] == self.data['fingerprint']):
+                    entries = theirs['entries']
+                    for key in self._used:
+                        if key in self.data['entries']:
+                            entries.pop(key, None)
+                            entries[key] = self.data['entries'][key]
+                    self._evict(entries)
+                    self.data['entries'] = entries
+                self.databroker.push_cache(self.name, self.data)
+            self._used = collections.OrderedDict()
+            self.modified = False
+
+    def invalidate(self):
+        self._data = {'fingerprint': None, 'entries': collections.OrderedDict()}
+        self._used = collections.OrderedDict()
+        self.modified = True
+
+    def pull(self, key):
+        """Return the cached result of a query, or None."""
+        fingerprint = self.databroker.fingerprint()
+        if self.data['fingerprint'] != fingerprint:
+            self.invalidate()
+            self.data['fingerprint'] = fingerprint
+            return None
+        entries = self.data['entries']
+        citekeys = entries.pop(key, None)
+        if citekeys is not None:
+            entries[key] = citekeys  # most recently used last
+            self._use(key)
+        return citekeys
+
+    def push(self, key, citekeys):
+        """Cache the result of a query. Must follow a call to `pull` for the
+        same query, since results are stamped with the fingerprint seen then.
+        """
+        if len(citekeys) > self.max_citekeys:
+            return
+        entries = self.data['entries']
+        entries.pop(key, None)
+        entries[key] = list(citekeys)
+        self._use(key)
+        self._evict(entries)
+        self.modified = True
+
+    def _use(self, key):
+        self._used.pop(key, None)
+        self._used[key] = True
+
+    def _evict(self, entries):
+        total = sum(len(c) for c in entries.values())
+        while (len(entries) > self.max_entries
+               or total > self.max_citekeys):
+            _, evicted = entries.popitem(last=False)
+            total -= len(evicted)
+
+
+class OnelinerCache(object):
+    """One-line descriptions of papers, as rendered for the most recently
+    used display styles (colors and theme).
+
+    Lines are stamped with the timestamps of the cached bibfile and metafile
+    of their paper, and are only valid as long as those do not change.
+    """
+
+    name = 'onelinercache'
+    max_styles = 2
+
+    def __init__(self, databroker):
+        self.databroker = databroker
+        self._data = None
+        self._changed = set()  # (style, citekey) pushed since pulled
+        self._removed = set()
+        self.modified = False
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._try_pull_cache()
+        return self._data
+
+    def _try_pull_cache(self):
+        try:
+            return self.databroker.pull_cache(self.name)
+        except Exception:  # take no prisonners; if something is wrong, no cache.
+            return collections.OrderedDict()
+
+    def flush(self, force=False):
+        """Write the cache to disk, merged with the lines cached meanwhile
+        by other processes."""
+        if force or self.modified:
+            with self.databroker.lock(exclusive=True):
+                data = self._try_pull_cache()
+                if data is not self.data:  # else unchanged, kept in memory
+                    self._merge_into(data)
+                self.databroker.push_cache(self.name, data)
+            self._data = data
+            self._changed, self._removed = set(), set()
+            self.modified = False
+
+    def _merge_into(self, data):
+        for lines in data.values():
+            for citekey in self._removed:
+                lines.pop(citekey, None)
+        for style in self.data:  # most recently used last
+            data[style] = data.pop(style, {})
+        for style, citekey in self._changed:
+            if citekey in self.data.get(style, {}):
+                data[style][citekey] = self.data[style][citekey]
+        while len(data) > self.max_styles:
+            data.popitem(last=False)
+
+    def pull(self, citekey, stamp, style):
+        """Return the cached line of a paper, or None."""
+        entry = self.data.get(style, {}).get(citekey)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        return None
+
+    def push(self, citekey, stamp, style, line):
+        lines = self.data.pop(style, {})
+        self.data[style] = lines  # most recently used last
+        while len(self.data) > self.max_styles:
+            self.data.popitem(last=False)
+        lines[citekey] = (stamp, line)
+        self._changed.add((style, citekey))
+        self.modified = True
+
+    def remove(self, citekey):
+        for lines in self.data.values():
+            lines.pop(citekey, None)
+        self._changed = set(c for c in self._changed if c[1] != citekey)
+        self._removed.add(citekey)
+        self.modified = True
+
+
 class DataCache(object):
     """ DataCache class, provides a very similar interface as DataBroker
 
@@ -100,11 +310,24 @@ class DataCache(object):
         self._databroker = None
         self._metacache = None
         self._bibcache = None
+        self._querycache = None
+        self._onelinercache = None
         if create:
             self._create()
 
+    @property
+    def modified(self):
+        """True if papers were written since the last close."""
+        return (self._databroker is not None
+                and self._databroker.filebroker.modified)
+
     def close(self):
+        """Flush the caches and release the repository; returns as
+        FileBroker.close."""
+        if self._databroker is None:  # nothing was read nor written
+            return None
         self.flush_cache()
+        return self._databroker.close()
 
     @property
     def databroker(self):
@@ -125,14 +348,51 @@ class DataCache(object):
             self._bibcache = CacheEntrySet(self.databroker, 'bibcache')
         return self._bibcache
 
+    @property
+    def querycache(self):
+        if self._querycache is None:
+            self._querycache = QueryCache(self.databroker)
+        return self._querycache
+
+    @property
+    def onelinercache(self):
+        if self._onelinercache is None:
+            self._onelinercache = OnelinerCache(self.databroker)
+        return self._onelinercache
+
     def _create(self):
         self._databroker = databroker.DataBroker(self.pubsdir, self.docsdir,
                                                  create=True)
 
+    @contextlib.contextmanager
+    def transaction(self):
+        """Write the changes made in the block all together, when it exits
+        without error (see FileBroker.transaction), then flush the caches.
+        On error, the caches, that may hold discarded changes, are reset."""
+        outermost = not self.databroker.filebroker.in_transaction
+        try:
+            with self.databroker.transaction():
+                yield
+        except BaseException:
+            self._metacache = self._bibcache = None
+            self._querycache = self._onelinercache = None
+            raise
+        if outermost:
+            self.flush_cache()
+
     def flush_cache(self, force=False):
-        """Write cache to disk"""
-        self.metacache.flush(force=force)
-        self.bibcache.flush(force=force)
+        """Write cache to disk, merged with the caches written meanwhile by
+        other processes."""
+        caches = [c for c in (self._metacache, self._bibcache,
+                              self._querycache, self._onelinercache)
+                  if c is not None and (force or c.modified)]
+        if caches:
+            with self.databroker.lock(exclusive=True):
+                for cache in caches:
+                    cache.flush(force=force)
+
+    def lock(self, exclusive=False):
+        return self.databroker.lock(exclusive=exclusive)
 
     def pull_metadata(self, citekey):
         return self.metacache.pull(citekey)
@@ -141,20 +401,73 @@ class DataCache(object):
         return self.bibcache.pull(citekey)
 
     def push_metadata(self, citekey, metadata):
-        self.metacache.push(citekey, metadata)
+        """Returns False if the metadata was unchanged, and not written."""
+        written = self.metacache.push(citekey, metadata)
+        if written:
+            self._invalidate_queries()
+        return written
 
     def push_bibentry(self, citekey, bibdata):
-        self.bibcache.push(citekey, bibdata)
+        """Returns False if the bibentry was unchanged, and not written."""
+        written = self.bibcache.push(citekey, bibdata)
+        if written:
+            self._invalidate_queries()
+        return written
 
     def push(self, citekey, metadata, bibdata):
         self.databroker.push(citekey, metadata, bibdata)
         self.metacache.push_to_cache(citekey, metadata)
         self.bibcache.push_to_cache(citekey, bibdata)
+        self._invalidate_queries()
 
     def remove(self, citekey):
         self.databroker.remove(citekey)
         self.metacache.remove_from_cache(citekey)
         self.bibcache.remove_from_cache(citekey)
+        if self._onelinercache is not None:
+            self._onelinercache.remove(citekey)
+        self._invalidate_queries()
+
+    def rename(self, old_citekey, new_citekey):
+        """Move the files of a paper to a new citekey, and their cache
+        entries. The bibfile, that holds the citekey, is not updated: the
+        bibentry must be pushed again."""
+        self.databroker.rename(old_citekey, new_citekey)
+        self.metacache.rename_in_cache(old_citekey, new_citekey)
+        self.bibcache.remove_from_cache(old_citekey)
+        if self._onelinercache is not None:
+            self._onelinercache.remove(old_citekey)
+        self._invalidate_queries()
+
+    # queries
+
+    def pull_query(self, key):
+        """Return the cached citekeys matching a query, or None."""
+        return self.querycache.pull(key)
+
+    def push_query(self, key, citekeys):
+        self.querycache.push(key, citekeys)
+
+    def _invalidate_queries(self):
+        if self._querycache is not None:
+            self._querycache.invalidate()
+
+    # rendered lines
+
+    def entry_stamp(self, citekey):
+        """Return the timestamps of the cached bibfile and metafile of a
+        paper, updating them first if outdated."""
+        self.bibcache.pull(citekey)
+        self.metacache.pull(citekey)
+        return (self.bibcache.entries[citekey].timestamp,
+                self.metacache.entries[citekey].timestamp)
+
+    def pull_oneliner(self, citekey, stamp, style):
+        """Return the cached line of a paper, or None."""
+        return self.onelinercache.pull(citekey, stamp, style)
+
+    def push_oneliner(self, citekey, stamp, style, line):
+        self.onelinercache.push(citekey, stamp, style, line)
 
     def exists(self, citekey, meta_check=False):
         return self.databroker.exists(citekey, meta_check=meta_check)
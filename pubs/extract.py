@@ -0,0 +1,323 @@
+"""Extraction of the text of the documents attached to papers.
+
+Extractors are selected by file extension. Plain text and PostScript are
+supported out of the box; PDF support requires either the `pdfminer.six`
+package or the `pdftotext` command (from poppler-utils).
+
+The text of new documents is extracted in the background, by a process
+started when the repository is flushed, that outlives the command.
+"""
+
+import os
+import re
+import hashlib
+import subprocess
+
+from . import lock
+from .p3 import ustr
+from .utils import imap_in_pool, run_in_background
+from .content import read_binary_file, system_path
+
+
+class Extractor(object):
+    """Base class of text extractors.
+
+    Subclasses define the file extensions they handle, and may override
+    `available` if they depend on optional packages or programs.
+    """
+
+    extensions = ()
+
+    def available(self):
+        return True
+
+    def extract(self, path):
+        """Return the text of the document at path, as unicode."""
+        raise NotImplementedError
+
+
+class PlainTextExtractor(Extractor):
+
+    extensions = ('.txt', '.md', '.rst', '.org', '.tex')
+
+    def extract(self, path):
+        return read_binary_file(path).decode('utf-8', 'replace')
+
+
+class PostScriptExtractor(Extractor):
+    """Collects the string literals of a PostScript file.
+
+    This is crude, but text drawn with the `show` family of operators, as
+    output by TeX, comes out in reading order.
+    """
+
+    extensions = ('.ps', '.eps')
+
+    string_re = re.compile(br'\(((?:\\.|[^\\)])*)\)', re.DOTALL)
+    escape_re = re.compile(br'\\([0-7]{1,3}|.)', re.DOTALL)
+    escapes = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'', b'f': b''}
+
+    def _unescape(self, match):
+        c = match.group(1)
+        if c[:1].isdigit():
+            return bytearray([int(c, 8) & 0xff])
+        return self.escapes.get(c, c)
+
+    def extract(self, path):
+        raw = read_binary_file(path)
+        chunks = [self.escape_re.sub(self._unescape, m.group(1))
+                  for m in self.string_re.finditer(raw)]
+        return b' '.join(chunks).decode('latin-1')
+
+
+class PdfMinerExtractor(Extractor):
+
+    extensions = ('.pdf',)
+
+    def available(self):
+        try:
+            import pdfminer.high_level
+            return True
+        except ImportError:
+            return False
+
+    def extract(self, path):
+        from pdfminer.high_level import extract_text
+        return ustr(extract_text(system_path(path)))
+
+
+class PdfToTextExtractor(Extractor):
+
+    extensions = ('.pdf',)
+    _available = None
+
+    def available(self):
+        if self._available is None:
+            try:
+                with open(os.devnull, 'w') as devnull:
+                    subprocess.call(['pdftotext', '-v'], stdout=devnull,
+                                    stderr=devnull)
+                PdfToTextExtractor._available = True
+            except OSError:
+                PdfToTextExtractor._available = False
+        return self._available
+
+    def extract(self, path):
+        out = subprocess.check_output(['pdftotext', '-q', system_path(path), '-'])
+        return out.decode('utf-8', 'replace')
+
+
+# first available extractor for an extension is used.
+_extractors = [PlainTextExtractor(), PostScriptExtractor(),
+               PdfMinerExtractor(), PdfToTextExtractor()]
+
+
+def register_extractor(extractor, first=True):
+    """Add an extractor. If first is True, it takes precedence over the
+    existing extractors for the extensions it handles.
+
+    Extractors are sent to the processes extracting texts: their class must
+    be defined at the top level of a module, so that they can be pickled.
+    """
+    if first:
+        _extractors.insert(0, extractor)
+    else:
+        _extractors.append(extractor)
+
+
+def get_extractor(path):
+    """Return the extractor for a file, or None if there is none."""
+    ext = os.path.splitext(path)[1].lower()
+    for extractor in _extractors:
+        if ext in extractor.extensions and extractor.available():
+            return extractor
+    return None
+
+
+def _digest(path):
+    h = hashlib.sha1()
+    with open(system_path(path), 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _extract(job):
+    """Extract the text of a document; run in worker processes.
+
+    :param job:  a (path, digest, extractor) tuple; if the digest of the
+                 file matches, the text is known already and is not
+                 extracted. The extractor is the one selected by the
+                 calling process, since workers started afresh (not forked)
+                 do not know the extractors registered there.
+    :returns:  a (path, TextEntry) tuple. The entry text is None when
+               the document did not change.
+    """
+    path, known_digest, extractor = job
+    try:
+        stats = os.stat(system_path(path))
+        digest = _digest(path)
+        if digest == known_digest:
+            return path, TextEntry(stats.st_size, stats.st_mtime, digest, None)
+        text = extractor.extract(path) if extractor is not None else u''
+        return path, TextEntry(stats.st_size, stats.st_mtime, digest, text)
+    except Exception:  # documents that can't be read or parsed have no text.
+        return path, None
+
+
+class TextEntry(object):
+
+    def __init__(self, size, mtime, digest, text):
+        self.size = size
+        self.mtime = mtime
+        self.digest = digest
+        self.text = text
+
+
+class TextCache(object):
+    """Cache of the text extracted from documents.
+
+    Entries are keyed by document path, and validated against the size and
+    modification time of the document. When those change, the content hash
+    is checked before extracting the text again. When flushed, entries are
+    merged with the ones cached meanwhile by other processes, such as the
+    background extraction.
+    """
+
+    name = 'textcache'
+
+    def __init__(self, databroker):
+        self.databroker = databroker
+        self._entries = None
+        self._changed = set()  # paths updated, and removed, since pulled
+        self._removed = set()
+        self.modified = False
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = self._try_pull_cache()
+        return self._entries
+
+    def _try_pull_cache(self):
+        try:
+            return self.databroker.pull_cache(self.name)
+        except Exception:  # take no prisonners; if something is wrong, no cache.
+            return {}
+
+    def flush(self, force=False):
+        if force or self.modified:
+            with self.databroker.lock(exclusive=True):
+                self.refresh()
+                self.databroker.push_cache(self.name, self.entries)
+            self._changed, self._removed = set(), set()
+            self.modified = False
+
+    def refresh(self):
+        """Reload the entries cached by other processes, keeping the ones
+        changed by this one."""
+        entries = self._try_pull_cache()
+        if entries is self._entries:  # unchanged, kept in memory
+            return
+        for path in self._removed:
+            entries.pop(path, None)
+        for path in self._changed:
+            entries[path] = self.entries[path]
+        self._entries = entries
+
+    def _set(self, path, entry):
+        self.entries[path] = entry
+        self._changed.add(path)
+        self._removed.discard(path)
+        self.modified = True
+
+    def _remove(self, path):
+        self.entries.pop(path, None)
+        self._changed.discard(path)
+        self._removed.add(path)
+        self.modified = True
+
+    def _is_fresh(self, path):
+        entry = self.entries.get(path)
+        if entry is None:
+            return False
+        try:
+            stats = os.stat(system_path(path))
+        except OSError:  # the document is gone, so is its text.
+            self._remove(path)
+            return False
+        return entry.size == stats.st_size and entry.mtime == stats.st_mtime
+
+    def rename(self, old_path, new_path):
+        """Move the entry of a document moved on disk, since moving keeps
+        its size and modification time."""
+        entry = self.entries.get(old_path)
+        if entry is not None:
+            self._remove(old_path)
+            self._set(new_path, entry)
+
+    def get(self, path):
+        """Return the cached text of a document, without extracting it.
+
+        :returns:  the text, an empty string if the document type has no
+                   extractor, or None if the text needs to be extracted.
+        """
+        if get_extractor(path) is None:
+            return u''
+        if self._is_fresh(path):
+            return self.entries[path].text
+        return None
+
+    def extract(self, paths, processes=None):
+        """Return a dictionary of the text of the documents at paths.
+
+        Documents with no extractor, or that could not be read, map to
+        an empty string. Texts that are not cached are extracted by a pool
+        of `processes` worker processes (by default, one per core).
+        """
+        texts = {path: self.get(path) for path in set(paths)}
+        jobs = [(path, self.entries[path].digest if path in self.entries else None,
+                 get_extractor(path))
+                for path, text in texts.items() if text is None]
+        for path, entry in imap_in_pool(_extract, jobs, processes):
+            if entry is None:
+                self._remove(path)
+                texts[path] = u''
+            else:
+                if entry.text is None:  # unchanged content
+                    entry.text = self.entries[path].text
+                self._set(path, entry)
+                texts[path] = entry.text
+        return texts
+
+
+def extraction_lock(databroker, exclusive=False):
+    """Lock held by the background extraction while it runs: taking it
+    shared waits for the extraction to end."""
+    path = os.path.join(databroker.filebroker.cachedir, 'extractlock')
+    return lock.locked(system_path(path), exclusive=exclusive)
+
+
+def extract_in_background(databroker, paths):
+    """Start a process that extracts the text of the documents at paths,
+    in a pool of worker processes, into the text cache, and return at once.
+
+    :returns:  False if background tasks are disabled, or the process
+               could not be started.
+    """
+    if len(paths) == 0:
+        return False
+    return run_in_background('extract', '_extract_in_background',
+                             databroker.filebroker.directory,
+                             databroker.docbroker.docdir,
+                             _extractors, list(paths))
+
+
+def _extract_in_background(pubsdir, docsdir, extractors, paths):
+    from .databroker import DataBroker
+    _extractors[:] = extractors  # as registered in the calling process
+    databroker = DataBroker(pubsdir, docsdir)
+    with extraction_lock(databroker, exclusive=True):
+        texts = TextCache(databroker)
+        texts.extract(paths)
+        texts.flush()
@@ -1,15 +1,21 @@
 import os
 import re
+import binascii
+import contextlib
+import collections
 from .p3 import urlparse
 
 from .content import (check_file, check_directory, read_text_file, write_file,
-                      system_path, check_content, copy_content)
+                      system_path, check_content, copy_content, move_content,
+                      sync_file, sync_directory, replace_file)
 
 from . import content
+from . import lock
 
 
 META_EXT = '.yaml'
 BIB_EXT  = '.bib'
+STAGING_DIR = '.staging'  # in the bib and meta directories
 
 
 def filter_filename(filename, ext):
@@ -33,6 +39,14 @@ class FileBroker(object):
         self.metadir   = os.path.join(self.directory, 'meta')
         self.bibdir    = os.path.join(self.directory, 'bib')
         self.cachedir  = os.path.join(self.directory, '.cache')
+        self.modified  = False
+        self.lockpath  = os.path.join(self.cachedir, 'lock')
+        self.writelockpath = os.path.join(self.cachedir, 'writelock')
+        self._staged   = None  # final path -> temporary path, or None if removed
+        self._undos    = None  # reverts changes made outside the transaction
+        self._dones    = None  # run once the transaction is committed
+        self._written_from = None  # fingerprint before the first write
+        self._written_citekeys = {}  # -> whether their bibfile was written
         if create:
             self._create()
         check_directory(self.directory)
@@ -41,6 +55,12 @@ class FileBroker(object):
         # cache directory is created (if absent) if other directories exists.
         if not check_directory(self.cachedir, fail=False):
             os.mkdir(system_path(self.cachedir))
+        # so are the staging directories, before any transaction, since
+        # creating them changes the modification time of their parent.
+        for directory in (self.bibdir, self.metadir):
+            staging = os.path.join(directory, STAGING_DIR)
+            if not check_directory(staging, fail=False):
+                os.mkdir(system_path(staging))
 
     def _create(self):
         """Create meta and bib directories if absent"""
@@ -65,33 +85,254 @@ class FileBroker(object):
         filepath = os.path.join(self.cachedir, filename)
         write_file(filepath, data, mode='wb')
 
+    def stat_cachefile(self, filename):
+        """Return the (mtime, size) of a cache file. Raises OSError if absent."""
+        st = os.stat(system_path(os.path.join(self.cachedir, filename)))
+        return st.st_mtime, st.st_size
+
+    def lock(self, exclusive=False):
+        """Lock the caches and the published state of the repository, for
+        the duration of a with block: shared to read them consistently,
+        exclusive to change them. Readers hold it while they read papers,
+        so that the commit of a transaction waits for them, and writers
+        only while they commit, so that readers never wait long for them.
+        Writers lock each other out until close."""
+        return lock.locked(system_path(self.lockpath), exclusive=exclusive)
+
+    def close(self):
+        """Release the repository. It may still be used afterwards.
+
+        :returns: if it was modified, the fingerprints of the repository
+                  before the first write and after the last one, between
+                  which no other process wrote to it, and a dict from the
+                  citekeys whose files were written to whether their bibfile
+                  was; else None.
+        """
+        if self.modified:
+            self._bump_generation()
+            written = (self._written_from, self.fingerprint(),
+                       self._written_citekeys)
+            self._written_citekeys = {}
+            self.modified = False
+            lock.get(system_path(self.writelockpath)).release(exclusive=True)
+            return written
+        return None
+
+    def _bump_generation(self):
+        with self.lock(exclusive=True):
+            self.push_cachefile('generation', binascii.hexlify(os.urandom(16)))
+
+    def _touch(self):
+        """Mark the repository as modified, and lock out other writers
+        until close. The generation is bumped both before the first write
+        and on close, so that concurrent readers never pair stale content
+        with a new fingerprint. Changes made in a transaction are only
+        visible once committed, and the commit bumps it instead."""
+        if not self.modified:
+            lock.get(system_path(self.writelockpath)).acquire(exclusive=True)
+            self._written_from = self.fingerprint()
+            if not self.in_transaction:
+                self._bump_generation()
+            self.modified = True
+
+    def fingerprint(self):
+        """Return a value that changes whenever the repository content does.
+
+        Combines the generation token, bumped by pubs on every write, with
+        the modification times of the bib and meta directories, that catch
+        files added, removed or replaced by other means.
+        """
+        with self.lock():
+            try:
+                generation = self.pull_cachefile('generation')
+            except IOError:
+                generation = None
+            return (generation, os.path.getmtime(system_path(self.bibdir)),
+                    os.path.getmtime(system_path(self.metadir)))
+
+    # transactions
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Apply the writes and removals of bib and meta files made in the
+        block all together, when it exits without error.
+
+        Files are written to temporary files, that are read in place of the
+        repository files until the end of the block. They are then flushed
+        to disk, and renamed into place, while readers are locked out, so
+        that they see either none or all of the changes. If the block raises
+        an error, they are discarded, and the changes registered with
+        `on_discard` are reverted; else, the functions registered with
+        `on_commit` are called once it is committed. Nested transactions are
+        part of the outer one.
+        """
+        if self.in_transaction:
+            yield
+            return
+        self._staged = collections.OrderedDict()
+        self._undos, self._dones = [], []
+        try:
+            yield
+        except BaseException:
+            self._discard()
+            raise
+        else:
+            self._commit()
+            self._run_dones()
+
+    @property
+    def in_transaction(self):
+        return self._staged is not None
+
+    def on_discard(self, undo):
+        """Register a function reverting a change made outside of the
+        current transaction, such as a document moved, to be called if the
+        transaction is discarded. Changes are reverted in reverse order."""
+        self._undos.append(undo)
+
+    def on_commit(self, done):
+        """Register a function to be called once the current transaction is
+        committed, to make a change that must not outlive a discarded
+        transaction, such as copying a document."""
+        self._dones.append(done)
+
+    def _run_dones(self):
+        """Call all the functions registered with `on_commit`, then raise the
+        first error they raised, if any."""
+        dones, self._dones = self._dones, None
+        error = None
+        for done in dones:
+            try:
+                done()
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+
+    def _commit(self):
+        staged, self._staged = self._staged, None
+        self._undos = None
+        for temppath in staged.values():
+            if temppath is not None and temppath not in staged:  # not moved
+                sync_file(temppath)
+        with self.lock(exclusive=True):
+            for filepath, temppath in staged.items():
+                if temppath is not None:
+                    replace_file(temppath, filepath)
+                elif check_file(filepath, fail=False):
+                    os.remove(system_path(filepath))
+            if staged:
+                self._bump_generation()
+        sync_directory(self.bibdir)
+        sync_directory(self.metadir)
+
+    def _discard(self):
+        staged, self._staged = self._staged, None
+        undos, self._undos = self._undos, None
+        self._dones = None
+        for temppath in staged.values():
+            if (temppath is not None and temppath not in staged  # not moved
+                    and check_file(temppath, fail=False)):
+                os.remove(system_path(temppath))
+        for undo in reversed(undos):
+            try:
+                undo()
+            except Exception:  # revert what can be; the error is raised anyway.
+                pass
+
+    def _current_path(self, filepath):
+        """Return where the content of a repository file currently is: a
+        temporary file if it was written in the current transaction.
+        Raises IOError if the file was removed in the transaction."""
+        if self._staged and filepath in self._staged:
+            if self._staged[filepath] is None:
+                raise IOError("'{}' not found.".format(filepath))
+            return self._staged[filepath]
+        return filepath
+
+    @staticmethod
+    def _temporary_path(filepath, staged=False):
+        """Temporary files do not end with the bib or meta extension, so are
+        not listed. Staged ones are kept in a subdirectory, so that the
+        modification time of the repository directories, part of the
+        fingerprint, does not change before the commit."""
+        directory, filename = os.path.split(filepath)
+        if staged:
+            directory = os.path.join(directory, STAGING_DIR)
+        return os.path.join(directory, '{}.{}.tmp'.format(
+            filename, binascii.hexlify(os.urandom(4)).decode()))
+
+    def _write(self, filepath, data):
+        """Write a file of the repository, in a crash-safe way: either the
+        new or the old content is found on disk, never a partial file."""
+        if self._staged is not None:
+            temppath = self._staged.get(filepath)
+            if temppath is None or temppath in self._staged:  # moved file
+                temppath = self._temporary_path(filepath, staged=True)
+            write_file(temppath, data)
+            self._staged[filepath] = temppath
+        else:
+            temppath = self._temporary_path(filepath)
+            write_file(temppath, data)
+            sync_file(temppath)
+            replace_file(temppath, filepath)
+
+    # files
+
     def mtime_metafile(self, citekey):
         try:
             filepath = self.meta_path(citekey)
-            return os.path.getmtime(filepath)
+            return os.path.getmtime(self._current_path(filepath))
         except OSError:
             raise IOError("'{}' not found.".format(filepath))
 
     def mtime_bibfile(self, citekey):
         try:
             filepath = self.bib_path(citekey)
-            return os.path.getmtime(filepath)
+            return os.path.getmtime(self._current_path(filepath))
         except OSError:
             raise IOError("'{}' not found.".format(filepath))
 
     def pull_metafile(self, citekey):
-        return read_text_file(self.meta_path(citekey))
+        return read_text_file(self._current_path(self.meta_path(citekey)))
 
     def pull_bibfile(self, citekey):
-        return read_text_file(self.bib_path(citekey))
+        return read_text_file(self._current_path(self.bib_path(citekey)))
 
     def push_metafile(self, citekey, metadata):
-        """Put content to disk. Will gladly override anything standing in its way."""
-        write_file(self.meta_path(citekey), metadata)
+        """Put content to disk. Will gladly override anything standing in its way.
+
+        :returns: False if the file already had this content, and was not
+                  written, else True.
+        """
+        written = self._push_file(self.meta_path(citekey), metadata)
+        if written:
+            self._written_citekeys.setdefault(citekey, False)
+        return written
 
     def push_bibfile(self, citekey, bibdata):
-        """Put content to disk. Will gladly override anything standing in its way."""
-        write_file(self.bib_path(citekey), bibdata)
+        """Put content to disk. Will gladly override anything standing in its way.
+
+        :returns: False if the file already had this content, and was not
+                  written, else True.
+        """
+        written = self._push_file(self.bib_path(citekey), bibdata)
+        if written:
+            self._written_citekeys[citekey] = True
+        return written
+
+    def _push_file(self, filepath, data):
+        """Write a file, unless its content is unchanged, so that its
+        modification time, and the caches depending on it, are preserved."""
+        try:
+            current = self._current_path(filepath)
+            if check_file(current, fail=False) and read_text_file(current) == data:
+                return False
+        except (IOError, content.UnableToDecodeTextFile):
+            pass
+        self._touch()
+        self._write(filepath, data)
+        return True
 
     def push(self, citekey, metadata, bibdata):
         """Put content to disk. Will gladly override anything standing in its way."""
@@ -99,24 +340,51 @@ class FileBroker(object):
         self.push_bibfile(citekey, bibdata)
 
     def remove(self, citekey):
-        metafilepath = self.meta_path(citekey)
-        if check_file(metafilepath):
-            os.remove(system_path(metafilepath))
-        bibfilepath = self.bib_path(citekey)
-        if check_file(bibfilepath):
-            os.remove(system_path(bibfilepath))
+        self._touch()
+        self._written_citekeys[citekey] = True
+        for filepath in (self.meta_path(citekey), self.bib_path(citekey)):
+            current = self._current_path(filepath)
+            check_file(current)
+            if self._staged is None:
+                os.remove(system_path(filepath))
+            else:
+                if current != filepath:
+                    os.remove(system_path(current))
+                self._staged[filepath] = None
+
+    def rename(self, old_citekey, new_citekey):
+        """Move the files of a paper to a new citekey. They are not
+        rewritten, and keep their modification times."""
+        self._touch()
+        self._written_citekeys[old_citekey] = True
+        self._written_citekeys[new_citekey] = True
+        for path_fun in (self.meta_path, self.bib_path):
+            filepath = path_fun(old_citekey)
+            current = self._current_path(filepath)
+            check_file(current)
+            if self._staged is None:
+                replace_file(filepath, path_fun(new_citekey))
+            else:
+                self._staged[path_fun(new_citekey)] = current
+                self._staged[filepath] = None
 
     def exists(self, citekey, meta_check=False):
         """ Checks wether the bibtex of a citekey exists.
 
             :param meta_check:  if True, will return if both the bibtex and the meta file exists.
         """
-        does_exists = check_file(self.bib_path(citekey), fail=False)
+        does_exists = self._file_exists(self.bib_path(citekey))
         if meta_check:
-            meta_exists = check_file(self.meta_path(citekey), fail=False)
+            meta_exists = self._file_exists(self.meta_path(citekey))
             does_exists = does_exists and meta_exists
         return does_exists
 
+    def _file_exists(self, filepath):
+        try:
+            return check_file(self._current_path(filepath), fail=False)
+        except IOError:  # removed in the current transaction
+            return False
+
     def listing(self, filestats=True):
         metafiles = []
         for filename in os.listdir(system_path(self.metadir)):
@@ -138,6 +406,18 @@ class FileBroker(object):
                 else:
                     bibfiles.append(citekey)
 
+        if self._staged and not filestats:
+            for directory, ext, citekeys in ((self.metadir, META_EXT, metafiles),
+                                             (self.bibdir, BIB_EXT, bibfiles)):
+                for filepath, temppath in self._staged.items():
+                    citekey = filter_filename(os.path.basename(filepath), ext)
+                    if os.path.dirname(filepath) != directory or citekey is None:
+                        continue
+                    if temppath is None and citekey in citekeys:
+                        citekeys.remove(citekey)
+                    elif temppath is not None and citekey not in citekeys:
+                        citekeys.append(citekey)
+
         return {'metafiles': metafiles, 'bibfiles': bibfiles}
 
 
@@ -189,12 +469,24 @@ class DocBroker(object):
             :param overwrite: will overwrite existing file.
             :return: the above location
         """
-        full_source_path = self.real_docpath(source_path)
-        check_content(full_source_path)
+        target_path = self.check_add_doc(citekey, source_path, overwrite=overwrite)
+        copy_content(self.real_docpath(source_path), self.real_docpath(target_path),
+                     overwrite=overwrite)
+        return target_path
 
+    def check_add_doc(self, citekey, source_path, overwrite=False):
+        """ Check that a document can be added, without adding it.
+
+            :raise IOError: if the document does not exist, or if the target
+                            exists and overwrite is False.
+            :return: the location the document would be added to.
+        """
+        check_content(self.real_docpath(source_path))
         target_path = '{}://{}'.format(self.scheme, citekey + os.path.splitext(source_path)[-1])
         full_target_path = self.real_docpath(target_path)
-        copy_content(full_source_path, full_target_path, overwrite=overwrite)
+        if (not overwrite and full_target_path != self.real_docpath(source_path)
+                and os.path.exists(system_path(full_target_path))):
+            raise IOError(u'{} file exists.'.format(full_target_path))
         return target_path
 
     def remove_doc(self, docpath, silent=True):
@@ -219,11 +511,15 @@ class DocBroker(object):
             :raise ValueError: if docpath is not in docsdir().
 
             if an exception is raised, the files on disk haven't changed.
+            The document is moved, not copied.
         """
         if not self.in_docsdir(docpath):
             raise ValueError('cannot rename an external file ({}).'.format(docpath))
 
-        new_docpath = self.add_doc(new_citekey, docpath)
-        self.remove_doc(docpath)
+        full_source_path = self.real_docpath(docpath)
+        check_content(full_source_path)
+        new_docpath = '{}://{}'.format(
+            self.scheme, new_citekey + os.path.splitext(docpath)[-1])
+        move_content(full_source_path, self.real_docpath(new_docpath))
 
         return new_docpath
@@ -0,0 +1,448 @@
+"""Persistent search indexes, stored alongside the caches in .cache/"""
+
+from __future__ import division
+
+import os
+import re
+import math
+import heapq
+import unicodedata
+import collections
+from array import array
+
+from .p3 import ustr
+from . import bibstruct
+from .content import read_text_file
+
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# the state of the repository each index reflects, see InvertedIndex.state
+STATES_CACHE = 'indexstates'
+
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'we', 'with'])
+
+
+def normalize(s):
+    """Lowercase, strip accents and split a string in words."""
+    s = unicodedata.normalize('NFKD', ustr(s))
+    s = ''.join(c for c in s if not unicodedata.combining(c))
+    return WORD_RE.findall(s.lower())
+
+
+def trigrams(s):
+    """Return the set of trigrams of the words of a string.
+
+    Words are padded, as in "  word ", so that word beginnings weight more
+    than word ends, and that short words still produce trigrams.
+    """
+    grams = set()
+    for word in normalize(s):
+        padded = '  ' + word + ' '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def terms(s):
+    """Return the words of a string, minus stopwords."""
+    return [w for w in normalize(s) if len(w) > 1 and w not in STOPWORDS]
+
+
+def searchable_text(bibdata):
+    """Return the text indexed for fuzzy search: title, authors and journal."""
+    parts = [bibdata.get('title', '')]
+    for author in bibdata.get('author', []):
+        parts.append(bibstruct.author_last(author))
+    journal = bibdata.get('journal', '')
+    if isinstance(journal, dict):
+        journal = journal.get('name', '')
+    parts.append(journal or bibdata.get('booktitle', ''))
+    return ' '.join(parts)
+
+
+def _pull_states(databroker):
+    try:
+        return dict(databroker.pull_cache(STATES_CACHE))
+    except Exception:  # no or bad cache: no state is known.
+        return {}
+
+
+class InvertedIndex(object):
+    """Base class for the inverted indexes from terms to papers.
+
+    Each paper is given an integer id; postings are compact arrays of ids,
+    with an optional parallel array of term frequencies. Removed papers
+    leave a tombstone behind, and the index is compacted once tombstones
+    outnumber live entries. Entries are stamped (by default with the
+    modification time of the bibfile they were computed from), so that the
+    index can be checked against the repository content.
+
+    Checking every entry is only needed when the repository changed other
+    than through pubs, which updates the index along: the index records
+    the state of the repository it reflects (see `state`), that writers
+    carry forward (see `advance`).
+    """
+
+    name = None
+    frequencies = False
+
+    def __init__(self, databroker):
+        self.databroker = databroker
+        self._mtime_fun = databroker.filebroker.mtime_bibfile
+        self._data = None
+        self._state = None
+        self.modified = False
+
+    @property
+    def data(self):
+        if self._data is None:
+            with self.databroker.lock():  # the entries and their state together
+                self._data = self._try_pull_cache()
+        return self._data
+
+    def _try_pull_cache(self):
+        try:
+            data = self.databroker.pull_cache(self.name)
+            self._state = _pull_states(self.databroker).get(self.name)
+            return data
+        except Exception:  # take no prisonners; if something is wrong, no cache.
+            return {'keys': [],       # id -> citekey (None for tombstones)
+                    'ids': {},        # citekey -> id
+                    'stamps': {},     # citekey -> stamp
+                    'sizes': array('I'),  # id -> number of terms
+                    'total': 0,       # sum of the sizes of live entries
+                    'postings': {},   # term -> array of ids
+                    'freqs': {},      # term -> array of frequencies
+                    }
+
+    def flush(self, force=False):
+        if force or self.modified:
+            with self.databroker.lock(exclusive=True):
+                self.databroker.push_cache(self.name, self.data)
+                states = _pull_states(self.databroker)
+                states[self.name] = self._state
+                self.databroker.push_cache(STATES_CACHE, states)
+            self.modified = False
+
+    def current_state(self):
+        """Return the state of the files of the repository the index is
+        computed from: the fingerprint of the repository, as a tuple."""
+        return (self.databroker.fingerprint(),)
+
+    @property
+    def state(self):
+        """The state of the repository (see `current_state`) the entries
+        were last checked against, or None. The entries are up to date if
+        it is still the current one."""
+        self.data
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        self.data
+        self._state = state
+        self.modified = True
+
+    def advance(self, before, after):
+        """Record that the repository went from the fingerprint `before` to
+        `after` through writes the index was updated with. Its state is
+        then carried forward, if it was the one of `before`."""
+        if self._data is not None and self.modified:
+            if self._state is not None and self._state[0] == before:
+                self._state = (after,) + self._state[1:]
+            return
+        # the index file is left as is: only its state is updated
+        with self.databroker.lock(exclusive=True):
+            states = _pull_states(self.databroker)
+            state = states.get(self.name)
+            if state is not None and state[0] == before:
+                states[self.name] = (after,) + state[1:]
+                self.databroker.push_cache(STATES_CACHE, states)
+                if self._data is not None and self._state == state:
+                    self._state = states[self.name]
+
+    def __contains__(self, citekey):
+        return citekey in self.data['ids']
+
+    def __len__(self):
+        return len(self.data['ids'])
+
+    def _stamp(self, citekey):
+        try:
+            return self._mtime_fun(citekey)
+        except IOError:
+            return None
+
+    def _add(self, citekey, counts):
+        """Index a paper, given the counts of its terms."""
+        if citekey in self:
+            self.remove(citekey)
+        data = self.data
+        doc_id = len(data['keys'])
+        size = sum(counts.values())
+        data['keys'].append(citekey)
+        data['sizes'].append(size)
+        data['total'] += size
+        data['ids'][citekey] = doc_id
+        data['stamps'][citekey] = self._stamp(citekey)
+        postings, freqs = data['postings'], data['freqs']
+        for term, count in counts.items():
+            posting = postings.get(term)
+            if posting is None:
+                posting = postings[term] = array('I')
+                if self.frequencies:
+                    freqs[term] = array('I')
+            posting.append(doc_id)
+            if self.frequencies:
+                freqs[term].append(count)
+        self.modified = True
+
+    def remove(self, citekey):
+        """Remove a paper from the index. Silent if the paper is not indexed."""
+        data = self.data
+        doc_id = data['ids'].pop(citekey, None)
+        if doc_id is None:
+            return
+        data['stamps'].pop(citekey, None)
+        data['keys'][doc_id] = None
+        data['total'] -= data['sizes'][doc_id]
+        self.modified = True
+        if len(data['keys']) > 2 * len(data['ids']) + 64:
+            self._compact()
+
+    def rename(self, old_citekey, new_citekey):
+        """Move the entry of a paper to a new citekey, without reindexing it."""
+        data = self.data
+        doc_id = data['ids'].pop(old_citekey, None)
+        if doc_id is None:
+            return
+        data['stamps'].pop(old_citekey, None)
+        data['keys'][doc_id] = new_citekey
+        data['ids'][new_citekey] = doc_id
+        data['stamps'][new_citekey] = self._stamp(new_citekey)
+        self.modified = True
+
+    def _compact(self):
+        """Renumber live entries and drop tombstones from postings."""
+        data = self.data
+        new_ids = {}
+        keys, sizes = [], array('I')
+        for old_id, citekey in enumerate(data['keys']):
+            if citekey is not None:
+                new_ids[old_id] = len(keys)
+                keys.append(citekey)
+                sizes.append(data['sizes'][old_id])
+        postings, freqs = {}, {}
+        for term, posting in data['postings'].items():
+            kept = [n for n, i in enumerate(posting) if i in new_ids]
+            if len(kept) > 0:
+                postings[term] = array('I', (new_ids[posting[n]] for n in kept))
+                if self.frequencies:
+                    freqs[term] = array('I', (data['freqs'][term][n] for n in kept))
+        data['keys'], data['sizes'] = keys, sizes
+        data['postings'], data['freqs'] = postings, freqs
+        data['ids'] = {citekey: i for i, citekey in enumerate(keys)}
+        self.modified = True
+
+    def outdated(self, citekeys):
+        """Drop entries absent from citekeys and return the citekeys that
+        need to be (re)indexed, because they are new or their stamp
+        changed since they were indexed.
+        """
+        stamps = self.data['stamps']
+        for citekey in [c for c in stamps if c not in citekeys]:
+            self.remove(citekey)
+        return [citekey for citekey in citekeys
+                if citekey not in stamps
+                or self._stamp(citekey) != stamps[citekey]]
+
+
+class TrigramIndex(InvertedIndex):
+    """Inverted index from trigrams to papers, for typo-tolerant search."""
+
+    name = 'trigramindex'
+
+    def push(self, citekey, bibdata):
+        """Index (or reindex) a paper."""
+        grams = trigrams(searchable_text(bibdata))
+        self._add(citekey, dict.fromkeys(grams, 1))
+
+    def search(self, query, limit=20, threshold=0.5):
+        """Return a list of (citekey, score) of the best matches.
+
+        The score is the fraction of the trigrams of the query found in the
+        paper; ties are broken in favor of papers with less text.
+
+        :param limit:      maximum number of results (None for all).
+        :param threshold:  minimal score of a result, between 0 and 1.
+        """
+        data = self.data
+        grams = trigrams(query)
+        if len(grams) == 0:
+            return []
+        counts = collections.Counter()
+        for gram in grams:
+            posting = data['postings'].get(gram)
+            if posting is not None:
+                counts.update(posting)
+        keys, sizes = data['keys'], data['sizes']
+        min_count = threshold * len(grams)
+        scored = ((count, -sizes[doc_id], doc_id)
+                  for doc_id, count in counts.items()
+                  if count >= min_count and keys[doc_id] is not None)
+        if limit is None:
+            best = sorted(scored, reverse=True)
+        else:
+            best = heapq.nlargest(limit, scored)
+        return [(keys[doc_id], count / len(grams))
+                for count, _, doc_id in best]
+
+
+class FullTextIndex(InvertedIndex):
+    """BM25-ranked index over the titles, abstracts, notes and documents
+    of papers.
+
+    Entries are stamped with the modification times of the bibfile and of
+    the note file, so that notes edited outside of pubs are reindexed, and
+    record the docpath of the paper: changes of other metadata, such as
+    tags, leave them as is. The text of documents is extracted separately
+    (see `extract.TextCache`) and given to `push`.
+    """
+
+    name = 'fulltextindex'
+    frequencies = True
+    k1 = 1.2
+    b = 0.75
+    title_weight = 2
+
+    def __init__(self, databroker, note_extension):
+        super(FullTextIndex, self).__init__(databroker)
+        self.note_extension = note_extension
+
+    def _notepath(self, citekey):
+        return self.databroker.real_notepath(citekey, self.note_extension)
+
+    def current_state(self):
+        """As `InvertedIndex.current_state`, with the modification time of
+        the notes directory, that changes when notes are added, or saved by
+        replacing their file, outside of pubs."""
+        try:
+            notes_stamp = os.path.getmtime(self.databroker.notebroker.docdir)
+        except OSError:
+            notes_stamp = None
+        return super(FullTextIndex, self).current_state() + (notes_stamp,)
+
+    def _try_pull_cache(self):
+        data = super(FullTextIndex, self)._try_pull_cache()
+        data.setdefault('docpaths', {})  # citekey -> docpath
+        return data
+
+    def _stamp(self, citekey):
+        bib_stamp = super(FullTextIndex, self)._stamp(citekey)
+        try:
+            note_stamp = os.path.getmtime(self._notepath(citekey))
+        except OSError:
+            note_stamp = None
+        return bib_stamp, note_stamp
+
+    def docpath(self, citekey):
+        """Return the docpath of a paper when it was indexed, or None."""
+        return self.data['docpaths'].get(citekey)
+
+    def remove(self, citekey):
+        super(FullTextIndex, self).remove(citekey)
+        self.data['docpaths'].pop(citekey, None)
+
+    def rename(self, old_citekey, new_citekey, docpath=None):
+        """Move the entry of a paper to a new citekey, without reindexing it.
+
+        :param docpath:  the new docpath of the paper, if its document was
+                         moved along.
+        """
+        docpaths = self.data['docpaths']
+        old_docpath = docpaths.pop(old_citekey, None)
+        super(FullTextIndex, self).rename(old_citekey, new_citekey)
+        if new_citekey in self:
+            docpaths[new_citekey] = docpath or old_docpath
+
+    def outdated(self, citekeys, docpath=None):
+        """As `InvertedIndex.outdated`.
+
+        :param docpath:  if given, a function returning the current docpath
+                         of a paper: papers whose document changed since they
+                         were indexed are returned as well.
+        """
+        outdated = super(FullTextIndex, self).outdated(citekeys)
+        if docpath is not None:
+            known = set(outdated)
+            docpaths = self.data['docpaths']
+            outdated.extend(c for c in citekeys if c not in known
+                            and docpaths.get(c) != (docpath(c) or None))
+        return outdated
+
+    def pending(self):
+        """Return the citekeys of the papers indexed without the text of
+        their document, that was not extracted yet."""
+        return [c for c, stamp in self.data['stamps'].items() if stamp is None]
+
+    def _pull_note(self, citekey):
+        notepath = self._notepath(citekey)
+        if os.path.isfile(notepath):
+            try:
+                return read_text_file(notepath)
+            except Exception:  # unreadable notes are not indexed.
+                pass
+        return ''
+
+    def push(self, citekey, bibdata, doc_text=u'', docpath=None):
+        """Index (or reindex) a paper, together with its note if any.
+
+        :param doc_text:  the text of the document of the paper. If None,
+                          the text is not available yet: the paper is
+                          indexed without it, and marked as outdated.
+        :param docpath:   the docpath of the paper, recorded with its entry.
+        """
+        counts = collections.Counter()
+        for _ in range(self.title_weight):
+            counts.update(terms(bibdata.get('title', '')))
+        counts.update(terms(bibdata.get('abstract', '')))
+        counts.update(terms(self._pull_note(citekey)))
+        counts.update(terms(doc_text or u''))
+        self._add(citekey, counts)
+        self.data['docpaths'][citekey] = docpath or None
+        if doc_text is None:
+            self.data['stamps'][citekey] = None
+
+    def search(self, query, limit=20):
+        """Return a list of (citekey, score) of the best matches, according
+        to the Okapi BM25 ranking function.
+
+        :param limit:  maximum number of results (None for all).
+        """
+        data = self.data
+        n_docs = len(data['ids'])
+        if n_docs == 0:
+            return []
+        keys, sizes = data['keys'], data['sizes']
+        avgdl = max(data['total'] / n_docs, 1)
+        k1, b = self.k1, self.b
+        scores = collections.defaultdict(float)
+        for term in set(terms(query)):
+            posting = data['postings'].get(term)
+            if posting is None:
+                continue
+            df = len(posting)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in zip(posting, data['freqs'][term]):
+                norm = k1 * (1 - b + b * sizes[doc_id] / avgdl)
+                scores[doc_id] += idf * tf * (k1 + 1) / (tf + norm)
+        scored = ((score, doc_id) for doc_id, score in scores.items()
+                  if keys[doc_id] is not None)
+        if limit is None:
+            best = sorted(scored, reverse=True)
+        else:
+            best = heapq.nlargest(limit, scored)
+        return [(keys[doc_id], score) for score, doc_id in best]
@@ -0,0 +1,92 @@
+"""Advisory locks on files, for processes sharing a repository.
+
+Readers take a shared lock, writers an exclusive one. Locks are reentrant,
+and shared by all the objects of a process: taking a shared lock while
+holding the exclusive one does nothing. Where fcntl is not available (on
+Windows), locks do nothing.
+"""
+
+import os
+import time
+import errno
+import contextlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# waits for locks held by other processes, over the life of the process
+stats = {'waits': 0, 'wait_time': 0.0, 'max_wait': 0.0}
+
+_locks = {}
+
+
+def get(path):
+    """Return the lock on a file, for the current process."""
+    lock = _locks.get(path)
+    if lock is None or lock.pid != os.getpid():  # not inherited from a fork
+        lock = _locks[path] = FileLock(path)
+    return lock
+
+
+@contextlib.contextmanager
+def locked(path, exclusive=False):
+    lock = get(path)
+    lock.acquire(exclusive=exclusive)
+    try:
+        yield
+    finally:
+        lock.release(exclusive=exclusive)
+
+
+class FileLock(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.fd = None
+        self.shared = 0     # number of times each kind of lock is held
+        self.exclusive = 0
+
+    def acquire(self, exclusive=False):
+        if exclusive:
+            if self.exclusive == 0:
+                self._flock(fcntl and fcntl.LOCK_EX)
+            self.exclusive += 1
+        else:
+            if self.exclusive == 0 and self.shared == 0:
+                self._flock(fcntl and fcntl.LOCK_SH)
+            self.shared += 1
+
+    def release(self, exclusive=False):
+        if exclusive:
+            self.exclusive -= 1
+        else:
+            self.shared -= 1
+        if self.exclusive == 0:
+            if self.shared == 0:
+                self._flock(fcntl and fcntl.LOCK_UN)
+            elif exclusive:  # back to the shared lock still held
+                self._flock(fcntl and fcntl.LOCK_SH)
+
+    def _flock(self, operation):
+        if fcntl is None:
+            return
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if operation == fcntl.LOCK_UN:
+            fcntl.flock(self.fd, operation)
+            return
+        try:
+            fcntl.flock(self.fd, operation | fcntl.LOCK_NB)
+        except (IOError, OSError) as e:
+            if e.errno not in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                raise
+            start = time.time()
+            fcntl.flock(self.fd, operation)
+            wait = time.time() - start
+            stats['waits'] += 1
+            stats['wait_time'] += wait
+            stats['max_wait'] = max(stats['max_wait'], wait)
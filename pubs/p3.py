@@ -18,8 +18,15 @@ if sys.version_info[0] == 2:
     uchr = unichr
     from urlparse import urlparse
     from urllib  import quote_plus
-    from urllib2 import urlopen
-    from httplib import HTTPConnection
+
+    # urllib2 and httplib are slow to import, and seldom needed.
+    def urlopen(*args, **kwargs):
+        from urllib2 import urlopen
+        return urlopen(*args, **kwargs)
+
+    def HTTPConnection(*args, **kwargs):
+        from httplib import HTTPConnection
+        return HTTPConnection(*args, **kwargs)
     file = None
     _fake_stdio = io.BytesIO  # Only for tests to capture std{out,err}
 
@@ -32,8 +39,15 @@ else:
     ustr = str
     uchr = chr
     from urllib.parse import urlparse, quote_plus
-    from urllib.request import urlopen
-    from http.client import HTTPConnection
+
+    # urllib.request and http.client are slow to import, and seldom needed.
+    def urlopen(*args, **kwargs):
+        from urllib.request import urlopen
+        return urlopen(*args, **kwargs)
+
+    def HTTPConnection(*args, **kwargs):
+        from http.client import HTTPConnection
+        return HTTPConnection(*args, **kwargs)
 
     # The following has to be a function so that it can be mocked
     # for test_usecase.
@@ -1,5 +1,4 @@
 import copy
-from dateutil.parser import parse as datetime_parse
 
 from . import bibstruct
 from .p3 import ustr
@@ -13,6 +12,7 @@ def _clean_metadata(metadata):
     meta.update(metadata or {})  # handles None metadata
     meta['tags'] = set(meta.get('tags', []))  # tags should be a set
     if 'added' in meta and isinstance(meta['added'], ustr):
+        from dateutil.parser import parse as datetime_parse  # slow to import
         meta['added'] = datetime_parse(meta['added'])
     return meta
 
@@ -1,9 +1,38 @@
+import io
+import os
+import sys
 import shlex
+import shutil
+import select
+import socket
+import tempfile
 import subprocess
 from pipes import quote as shell_quote
 
+from ... import color
+from ... import daemon
+from ... import pubs_cmd
+from ...p3 import ustr
+from ...utils import pubs_env
 from ...plugins import PapersPlugin
-from ...pubs_cmd import execute
+from ...pubs_cmd import run_command, parse_global_options
+
+
+# Shell function standing for pubs in shell aliases. Its commands are sent
+# to the pubs process running the alias, as to the pubs daemon: over a Unix
+# socket, along with the standard streams of the caller. Each is run in a
+# child forked for it, so that they run concurrently, as pubs processes
+# would, e.g. in `pubs list -k | while read k; do pubs tag $k; done`.
+# File descriptors can only be sent by a program, here a python client that
+# imports nothing but pubs.daemon: it starts much faster than pubs.
+PUBS_FUNCTION = """pubs () {{
+    PYTHONPATH={pythonpath} {python} -c {client} "$@"
+}}
+"""
+CLIENT = 'from pubs import daemon; daemon.forward_main({!r})'
+
+# waiting longer for the request of a connected caller drops it
+REQUEST_TIMEOUT = 5.0  # seconds
 
 
 class Alias(object):
@@ -13,7 +42,6 @@ class Alias(object):
         self.definition = definition
 
     def parser(self, parser):
-        self.parser = parser
         p = parser.add_parser(self.name, help='user defined command')
         p.add_argument('arguments', nargs='*',
             help="arguments to be passed to the user defined command")
@@ -34,14 +62,16 @@ class CommandAlias(Alias):
     """Default kind of alias.
     - definition is used as a papers command
     - other arguments are passed to the command
+
+    The command runs in the current process, with the configuration and
+    plugins already loaded.
     """
 
     def command(self, conf, args):
-        raw_args = ([args.prog]
-                    + shlex.split(self.definition
-                    + ' '
-                    + ' '.join(args.arguments)))
-        execute(raw_args)
+        cmd_args = shlex.split(self.definition + ' ' + ' '.join(args.arguments))
+        status = run_command(conf, cmd_args)
+        if status != 0:
+            sys.exit(status)
 
 
 class ShellAlias(Alias):
@@ -49,12 +79,133 @@ class ShellAlias(Alias):
     def command(self, conf, args):
         """Uses a shell function so that arguments can be used in the command
         as shell arguments.
+
+        Where file descriptors can be passed over sockets, `pubs` is itself
+        defined as a shell function, whose commands are run by children of
+        the current process.
+        """
+        script = 'pubs_alias_fun () {{\n{}\n}}\npubs_alias_fun {}'.format(
+            self.definition,
+            ' '.join([shell_quote(a) for a in args.arguments]))
+        if not daemon.supported():
+            subprocess.call(script, shell=True)
+            return
+        server = PubsServer(conf)
+        try:
+            server.serve(subprocess.Popen(server.function + script,
+                                          shell=True, close_fds=True))
+        finally:
+            server.close()
+
+
+class PubsServer(object):
+    """Runs the pubs commands of a shell alias, sent by PUBS_FUNCTION."""
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.tmpdir = tempfile.mkdtemp(prefix='pubs-alias-')  # user only
+        self.path = os.path.join(self.tmpdir, 'socket')
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.bind(self.path)
+        self.socket.listen(16)
+        self.function = PUBS_FUNCTION.format(
+            pythonpath=shell_quote(pubs_env()['PYTHONPATH']),
+            python=shell_quote(sys.executable),
+            client=shell_quote(CLIENT.format(self.path)))
+
+    def close(self):
+        self.socket.close()
+        shutil.rmtree(self.tmpdir)
+
+    def serve(self, process):
+        """Run the commands sent by process, until it exits, and wait for
+        the last ones."""
+        daemon.preload_commands()
+        children = set()
+        while process.poll() is None:
+            ready, _, _ = select.select([self.socket], [], [], 0.05)
+            if ready:
+                conn, _ = self.socket.accept()
+                try:
+                    pid = self.handle(conn)
+                    if pid is not None:
+                        children.add(pid)
+                finally:
+                    conn.close()
+            for pid in list(children):
+                if os.waitpid(pid, os.WNOHANG)[0] != 0:
+                    children.discard(pid)
+        for pid in children:
+            os.waitpid(pid, 0)
+
+    def handle(self, conn):
+        """Fork a child running the command requested on a connection.
+        Invalid requests, and callers that do not send theirs in time, are
+        dropped.
+
+        :returns: the pid of the child, or None.
         """
-        subprocess.call(
-            'pubs_alias_fun () {{\n{}\n}}\npubs_alias_fun {}'.format(
-                self.definition,
-                ' '.join([shell_quote(a) for a in args.arguments])
-            ), shell=True)
+        conn.settimeout(REQUEST_TIMEOUT)
+        reader = daemon._Reader(conn)
+        try:
+            try:
+                msg = reader.recv()
+            except (socket.error, ValueError):  # timeout, invalid json...
+                return None
+            if not self._valid_request(msg, reader.fds):
+                return None
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                self.socket.close()
+                self.run(conn, msg['argv'][1:], reader.fds, msg['cwd'])  # never returns
+            return pid
+        finally:
+            for fd in reader.fds:
+                os.close(fd)
+
+    @staticmethod
+    def _valid_request(msg, fds):
+        return (isinstance(msg, dict) and msg.get('request') == 'run'
+                and isinstance(msg.get('argv'), list) and len(msg['argv']) > 0
+                and all(isinstance(a, ustr) for a in msg['argv'])
+                and isinstance(msg.get('cwd'), ustr)
+                and isinstance(msg.get('env'), dict) and len(fds) == 3)
+
+    def run(self, conn, args, fds, cwd):
+        """Run a command in a forked child, with the standard streams, and
+        in the working directory, of the caller, then exit."""
+        import traceback
+        status = 1
+        try:
+            for i, fd in enumerate(fds):
+                os.dup2(fd, i)
+            sys.stdin = io.open(0, closefd=False)  # nothing read ahead
+            os.chdir(cwd)
+            daemon._send(conn, {'pid': os.getpid()})
+            try:
+                status = self.execute(args)
+            except BaseException:
+                traceback.print_exc()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            daemon._send(conn, {'status': status})
+        finally:
+            os._exit(status)
+
+    def execute(self, args):
+        """Run a command with the configuration of the alias, unless another
+        one is given."""
+        options, cmd_args = parse_global_options(args)
+        if options.config is not None:
+            try:
+                pubs_cmd.execute(['pubs'] + args)
+                return 0
+            except SystemExit as e:
+                return daemon._exit_status(e.code)
+        color.setup(self.conf, force_colors=options.force_colors)
+        return run_command(self.conf, cmd_args)
 
 
 class AliasPlugin(PapersPlugin):
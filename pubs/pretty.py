@@ -8,6 +8,9 @@ from .bibstruct import TYPE_KEY
 
 CHARS = re.compile('[{}\n\t\r]')
 
+# theme entries used by paper_oneliner
+ONELINER_COLORS = ('citekey', 'author', 'title', 'publisher', 'year', 'tag')
+
 def sanitize(s):
     return CHARS.sub('', s)
 
@@ -67,3 +70,8 @@ def paper_oneliner(p, citekey_only=False):
         return u'[{citekey}] {descr} {tags}'.format(
             citekey=color.dye_out(p.citekey, 'citekey'),
             descr=bibdesc, tags=tags)
+
+
+def oneliner_style():
+    """Return the current colors of paper_oneliner, to cache its lines."""
+    return tuple(color.DYES_OUT[name] for name in ONELINER_COLORS)
@@ -1,48 +1,159 @@
+import os
 import sys
 import argparse
+import importlib
 import collections
 from . import uis
+from . import lock
 from . import config
-from . import commands
 from . import update
 from . import plugins
 from .__init__ import __version__
 from .completion import autocomplete
 
 
+# command name -> module in pubs.commands; modules are imported on demand.
 CORE_CMDS = collections.OrderedDict([
-    ('init', commands.init_cmd),
-    ('conf', commands.conf_cmd),
-
-    ('add', commands.add_cmd),
-    ('rename', commands.rename_cmd),
-    ('remove', commands.remove_cmd),
-    ('list', commands.list_cmd),
-
-    ('doc', commands.doc_cmd),
-    ('tag', commands.tag_cmd),
-    ('note', commands.note_cmd),
-
-    ('export', commands.export_cmd),
-    ('import', commands.import_cmd),
-
-    ('websearch', commands.websearch_cmd),
-    ('edit', commands.edit_cmd),
+    ('init', 'init_cmd'),
+    ('conf', 'conf_cmd'),
+
+    ('add', 'add_cmd'),
+    ('rename', 'rename_cmd'),
+    ('remove', 'remove_cmd'),
+    ('list', 'list_cmd'),
+    ('pick', 'pick_cmd'),
+    ('search', 'search_cmd'),
+    ('grep', 'grep_cmd'),
+
+    ('doc', 'doc_cmd'),
+    ('tag', 'tag_cmd'),
+    ('meta', 'meta_cmd'),
+    ('note', 'note_cmd'),
+
+    ('export', 'export_cmd'),
+    ('import', 'import_cmd'),
+
+    ('websearch', 'websearch_cmd'),
+    ('edit', 'edit_cmd'),
+
+    ('batch', 'batch_cmd'),
+    ('shell', 'shell_cmd'),
+    ('daemon', 'daemon_cmd'),
 ])
 
+# global options followed by a value
+VALUED_OPTIONS = ('-c', '--config')
+
+# waiting longer for other processes to release the repository is reported
+LOCK_WAIT_WARNING = 1.0  # seconds
+
+
+def selected_command(args):
+    """Return the command name in args, or None if help is requested
+    before any command is given."""
+    args = iter(args)
+    for arg in args:
+        if arg in ('-h', '--help', '--version'):
+            return None
+        if arg in VALUED_OPTIONS:
+            next(args, None)  # the value is not a command
+        elif not arg.startswith('-'):
+            return arg
+    return None
+
+
+def core_commands(args):
+    """Return the (name, module) of the core commands needed to parse args.
+
+    Only the module of the selected command is imported, unless the whole
+    parser is needed: for help, errors, plugin commands or autocompletion.
+    """
+    name = selected_command(args)
+    if name in CORE_CMDS and '_ARGCOMPLETE' not in os.environ:
+        names = [name]
+    else:
+        names = CORE_CMDS.keys()
+    return [(name, importlib.import_module('pubs.commands.' + CORE_CMDS[name]))
+            for name in names]
+
+
+def parse_global_options(args):
+    """Split args into the global options, and the command and its
+    arguments.
+
+    :returns: (options, remaining args).
+    """
+    conf_parser = argparse.ArgumentParser(prog="pubs", add_help=False)
+    conf_parser.add_argument("-c", "--config", help="path to config file",
+                             type=str, metavar="FILE")
+    conf_parser.add_argument('--force-colors', dest='force_colors',
+                             action='store_true', default=False,
+                             help='color are not disabled when piping to a file or other commands')
+    #conf_parser.add_argument("-u", "--update", help="update config if needed",
+    #                         default=False, action='store_true')
+    return conf_parser.parse_known_args(args)
+
+
+def make_parser(conf, args):
+    """Return the parser of the command in args, without global options."""
+    parser = argparse.ArgumentParser(description="research papers repository",
+                                     prog="pubs", add_help=True)
+    parser.add_argument('--version', action='version', version=__version__)
+    subparsers = parser.add_subparsers(title="valid commands", dest="command")
+    subparsers.required = True
+
+    # Populate the parser with core commands
+    for cmd_name, cmd_mod in core_commands(args):
+        cmd_parser = cmd_mod.parser(subparsers, conf)
+        cmd_parser.set_defaults(func=cmd_mod.command)
+
+    # Extend with plugin commands
+    for p in plugins.get_plugins().values():
+        p.update_parser(subparsers, conf)
+    return parser
+
+
+def run_command(conf, args):
+    """Run a command in the current process, for instance in a batch.
+    Unlike execute, errors do not stop the process.
+
+    :param args: the command and its arguments, without global options.
+    :returns: the exit status of the command.
+    """
+    ui = uis.get_ui()
+    try:
+        try:
+            cmd_args = make_parser(conf, args).parse_args(args)
+            cmd_args.prog = "pubs"
+            cmd_args.func(conf, cmd_args)
+        except Exception as e:
+            if not ui.handle_exception(e):
+                raise
+    except SystemExit as e:  # from argparse or ui.exit()
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        ui.error(e.code)
+        return 1
+    return 0
+
+
+def report_lock_waits(conf):
+    """Warn if the command waited long for other processes using the
+    repository, or report all waits in debug mode."""
+    if lock.stats['waits'] == 0:
+        return
+    if (lock.stats['wait_time'] >= LOCK_WAIT_WARNING
+            or conf['main'].get('debug', False)):
+        uis.get_ui().warning(
+            u'waited {:.2f}s for other processes using the repository '
+            u'(longest wait: {:.2f}s).'.format(lock.stats['wait_time'],
+                                              lock.stats['max_wait']))
+
 
 def execute(raw_args=sys.argv):
 
     try:
-        conf_parser = argparse.ArgumentParser(prog="pubs", add_help=False)
-        conf_parser.add_argument("-c", "--config", help="path to config file",
-                                 type=str, metavar="FILE")
-        conf_parser.add_argument('--force-colors', dest='force_colors',
-                                 action='store_true', default=False,
-                                 help='color are not disabled when piping to a file or other commands')
-        #conf_parser.add_argument("-u", "--update", help="update config if needed",
-        #                         default=False, action='store_true')
-        top_args, remaining_args = conf_parser.parse_known_args(raw_args[1:])
+        top_args, remaining_args = parse_global_options(raw_args[1:])
 
         if top_args.config:
             conf_path = top_args.config
@@ -65,28 +176,18 @@ def execute(raw_args=sys.argv):
         uis.init_ui(conf, force_colors=top_args.force_colors)
         ui = uis.get_ui()
 
-        parser = argparse.ArgumentParser(description="research papers repository",
-                                         prog="pubs", add_help=True)
-        parser.add_argument('--version', action='version', version=__version__)
-        subparsers = parser.add_subparsers(title="valid commands", dest="command")
-        subparsers.required = True
-
-        # Populate the parser with core commands
-        for cmd_name, cmd_mod in CORE_CMDS.items():
-            cmd_parser = cmd_mod.parser(subparsers, conf)
-            cmd_parser.set_defaults(func=cmd_mod.command)
-
-        # Extend with plugin commands
         plugins.load_plugins(conf, ui)
-        for p in plugins.get_plugins().values():
-            p.update_parser(subparsers, conf)
+        parser = make_parser(conf, remaining_args)
 
         # Eventually autocomplete
         autocomplete(parser)
         # Parse and run appropriate command
         args = parser.parse_args(remaining_args)
         args.prog = "pubs"  # FIXME?
-        args.func(conf, args)
+        try:
+            args.func(conf, args)
+        finally:
+            report_lock_waits(conf)
 
     except Exception as e:
         if not uis.get_ui().handle_exception(e):
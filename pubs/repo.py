@@ -1,11 +1,46 @@
-import itertools
+import re
+import heapq
+import operator
+import contextlib
+import collections
 from datetime import datetime
 
 from . import bibstruct
 from . import events
+from . import pretty
+from . import index
+from . import extract
 from .datacache import DataCache
 from .paper import Paper
-from .content import system_path
+from .content import system_path, remove_files
+from .completion import SNAPSHOT_CACHE
+
+
+# fields whose most common values are offered for completion
+COMPLETION_FIELDS = ('author', 'year', 'journal', 'booktitle', 'publisher')
+COMPLETION_VALUES = 200
+# per-paper entries and counts the completion snapshot is computed from
+COMPLETION_COUNTS_CACHE = 'completioncounts'
+
+# suffixes added to citekeys to make them unique (see _base27)
+SUFFIX_RE = re.compile(r'[a-z]*$')
+
+
+@contextlib.contextmanager
+def shared_repository(conf):
+    """Share one repository between all the Repository objects created in
+    the block, for instance by a batch of commands. Caches are loaded once,
+    and written once, when the block exits."""
+    rp = Repository(conf)
+    if Repository._shared_state is not None:  # already in a shared block
+        yield rp
+        return
+    Repository._shared_state = rp.__dict__
+    try:
+        yield rp
+    finally:
+        Repository._shared_state = None
+        rp.close()
 
 
 def _base27(n):
@@ -36,14 +71,81 @@ class CiteKeyNotFound(CiteKeyError):
 
 class Repository(object):
 
+    # state of the repository shared by a batch of commands; see shared_repository.
+    _shared_state = None
+
     def __init__(self, conf, create=False):
+        if Repository._shared_state is not None and not create:
+            self.__dict__ = Repository._shared_state
+            return
         self.conf = conf
         self._citekeys = None
+        self._suffixes = {}  # base key -> lowest suffix that may be free
+        self._trigrams = None
+        self._fulltext = None
+        self._texts = None
+        self._pending_docs = set()  # documents whose text is to be extracted
+        self._indexes_synced = True  # indexes were updated with all writes
+        self._reading = 0  # depth of nested reading blocks
         self.databroker = DataCache(self.conf['main']['pubsdir'],
                                     self.conf['main']['docsdir'], create=create)
 
     def close(self):
-        self.databroker.close()
+        if self.__dict__ is Repository._shared_state:
+            return  # closed at the end of the batch
+        self.flush()
+
+    def flush(self):
+        """Write the caches, and release the repository to other processes,
+        that are locked out of it from the first write. The repository may
+        still be used afterwards."""
+        written = self.databroker.close()
+        if written is not None:
+            before, after, citekeys = written
+            if self._indexes_synced:
+                self.trigrams.advance(before, after)
+                self.fulltext.advance(before, after)
+            self._update_completion_snapshot(before, after, citekeys)
+        self._indexes_synced = True
+        for cache in (self._trigrams, self._fulltext, self._texts):
+            if cache is not None:
+                cache.flush()
+        pending = sorted(p for p in self._pending_docs
+                         if self.texts.get(p) is None)  # not extracted since
+        self._pending_docs = set()
+        if pending:
+            extract.extract_in_background(self.databroker.databroker, pending)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Group the changes made to papers in the block: their files are
+        only written, all together, if the block exits without error.
+        Documents added in the block are only copied if it exits without
+        error, and documents and notes moved in it are moved back on error;
+        they are otherwise not part of the transaction."""
+        try:
+            with self.databroker.transaction():
+                yield
+        except BaseException:
+            self._citekeys = self._trigrams = self._fulltext = None
+            self._texts = None
+            self._suffixes = {}
+            self._indexes_synced = False  # changes made before may be lost
+            raise
+
+    @contextlib.contextmanager
+    def reading(self):
+        """Read the papers in the block from one committed state of the
+        repository: the transactions of other processes are only committed
+        once it exits. Keep it short, and do not wait for the user in it."""
+        with self.databroker.lock():
+            if self._reading == 0 and not self.databroker.modified:
+                self._citekeys = None  # may have been listed before a commit
+            self._reading += 1
+            try:
+                yield
+            finally:
+                self._reading -= 1
 
     @property
     def citekeys(self):
@@ -63,10 +165,31 @@ class Repository(object):
         """Warning: costly the first time."""
         return len(self.citekeys)
 
+    @property
+    def trigrams(self):
+        if self._trigrams is None:
+            self._trigrams = index.TrigramIndex(self.databroker.databroker)
+        return self._trigrams
+
+    @property
+    def fulltext(self):
+        if self._fulltext is None:
+            self._fulltext = index.FullTextIndex(
+                self.databroker.databroker, self.conf['main']['note_extension'])
+        return self._fulltext
+
+    @property
+    def texts(self):
+        if self._texts is None:
+            self._texts = extract.TextCache(self.databroker.databroker)
+        return self._texts
+
     # papers
     def all_papers(self):
-        for key in self.citekeys:
-            yield self.pull_paper(key)
+        """Return all the papers, read from one committed state of the
+        repository (see reading)."""
+        with self.reading():
+            return [self.pull_paper(key) for key in self.citekeys]
 
     def citekeys_from_prefix(self, prefix):
         """Return all citekey beginning with prefix."""
@@ -83,6 +206,17 @@ class Repository(object):
         else:
             raise CiteKeyNotFound(citekey)
 
+    def paper_oneliner(self, citekey):
+        """Return the one-line description of a paper, as rendered by
+        pretty.paper_oneliner. Lines are cached until the paper changes."""
+        style = pretty.oneliner_style()
+        stamp = self.databroker.entry_stamp(citekey)
+        line = self.databroker.pull_oneliner(citekey, stamp, style)
+        if line is None:
+            line = pretty.paper_oneliner(self.pull_paper(citekey))
+            self.databroker.push_oneliner(citekey, stamp, style, line)
+        return line
+
     def push_paper(self, paper, overwrite=False, event=True):
         """ Push a paper to disk
 
@@ -94,12 +228,34 @@ class Repository(object):
             raise CiteKeyCollision(paper.citekey)
         if not paper.added:
             paper.added = datetime.now()
-        self.databroker.push_bibentry(paper.citekey, paper.bibentry)
-        self.databroker.push_metadata(paper.citekey, paper.metadata)
+        # files are only written if their content changed, and indexes
+        # only updated for the files written.
+        bib_written = self.databroker.push_bibentry(paper.citekey, paper.bibentry)
+        meta_written = self.databroker.push_metadata(paper.citekey, paper.metadata)
+        if bib_written:
+            self.trigrams.push(paper.citekey, paper.bibdata)
+        if bib_written or (meta_written and (paper.docpath or None)
+                           != self.fulltext.docpath(paper.citekey)):
+            self.fulltext.push(paper.citekey, paper.bibdata,
+                               self._cached_doc_text(paper), paper.docpath)
         self.citekeys.add(paper.citekey)
         if event:
             events.AddEvent(paper.citekey).send()
 
+    def push_metadata(self, paper):
+        """Push the metadata of a paper of the repository, e.g. after a
+        change of its tags, leaving its bibfile as is.
+
+        Returns False if the metadata was unchanged, and not written.
+        """
+        stored = self.databroker.pull_metadata(paper.citekey)
+        if paper.docpath != stored.get('docfile', ''):
+            # the text of the new document must be indexed
+            self.push_paper(paper, overwrite=True, event=False)
+            return True
+        # tags and other metadata are not indexed
+        return self.databroker.push_metadata(paper.citekey, paper.metadata)
+
     def remove_paper(self, citekey, remove_doc=True, event=True):
         """ Remove a paper. Is silent if nothing needs to be done."""
         if event:
@@ -113,8 +269,33 @@ class Repository(object):
             # FIXME: if IOError is about being unable to
             # remove the file, we need to issue an error.
             pass
-        self.citekeys.remove(citekey)
+        self._remove_citekey(citekey)
         self.databroker.remove(citekey)
+        self.trigrams.remove(citekey)
+        self.fulltext.remove(citekey)
+
+    def remove_papers(self, citekeys, remove_doc=True, event=True):
+        """Remove papers together, in a single transaction. Their documents
+        and notes are removed once it is committed, all at once."""
+        citekeys = list(citekeys)
+        if event:
+            for citekey in citekeys:
+                events.RemoveEvent(citekey).send()
+        filepaths = []
+        for citekey in citekeys:
+            if remove_doc:
+                docpath = self.databroker.pull_metadata(citekey).get('docfile')
+                if docpath is not None and self.databroker.in_docsdir(docpath):
+                    filepaths.append(self.databroker.real_docpath(docpath))
+            filepaths.append(self.databroker.real_notepath(
+                citekey, self.conf['main']['note_extension']))
+        with self.transaction():
+            for citekey in citekeys:
+                self._remove_citekey(citekey)
+                self.databroker.remove(citekey)
+                self.trigrams.remove(citekey)
+                self.fulltext.remove(citekey)
+        remove_files(filepaths)
 
     def remove_doc(self, citekey, detach_only=False):
         """ Remove a doc. Is silent if nothing needs to be done."""
@@ -146,6 +327,103 @@ class Repository(object):
         if new_citekey is None:
             new_citekey = paper.citekey
         paper.citekey = new_citekey
+        with self.transaction():
+            self._rename_paper(paper, old_citekey, new_citekey)
+        if old_citekey != new_citekey:
+            events.RenameEvent(paper, old_citekey).send()
+
+    def rename_papers(self, renames):
+        """Rename papers together, in a single transaction, then send their
+        rename events.
+
+        :param renames:  list of (paper, new_citekey). New citekeys may be
+                         the current citekeys of other papers of the list,
+                         even in cycles.
+        :raise CiteKeyCollision: if a new citekey is used by another paper,
+                                 before anything is renamed.
+
+        If renaming fails, the papers, their files, documents and notes are
+        left as they were.
+        """
+        pending = collections.OrderedDict(
+            (paper.citekey, (paper, new_citekey))
+            for paper, new_citekey in renames if paper.citekey != new_citekey)
+        targets = set()
+        for _, new_citekey in pending.values():
+            if new_citekey in targets or (new_citekey in self
+                                          and new_citekey not in pending):
+                msg = "Can't rename paper to {}, citekey already exists.".format(new_citekey)
+                raise CiteKeyCollision(new_citekey, message=msg)
+            targets.add(new_citekey)
+
+        renamed = []
+        origins = {}  # temporary citekey -> original one
+        originals = [(paper, paper.citekey, paper.docpath)
+                     for paper, _ in pending.values()]
+        try:
+            with self.transaction():
+                while pending:
+                    ready = [c for c, (_, new_citekey) in pending.items()
+                             if new_citekey not in pending]
+                    if not ready:  # only cycles left: move a paper out of the way
+                        old_citekey, (paper, new_citekey) = pending.popitem(last=False)
+                        n = 1
+                        while (old_citekey + _base27(n) in self
+                               or old_citekey + _base27(n) in targets):
+                            n += 1
+                        paper.citekey = old_citekey + _base27(n)
+                        self._rename_paper(paper, old_citekey, paper.citekey)
+                        pending[paper.citekey] = (paper, new_citekey)
+                        origins[paper.citekey] = origins.pop(old_citekey, old_citekey)
+                    for old_citekey in ready:
+                        paper, new_citekey = pending.pop(old_citekey)
+                        paper.citekey = new_citekey
+                        self._rename_paper(paper, old_citekey, new_citekey)
+                        renamed.append((paper, origins.pop(old_citekey, old_citekey)))
+        except BaseException:  # the papers are left as they were
+            for paper, citekey, docpath in originals:
+                paper.citekey, paper.docpath = citekey, docpath
+            raise
+        for paper, old_citekey in renamed:
+            events.RenameEvent(paper, old_citekey).send()
+
+    def regenerated_citekeys(self, papers):
+        """Plan new citekeys for papers, generated from their bibdata as
+        for new papers, and made unique with suffixes.
+
+        Papers whose citekey already is the generated one, with or without
+        a suffix, keep it. Papers without author nor editor are skipped.
+
+        :returns:  the list of (paper, new_citekey) of the papers whose
+                   citekey changes, and the list of the skipped papers.
+        """
+        bases = collections.OrderedDict()
+        skipped = []
+        for paper in papers:
+            try:
+                bases[paper.citekey] = (paper, bibstruct.generate_citekey(paper.bibentry))
+            except ValueError:
+                skipped.append(paper)
+        # all citekeys are kept, except those of the papers to rename
+        taken = set(c for c in self.citekeys if c not in bases)
+        to_rename = []
+        for citekey, (paper, base) in bases.items():
+            if citekey.startswith(base) and SUFFIX_RE.match(citekey[len(base):]):
+                taken.add(citekey)
+            else:
+                to_rename.append((paper, base))
+        renames = []
+        suffixes = {}  # base -> first suffix that may be free
+        for paper, base in to_rename:
+            n = suffixes.get(base, 0)
+            while base + _base27(n) in taken:
+                n += 1
+            suffixes[base] = n + 1
+            taken.add(base + _base27(n))
+            renames.append((paper, base + _base27(n)))
+        return renames, skipped
+
+    def _rename_paper(self, paper, old_citekey, new_citekey):
         # check if new_citekey is not the same as paper.citekey
         if old_citekey == new_citekey:
             self.push_paper(paper, overwrite=True, event=False)
@@ -155,9 +433,14 @@ class Repository(object):
                 msg = "Can't rename paper to {}, citekey already exists.".format(new_citekey)
                 raise CiteKeyCollision(new_citekey, message=msg)
 
+            bibdata = self.databroker.pull_bibentry(old_citekey)[old_citekey]
+
             # move doc file if necessary
             if self.databroker.in_docsdir(paper.docpath):
+                old_docpath = paper.docpath
                 paper.docpath = self.databroker.rename_doc(paper.docpath, new_citekey)
+                self.texts.rename(self.databroker.real_docpath(old_docpath),
+                                  self.databroker.real_docpath(paper.docpath))
 
             # move note file if necessary
             try:
@@ -166,11 +449,21 @@ class Repository(object):
             except IOError:
                 pass
 
-            self.push_paper(paper, event=False)
-            # remove_paper of old_citekey
-            self.remove_paper(old_citekey, event=False)
-            # send event
-            events.RenameEvent(paper, old_citekey).send()
+            # files are moved, with their cache and index entries, rather
+            # than written again, unless the paper changed.
+            self.databroker.rename(old_citekey, new_citekey)
+            self._remove_citekey(old_citekey)
+            if paper.bibdata == bibdata:
+                self.databroker.push_bibentry(new_citekey, paper.bibentry)
+                if paper.metadata != self.databroker.pull_metadata(new_citekey):
+                    self.databroker.push_metadata(new_citekey, paper.metadata)
+                self.citekeys.add(new_citekey)
+                self.trigrams.rename(old_citekey, new_citekey)
+                self.fulltext.rename(old_citekey, new_citekey, paper.docpath)
+            else:
+                self.trigrams.remove(old_citekey)
+                self.fulltext.remove(old_citekey)
+                self.push_paper(paper, overwrite=True, event=False)
 
     def push_doc(self, citekey, docfile, copy=None):
         p = self.pull_paper(citekey)
@@ -185,9 +478,99 @@ class Repository(object):
 
     def unique_citekey(self, base_key):
         """Create a unique citekey for a given basekey."""
-        for n in itertools.count():
-            if not base_key + _base27(n) in self.citekeys:
-                return base_key + _base27(n)
+        # suffixes below the indexed one are known to be taken: allocating
+        # many citekeys with the same base key does not probe them again.
+        n = self._suffixes.get(base_key, 0)
+        while base_key + _base27(n) in self.citekeys:
+            n += 1
+        self._suffixes[base_key] = n
+        return base_key + _base27(n)
+
+    def _remove_citekey(self, citekey):
+        self.citekeys.remove(citekey)
+        # its suffix is free again, for any base key it may have
+        start = SUFFIX_RE.search(citekey).start()
+        for i in range(start, len(citekey) + 1):
+            self._suffixes.pop(citekey[:i], None)
+
+    def search(self, query, limit=20):
+        """Return the citekeys of the papers whose title, authors or journal
+        best match the query, ordered by decreasing similarity.
+
+        The query is matched on trigrams, and is thus tolerant to typos.
+        """
+        self._update_index(self.trigrams)
+        return [citekey for citekey, _ in self.trigrams.search(query, limit=limit)]
+
+    def search_text(self, query, limit=20):
+        """Return the citekeys of the papers whose title, abstract or note
+        best match the query words, ordered by decreasing BM25 score."""
+        self._update_fulltext()
+        return [citekey for citekey, _ in self.fulltext.search(query, limit=limit)]
+
+    def update_fulltext(self, citekey):
+        """Reindex the text of a paper, e.g. after its note was edited."""
+        paper = self.pull_paper(citekey)
+        self.fulltext.push(citekey, paper.bibdata, self._cached_doc_text(paper),
+                           paper.docpath)
+
+    def _cached_doc_text(self, paper):
+        """Return the text of the document of a paper if it does not need
+        to be extracted, else None, and the document is then extracted in
+        the background once the repository is flushed."""
+        if paper.docpath is None:
+            return u''
+        docpath = self.databroker.real_docpath(paper.docpath)
+        text = self.texts.get(docpath)
+        if text is None:
+            self._pending_docs.add(docpath)
+        return text
+
+    def _update_fulltext(self, processes=None):
+        """Bring the full-text index up to date, after the background
+        extraction, if any, ends. The text of the documents it did not
+        extract is extracted in parallel. Papers are only checked one by
+        one if the repository changed other than through pubs."""
+        with extract.extraction_lock(self.databroker.databroker):
+            self.texts.refresh()
+        with self.reading():
+            state = self._index_state(self.fulltext)
+            if state is not None and state == self.fulltext.state:
+                outdated = self.fulltext.pending()
+            else:
+                outdated = self.fulltext.outdated(
+                    self.citekeys, docpath=lambda c:
+                    self.databroker.pull_metadata(c).get('docfile'))
+            papers = [self.pull_paper(c) for c in outdated]
+        docpaths = {p.citekey: self.databroker.real_docpath(p.docpath)
+                    for p in papers if p.docpath is not None}
+        texts = self.texts.extract(docpaths.values(), processes=processes)
+        for p in papers:
+            doc_text = texts[docpaths[p.citekey]] if p.citekey in docpaths else u''
+            self.fulltext.push(p.citekey, p.bibdata, doc_text, p.docpath)
+        if state is not None and state != self.fulltext.state:
+            self.fulltext.state = state
+
+    def _index_state(self, idx):
+        """Return the current state of the repository for an index, or None
+        while this process writes to it: the state is only known once the
+        writes are over."""
+        if self.databroker.modified:
+            return None
+        return idx.current_state()
+
+    def _update_index(self, idx):
+        """Bring an index up to date with the content of the repository,
+        checked paper by paper only if it changed other than through pubs."""
+        with self.reading():
+            state = self._index_state(idx)
+            if state is not None and state == idx.state:
+                return
+            for citekey in idx.outdated(self.citekeys):
+                _, bibdata = bibstruct.get_entry(self.databroker.pull_bibentry(citekey))
+                idx.push(citekey, bibdata)
+            if state is not None:
+                idx.state = state
 
     def get_tags(self):
         """FIXME: bibdata doesn't need to be read."""
@@ -195,3 +578,118 @@ class Repository(object):
         for p in self.all_papers():
             tags = tags.union(p.tags)
         return tags
+
+    def completion_snapshot(self):
+        """Return the citekeys, tags, query fields and common field values
+        of the repository, for shell completion.
+
+        The snapshot is cached, and only rebuilt when the repository
+        changed since it was computed, other than through pubs: writers
+        update it with the papers they wrote (see flush).
+        """
+        databroker = self.databroker.databroker
+        fingerprint = databroker.fingerprint()
+        try:
+            snapshot = databroker.pull_cache(SNAPSHOT_CACHE)
+            if snapshot['fingerprint'] == fingerprint:
+                return snapshot
+        except Exception:  # no or bad cache: rebuild it.
+            pass
+        counts = self._completion_counts()
+        if self.databroker.modified:  # the state written is not known yet
+            return _completion_snapshot(counts)
+        with databroker.lock(exclusive=True):
+            return self._push_completion_snapshot(counts, fingerprint)
+
+    def _completion_counts(self):
+        # plain dicts of counts, faster to unpickle than Counters
+        counts = {'papers': {},  # citekey -> completion entry
+                  'tags': {}, 'fields': {},
+                  'values': {field: {} for field in COMPLETION_FIELDS}}
+        for p in self.all_papers():
+            entry = _completion_entry(p)
+            counts['papers'][p.citekey] = entry
+            _count_completion_entry(counts, entry, 1)
+        return counts
+
+    def _push_completion_snapshot(self, counts, fingerprint):
+        databroker = self.databroker.databroker
+        counts['fingerprint'] = fingerprint
+        databroker.push_cache(COMPLETION_COUNTS_CACHE, counts)
+        snapshot = _completion_snapshot(counts)
+        snapshot['fingerprint'] = fingerprint
+        databroker.push_cache(SNAPSHOT_CACHE, snapshot)
+        return snapshot
+
+    def _update_completion_snapshot(self, before, after, citekeys):
+        """Update the completion snapshot with the papers written while the
+        fingerprint of the repository went from `before` to `after`, if it
+        was the snapshot of `before`. Otherwise, it is rebuilt by the next
+        completion.
+
+        :param citekeys:  dict from the citekeys of the papers written to
+                          whether their bibfile was (see FileBroker.close).
+        """
+        databroker = self.databroker.databroker
+        with databroker.lock(exclusive=True):
+            try:
+                snapshot = databroker.pull_cache(SNAPSHOT_CACHE)
+                counts = databroker.pull_cache(COMPLETION_COUNTS_CACHE)
+            except Exception:  # no or bad cache
+                return
+            if not snapshot['fingerprint'] == counts['fingerprint'] == before:
+                return
+            for citekey, bib_written in citekeys.items():
+                entry = counts['papers'].pop(citekey, None)
+                if entry is not None:
+                    _count_completion_entry(counts, entry, -1)
+                if entry is not None and not bib_written:  # e.g. tags changed
+                    tags = set(self.databroker.pull_metadata(citekey).get('tags', []))
+                    entry = (sorted(tags),) + entry[1:]
+                else:
+                    try:
+                        entry = _completion_entry(self.pull_paper(citekey))
+                    except CiteKeyNotFound:  # removed
+                        continue
+                counts['papers'][citekey] = entry
+                _count_completion_entry(counts, entry, 1)
+            self._push_completion_snapshot(counts, after)
+
+
+def _completion_entry(paper):
+    """Return the tags, fields and values of the fields of a paper offered
+    for completion."""
+    values = {}
+    for field in COMPLETION_FIELDS:
+        if field == 'author':
+            values[field] = [bibstruct.author_last(a)
+                             for a in paper.bibdata.get('author', [])]
+        elif paper.bibdata.get(field):
+            value = paper.bibdata[field]
+            if isinstance(value, dict):  # journal
+                value = value.get('name', '')
+            values[field] = [value]
+    return sorted(paper.tags), sorted(paper.bibdata.keys()), values
+
+
+def _count_completion_entry(counts, entry, n):
+    """Add (n=1) or remove (n=-1) the completion entry of a paper."""
+    tags, fields, values = entry
+    counted = [(counts['tags'], tags), (counts['fields'], fields)]
+    counted.extend((counts['values'][field], v) for field, v in values.items())
+    for counter, keys in counted:
+        for key in keys:
+            counter[key] = counter.get(key, 0) + n
+            if counter[key] <= 0:
+                del counter[key]
+
+
+def _completion_snapshot(counts):
+    tags = sorted(counts['tags'])
+    values = {field: sorted(v for v, _ in heapq.nlargest(
+                  COMPLETION_VALUES, c.items(), key=operator.itemgetter(1)))
+              for field, c in counts['values'].items()}
+    values['tag'] = tags
+    return {'citekeys': sorted(counts['papers']), 'tags': tags,
+            'fields': sorted(set(counts['fields']) | set(['tag'])),
+            'values': values}
@@ -2,6 +2,7 @@ from __future__ import print_function
 
 import os
 import sys
+import errno
 import shlex
 import locale
 import codecs
@@ -68,6 +69,14 @@ def _edit_file(editor, path_to_file, temporary=True):
         subprocess.call(cmd)
 
 
+def _close_stdout():
+    """Redirect stdout to /dev/null, once its reader went away, so that
+    flushing it at exit does not fail again."""
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    os.close(devnull)
+
+
 def get_ui():
     if _ui is None:
         return PrintUI(config.load_default_conf()) # no editor support. (#FIXME?)
@@ -93,11 +102,45 @@ class PrintUI(object):
         self._stderr  = codecs.getwriter(self.encoding)(_get_raw_stderr(),
                                                         errors='replace')
         self.debug = conf['main'].get('debug', False)
+        self.pager_cmd = conf['main'].get('pager_cmd', '')
 
     def message(self, *messages, **kwargs):
         kwargs['file'] = self._stdout
         print(*messages, **kwargs)
 
+    def message_lines(self, lines, page=False):
+        """Print lines as they are produced, rather than all at once.
+
+        :param page: if True, and a pager is configured, lines are sent to
+                     the pager when stdout is a terminal.
+
+        Output stops silently when the reader goes away, as with
+        `pubs list | head`.
+        """
+        out, pager = self._stdout, None
+        if page and self.pager_cmd and sys.stdout.isatty():
+            pager = subprocess.Popen(shlex.split(self.pager_cmd),
+                                     stdin=subprocess.PIPE)
+            out = codecs.getwriter(self.encoding)(pager.stdin, errors='replace')
+        try:
+            try:
+                for line in lines:
+                    out.write(line)
+                    out.write(u'\n')
+                out.flush()
+            finally:
+                if pager is not None:
+                    try:
+                        pager.stdin.close()
+                    except (IOError, OSError):  # the pager was quit early
+                        pass
+                    pager.wait()
+        except (IOError, OSError) as e:
+            if e.errno != errno.EPIPE:
+                raise
+            if pager is None:
+                _close_stdout()
+
     def info(self, message, **kwargs):
         kwargs['file'] = self._stdout
         print(u'{}: {}'.format(color.dye_out('info', 'ok'), message), **kwargs)
@@ -118,6 +161,9 @@ class PrintUI(object):
 
         :returns: True if exception has been handled (currently never happens)
         """
+        if getattr(exc, 'errno', None) == errno.EPIPE:  # reader went away
+            _close_stdout()
+            self.exit()
         if (not DEBUG) and (not self.debug):
             self.error(ustr(exc))
             self.exit()
@@ -10,6 +10,8 @@ from .__init__ import __version__
 
 def update_check(conf, path=None):
     """Runs an update if necessary, and return True in that case."""
+    if conf.get('internal', {}).get('version') == __version__:
+        return False  # the common case: the configuration is up to date.
 
     code_version = __version__.split('.')
     try:
@@ -88,7 +90,7 @@ def update(conf, code_version, repo_version, path=None):
         default_conf['internal']['version'] = '.'.join(code_version)
 
         # comparing potential changes
-        with open(path, 'r') as f:
+        with open(path, 'rb') as f:
             old_conf_text = f.read()
         new_conf_text = io.BytesIO()
         default_conf.write(outfile=new_conf_text)
@@ -1,12 +1,22 @@
 # Function here may belong somewhere else. In the mean time...
 
+import os
+import sys
+
 from . import color
 from . import pretty
+from .p3 import pickle
+
+
+# set to False to run background tasks on demand only, in the current command.
+BACKGROUND = True
 
 def resolve_citekey(repo, citekey, ui=None, exit_on_fail=True):
     """Check that a citekey exists, or autocompletes it if not ambiguous."""
     """ :returns found citekey """
     # FIXME. Make me optionally non ui interactive/exiting
+    if citekey in repo.citekeys:  # no need to look for completions
+        return citekey
     citekeys = repo.citekeys_from_prefix(citekey)
     if len(citekeys) == 0:
         if ui is not None:
@@ -44,3 +54,80 @@ def resolve_citekey_list(repo, citekeys, ui=None, exit_on_fail=True):
         ui.exit()
     else:
         return keys
+
+
+def imap_in_pool(fun, jobs, processes=None):
+    """Map fun over jobs in a pool of worker processes, yielding results as
+    they become available, in no particular order.
+
+    Falls back to mapping in the current process for a single job, if
+    processes is 1, or if a pool is not available on this platform (e.g.
+    no working semaphores).
+    """
+    pool = None
+    if processes != 1 and len(jobs) > 1:
+        import multiprocessing
+        try:
+            pool = multiprocessing.Pool(processes)
+        except (OSError, ImportError):
+            pass
+    if pool is None:
+        for job in jobs:
+            yield fun(job)
+        return
+    try:
+        for result in pool.imap_unordered(fun, jobs):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def pubs_env(env=None):
+    """Return a copy of an environment (by default, the current one), for
+    python processes importing modules from the same paths as the current
+    one."""
+    env = dict(os.environ if env is None else env)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in sys.path if p)
+    return env
+
+
+def run_in_background(module, function, *args):
+    """Call a function of a pubs module in a new process, that outlives the
+    current one, and return at once.
+
+    The arguments are pickled: objects must be instances of classes defined
+    at the top level of a module. The process imports modules from the
+    same paths as the current one.
+
+    :returns:  False if background tasks are disabled, or the process could
+               not be started.
+    """
+    if not BACKGROUND:
+        return False
+    import subprocess
+    kwargs = {}
+    if hasattr(os, 'setsid'):  # not killed with the terminal of the command
+        kwargs['preexec_fn'] = os.setsid
+    else:
+        kwargs['creationflags'] = 0x00000008  # DETACHED_PROCESS, on Windows
+    try:
+        task = pickle.dumps((module, function, args), protocol=2)
+        with open(os.devnull, 'w') as devnull:
+            p = subprocess.Popen(
+                [sys.executable, '-c', 'from pubs import utils; utils._background()'],
+                stdin=subprocess.PIPE, stdout=devnull, stderr=devnull,
+                env=pubs_env(), close_fds=True, **kwargs)
+        p.stdin.write(task)
+        p.stdin.close()
+    except Exception:  # the task will be done on demand.
+        return False
+    return True
+
+
+def _background():
+    """Entry point of the processes started by run_in_background."""
+    import importlib
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    module, function, args = pickle.load(stdin)
+    getattr(importlib.import_module('pubs.' + module), function)(*args)
@@ -23,8 +23,9 @@ setup(
                         'configobj',
                         'beautifulsoup4'], # to be made optional?
     tests_require = ['pyfakefs>=2.7'],
-    extra_require = {'autocompletion': ['argcomplete'],
-                     },
+    extras_require = {'autocompletion': ['argcomplete'],
+                      'pdf': ['pdfminer.six'],
+                      },
 
     classifiers=[
         'Development Status :: 4 - Beta',
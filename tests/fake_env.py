@@ -9,7 +9,7 @@ import dotdot
 from pyfakefs import fake_filesystem, fake_filesystem_unittest
 
 from pubs.p3 import input, _fake_stdio, _get_fake_stdio_ucontent
-from pubs import content, filebroker
+from pubs import content, filebroker, lock, utils
 
 # code for fake fs
 
@@ -94,6 +94,13 @@ class TestFakeFs(fake_filesystem_unittest.TestCase):
         self.setUpPyfakefs()
         self.fs.CreateDirectory(self.rootpath)
         os.chdir(self.rootpath)
+        # file locks need real file descriptors
+        self._fcntl, lock.fcntl = lock.fcntl, None
+        self.addCleanup(setattr, lock, 'fcntl', self._fcntl)
+        self.addCleanup(lock._locks.clear)
+        # background processes do not see the fake filesystem
+        self._background, utils.BACKGROUND = utils.BACKGROUND, False
+        self.addCleanup(setattr, utils, 'BACKGROUND', self._background)
 
     def reset_fs(self):
         self._stubber.tearDown()  # renew the filesystem
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import dotdot
+
+from pubs import completion
+
+
+SNAPSHOT = {'citekeys': ['Doe2013', 'Page99'],
+            'tags': ['ml', 'network', 'vision'],
+            'fields': ['author', 'journal', 'tag', 'title', 'year'],
+            'values': {'author': ['Brin', 'Doe', 'Page'],
+                       'year': ['1999', '2013'],
+                       'tag': ['ml', 'network', 'vision']}}
+
+
+def fake_snapshot(completer_class):
+
+    class FakeCompleter(completer_class):
+
+        def _snapshot(self):
+            return SNAPSHOT
+
+    return FakeCompleter(None)
+
+
+class TestCompleters(unittest.TestCase):
+
+    def test_citekeys(self):
+        completer = fake_snapshot(completion.CiteKeyCompletion)
+        self.assertEqual(completer(prefix=''), ['Doe2013', 'Page99'])
+
+    def test_citekeys_or_tags(self):
+        completer = fake_snapshot(completion.CiteKeyOrTagCompletion)
+        self.assertEqual(len(completer(prefix='')), 5)
+
+    def test_tag_modifiers(self):
+        completer = fake_snapshot(completion.TagModifierCompletion)
+        self.assertEqual(completer(prefix='+ml-v'), ['+ml-vision'])
+
+    def test_query_fields(self):
+        completer = fake_snapshot(completion.QueryCompletion)
+        self.assertEqual(completer(prefix='t'), ['tag:', 'title:'])
+
+    def test_query_values(self):
+        completer = fake_snapshot(completion.QueryCompletion)
+        self.assertEqual(completer(prefix='author:p'), ['author:Page'])
+        self.assertEqual(completer(prefix='a:'),
+                         ['a:Brin', 'a:Doe', 'a:Page'])
+        self.assertEqual(completer(prefix='tags:n'), ['tags:network'])
+        self.assertEqual(completer(prefix='title:'), [])
+
+    def test_query_option(self):
+        completer = fake_snapshot(completion.QueryOptionCompletion)
+        self.assertEqual(completer(prefix='ye'), ['year:'])
+        self.assertEqual(completer(prefix='year:1999 author:p'),
+                         ['year:1999 author:Page'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,71 @@
 import unittest
 
 import dotdot
+import fake_env
+import configobj  # loaded lazily by pubs: imported for the fake filesystem
 from pubs.config import conf
+from pubs import update
+
+
+class TestConfCache(fake_env.TestFakeFs):
+
+    def setUp(self):
+        super(TestConfCache, self).setUp()
+        self.path = 'pubsrc'
+        default_conf = conf.load_default_conf()
+        default_conf['main']['pubsdir'] = '/pubs'
+        conf.save_conf(default_conf, path=self.path)
+
+    def test_cached(self):
+        first = conf.load_conf(path=self.path)
+        self.assertNotIsInstance(first, conf.CachedConf)
+        second = conf.load_conf(path=self.path)
+        self.assertIsInstance(second, conf.CachedConf)
+        self.assertEqual(second, first.dict())
+        self.assertEqual(second.filename, self.path)
+        self.assertEqual(second['main']['pubsdir'], '/pubs')
+        self.assertIs(second['formating']['color'], True)
+
+    def test_modified_conf(self):
+        conf.load_conf(path=self.path)
+        with open(self.path) as f:
+            text = f.read()
+        with open(self.path, 'w') as f:
+            f.write(text.replace('/pubs', '/pubs/repository'))
+        c = conf.load_conf(path=self.path)
+        self.assertNotIsInstance(c, conf.CachedConf)
+        self.assertEqual(c['main']['pubsdir'], '/pubs/repository')
+
+    def test_new_version(self):
+        conf.load_conf(path=self.path)
+        version = conf.__version__
+        try:
+            conf.__version__ = '100.0.0'
+            c = conf.load_conf(path=self.path)
+        finally:
+            conf.__version__ = version
+        self.assertNotIsInstance(c, conf.CachedConf)
+
+    def test_save_cached_conf(self):
+        conf.load_conf(path=self.path)
+        c = conf.load_conf(path=self.path)
+        c['main']['pubsdir'] = '/other'
+        conf.save_conf(c)
+        self.assertEqual(conf.load_conf(path=self.path)['main']['pubsdir'],
+                         '/other')
+
+    def test_post_process_cached_conf(self):
+        conf.load_conf(path=self.path)
+        c = conf.load_conf(path=self.path)
+        c['main']['docsdir'] = 'docsdir://'  # as set by `pubs init`
+        c = conf.post_process_conf(c)
+        self.assertEqual(c['main']['docsdir'], '/pubs/doc')
+        self.assertEqual(c.filename, self.path)
+
+    def test_update_check_skipped(self):
+        conf.load_conf(path=self.path)
+        c = conf.load_conf(path=self.path)
+        self.assertFalse(update.update_check(c, path=self.path))
 
 # class TestConfig(unittest.TestCase):
 #
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Runs a daemon in a separate process, on the real filesystem."""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import dotdot
+
+from pubs import daemon
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'pubs', 'pubs')
+
+# forward a command, and report if the daemon took it.
+FORWARD = """
+import sys
+from pubs import daemon
+status = daemon.forward(['pubs'] + sys.argv[1:])
+sys.stderr.write('\\nSTATUS {}\\n'.format(status))
+"""
+
+
+class TestParseArgs(unittest.TestCase):
+
+    def setUp(self):
+        self.pubsconf = os.environ.pop('PUBSCONF', None)
+
+    def tearDown(self):
+        os.environ.pop('PUBSCONF', None)
+        if self.pubsconf is not None:
+            os.environ['PUBSCONF'] = self.pubsconf
+
+    def test_default(self):
+        self.assertEqual(daemon._parse_args(['list', '-k']),
+                         ('~/.pubsrc', 'list'))
+        self.assertEqual(daemon._parse_args([]), ('~/.pubsrc', None))
+
+    def test_config_option(self):
+        for args in (['-c', 'rc', 'list'], ['--config', 'rc', 'list'],
+                     ['--config=rc', 'list'], ['-crc', 'list'],
+                     ['--force-colors', '-c', 'rc', 'list', '-c', 'other']):
+            self.assertEqual(daemon._parse_args(args), ('rc', 'list'))
+
+    def test_environment(self):
+        os.environ['PUBSCONF'] = 'rc'
+        self.assertEqual(daemon._parse_args(['list']), ('rc', 'list'))
+
+    def test_socket_path(self):
+        self.assertEqual(daemon.socket_path('/tmp/rc'), '/tmp/rc.sock')
+
+
+@unittest.skipUnless(daemon.supported(), 'file descriptors cannot be passed')
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.env = dict(os.environ, HOME=self.home, PYTHONPATH=ROOT)
+        self.env.pop('PUBSCONF', None)
+        self.env.pop('_ARGCOMPLETE', None)
+        self.pubs('init')
+        self.pubs('import', os.path.join(ROOT, 'tests', 'data'))
+        self.pubs('daemon', 'start')
+
+    def tearDown(self):
+        self.pubs('daemon', 'stop')
+        shutil.rmtree(self.home)
+
+    def pubs(self, *args):
+        """Run pubs, return its exit status and output."""
+        p = subprocess.Popen([sys.executable, SCRIPT] + list(args),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             cwd=self.home, env=self.env)
+        out, err = p.communicate()
+        return p.returncode, out.decode('utf-8'), err.decode('utf-8')
+
+    def forward(self, *args):
+        """Forward a command to the daemon; return its status and output."""
+        p = subprocess.Popen([sys.executable, '-c', FORWARD] + list(args),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             cwd=self.home, env=self.env)
+        out, err = p.communicate()
+        lines = err.decode('utf-8').strip().splitlines()
+        self.assertTrue(lines[-1].startswith('STATUS '), msg=err)
+        return lines[-1].split()[1], out.decode('utf-8'), '\n'.join(lines[:-1])
+
+    def test_status(self):
+        status, out, _ = self.pubs('daemon', 'status')
+        self.assertEqual(status, 0)
+        self.assertIn('pubs daemon running', out)
+        self.assertTrue(os.path.exists(
+            daemon.socket_path(os.path.join(self.home, '.pubsrc'))))
+
+    def test_forward(self):
+        status, out, _ = self.forward('list', '-k')
+        self.assertEqual(status, '0')
+        self.assertEqual(out, self.pubs('list', '-k')[1])
+        self.assertIn('Page99', out.split())
+
+    def test_exit_status(self):
+        status, _, err = self.forward('edit', 'nokey')
+        self.assertEqual(status, '1')
+        self.assertIn('nokey', err)
+
+    def test_sees_changes(self):
+        self.forward('tag', 'Page99', 'daemon')
+        self.assertEqual(self.forward('list', '-k', 'tag:daemon')[1], 'Page99\n')
+        self.pubs('remove', '-f', 'Page99')
+        self.assertEqual(self.forward('list', '-k', 'tag:daemon')[1], '')
+
+    def test_local_commands(self):
+        self.assertEqual(self.forward('daemon', 'status')[0], 'None')
+
+    def test_stop(self):
+        self.assertEqual(self.pubs('daemon', 'stop')[0], 0)
+        self.assertFalse(os.path.exists(
+            daemon.socket_path(os.path.join(self.home, '.pubsrc'))))
+        self.assertEqual(self.forward('list')[0], 'None')
+        self.assertEqual(self.pubs('daemon', 'status')[1].strip(),
+                         'No pubs daemon is running.')
+
+
+if __name__ == '__main__':
+    unittest.main()
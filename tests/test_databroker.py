@@ -72,5 +72,33 @@ class TestDataBroker(fake_env.TestFakeFs):
             db.remove_doc('docsdir://Page99.pdf')
 
 
+class TestCachesInMemory(fake_env.TestFakeFs):
+
+    def setUp(self):
+        super(TestCachesInMemory, self).setUp()
+        databroker.keep_caches_in_memory()
+        self.db = databroker.DataBroker('tmp', 'tmp/doc', create=True)
+
+    def tearDown(self):
+        databroker._memory = None
+        super(TestCachesInMemory, self).tearDown()
+
+    def test_shared_between_brokers(self):
+        self.db.push_cache('somecache', {'a': 1})
+        data = databroker.DataBroker('tmp', 'tmp/doc').pull_cache('somecache')
+        self.assertEqual(data, {'a': 1})
+        self.assertIs(self.db.pull_cache('somecache'), data)
+
+    def test_modified_file(self):
+        self.db.push_cache('somecache', {'a': 1})
+        self.db.filebroker.push_cachefile('somecache',
+                                          databroker.pickle.dumps({'b': 22}))
+        self.assertEqual(self.db.pull_cache('somecache'), {'b': 22})
+
+    def test_missing_file(self):
+        with self.assertRaises(OSError):
+            self.db.pull_cache('nocache')
+
+
 if __name__ == '__main__':
     unittest.main()
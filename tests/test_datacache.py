@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
-import unittest
+import copy
 import time
+import unittest
+import contextlib
 
 import dotdot
 import fake_env
 
-from pubs.datacache import CacheEntrySet
+from pubs.datacache import CacheEntry, CacheEntrySet, QueryCache, OnelinerCache
 
 
 class FakeFileBrokerMeta(object):
@@ -144,5 +146,219 @@ class TestCacheEntrySet(unittest.TestCase):
         self.assertFalse(self.metacache._is_outdated('a'))
 
 
+class FakeDataBrokerQuery(object):
+
+    def __init__(self):
+        self.fingerprint_value = 0
+        self.caches = {}
+
+    def fingerprint(self):
+        return self.fingerprint_value
+
+    def pull_cache(self, name):
+        return copy.deepcopy(self.caches[name])  # as if unpickled
+
+    def push_cache(self, name, data):
+        self.caches[name] = copy.deepcopy(data)
+
+    @contextlib.contextmanager
+    def lock(self, exclusive=False):
+        yield
+
+
+class FakeDataBrokerMetaCache(FakeDataBrokerQuery, FakeDataBrokerMeta):
+    pass
+
+
+class TestCacheEntrySetMerge(unittest.TestCase):
+
+    def setUp(self):
+        self.databroker = FakeDataBrokerMetaCache()
+        self.databroker.filebroker = FakeFileBrokerMeta()
+        self.databroker.filebroker.mtime = 1
+        self.databroker.caches['metacache'] = {'a': CacheEntry('a', 1),
+                                               'b': CacheEntry('b', 1)}
+        self.mine = CacheEntrySet(self.databroker, 'metacache')
+        self.theirs = CacheEntrySet(self.databroker, 'metacache')
+        self.mine.entries, self.theirs.entries  # both read before any flush
+
+    def test_flush_merges(self):
+        self.mine.push_to_cache('c', 'c')
+        self.theirs.push_to_cache('d', 'd')
+        self.theirs.remove_from_cache('a')
+        self.theirs.flush()
+        self.mine.flush()
+        entries = CacheEntrySet(self.databroker, 'metacache').entries
+        self.assertEqual(sorted(entries), ['b', 'c', 'd'])
+        self.assertEqual(sorted(self.mine.entries), ['b', 'c', 'd'])
+
+    def test_flush_keeps_more_recent(self):
+        self.databroker.filebroker.mtime = 3
+        self.theirs.push_to_cache('b', 'new')
+        self.theirs.flush()
+        self.databroker.filebroker.mtime = 2
+        self.mine.push_to_cache('b', 'old')
+        self.mine.flush()
+        entries = CacheEntrySet(self.databroker, 'metacache').entries
+        self.assertEqual(entries['b'].data, 'new')
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.databroker = FakeDataBrokerQuery()
+        self.querycache = QueryCache(self.databroker)
+
+    def test_pull_push(self):
+        self.assertIsNone(self.querycache.pull('q'))
+        self.querycache.push('q', ['a', 'b'])
+        self.assertEqual(self.querycache.pull('q'), ['a', 'b'])
+        self.assertIsNone(self.querycache.pull('r'))
+
+    def test_flush(self):
+        self.querycache.pull('q')
+        self.querycache.push('q', ['a', 'b'])
+        self.querycache.flush()
+        other = QueryCache(self.databroker)
+        self.assertEqual(other.pull('q'), ['a', 'b'])
+
+    def test_flush_merges(self):
+        other = QueryCache(self.databroker)
+        self.querycache.pull('q')
+        self.querycache.push('q', ['a'])
+        other.pull('r')
+        other.push('r', ['b'])
+        other.flush()
+        self.querycache.flush()
+        merged = QueryCache(self.databroker)
+        self.assertEqual(merged.pull('q'), ['a'])
+        self.assertEqual(merged.pull('r'), ['b'])
+
+    def test_flush_other_fingerprint(self):
+        other = QueryCache(self.databroker)
+        other.pull('r')
+        other.push('r', ['b'])
+        other.flush()
+        self.databroker.fingerprint_value = 1
+        self.querycache.pull('q')
+        self.querycache.push('q', ['a'])
+        self.querycache.flush()
+        merged = QueryCache(self.databroker)
+        self.assertEqual(merged.pull('q'), ['a'])
+        self.assertIsNone(merged.pull('r'))
+
+    def test_fingerprint_change(self):
+        self.querycache.pull('q')
+        self.querycache.push('q', ['a', 'b'])
+        self.databroker.fingerprint_value = 1
+        self.assertIsNone(self.querycache.pull('q'))
+
+    def test_invalidate(self):
+        self.querycache.pull('q')
+        self.querycache.push('q', ['a', 'b'])
+        self.querycache.invalidate()
+        self.assertIsNone(self.querycache.pull('q'))
+
+    def test_lru_eviction(self):
+        self.querycache.max_entries = 2
+        self.querycache.pull('q1')
+        self.querycache.push('q1', ['a'])
+        self.querycache.push('q2', ['b'])
+        self.querycache.pull('q1')
+        self.querycache.push('q3', ['c'])
+        self.assertIsNone(self.querycache.pull('q2'))
+        self.assertEqual(self.querycache.pull('q1'), ['a'])
+        self.assertEqual(self.querycache.pull('q3'), ['c'])
+
+    def test_hit_not_modified(self):
+        self.querycache.pull('q')
+        self.querycache.push('q', ['a'])
+        self.querycache.flush()
+        other = QueryCache(self.databroker)
+        self.assertEqual(other.pull('q'), ['a'])
+        self.assertFalse(other.modified)
+
+    def test_hit_order_flushed_with_push(self):
+        self.querycache.max_entries = 2
+        self.querycache.pull('q1')
+        self.querycache.push('q1', ['a'])
+        self.querycache.push('q2', ['b'])
+        self.querycache.flush()
+        other = QueryCache(self.databroker)
+        other.max_entries = 2
+        other.pull('q1')
+        other.push('q3', ['c'])
+        other.flush()
+        merged = QueryCache(self.databroker)
+        self.assertIsNone(merged.pull('q2'))
+        self.assertEqual(merged.pull('q1'), ['a'])
+
+    def test_size_cap(self):
+        self.querycache.max_citekeys = 3
+        self.querycache.pull('q1')
+        self.querycache.push('q1', ['a', 'b'])
+        self.querycache.push('q2', ['c', 'd'])
+        self.querycache.push('q3', ['a', 'b', 'c', 'd'])
+        self.assertIsNone(self.querycache.pull('q1'))
+        self.assertIsNone(self.querycache.pull('q3'))
+        self.assertEqual(self.querycache.pull('q2'), ['c', 'd'])
+
+
+
+class TestOnelinerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.databroker = FakeDataBrokerQuery()
+        self.cache = OnelinerCache(self.databroker)
+
+    def test_pull_push(self):
+        self.assertIsNone(self.cache.pull('a', 1, 'style'))
+        self.cache.push('a', 1, 'style', 'line')
+        self.assertEqual(self.cache.pull('a', 1, 'style'), 'line')
+        self.assertIsNone(self.cache.pull('b', 1, 'style'))
+
+    def test_outdated_stamp(self):
+        self.cache.push('a', 1, 'style', 'line')
+        self.assertIsNone(self.cache.pull('a', 2, 'style'))
+
+    def test_styles(self):
+        self.cache.max_styles = 2
+        self.cache.push('a', 1, 'plain', 'line')
+        self.cache.push('a', 1, 'color', 'colored line')
+        self.assertEqual(self.cache.pull('a', 1, 'plain'), 'line')
+        self.assertEqual(self.cache.pull('a', 1, 'color'), 'colored line')
+        self.cache.push('a', 1, 'other', 'other line')
+        self.assertIsNone(self.cache.pull('a', 1, 'plain'))
+
+    def test_remove(self):
+        self.cache.push('a', 1, 'style', 'line')
+        self.cache.remove('a')
+        self.assertIsNone(self.cache.pull('a', 1, 'style'))
+
+    def test_flush(self):
+        self.cache.push('a', 1, 'style', 'line')
+        self.cache.flush()
+        self.assertFalse(self.cache.modified)
+        other = OnelinerCache(self.databroker)
+        self.assertEqual(other.pull('a', 1, 'style'), 'line')
+
+    def test_flush_merges(self):
+        self.cache.push('a', 1, 'style', 'line a')
+        self.cache.push('b', 1, 'style', 'line b')
+        self.cache.flush()
+        other = OnelinerCache(self.databroker)
+        other.data
+        self.cache.remove('a')
+        self.cache.push('c', 1, 'style', 'line c')
+        other.push('d', 1, 'plain', 'line d')
+        self.cache.flush()
+        other.flush()
+        merged = OnelinerCache(self.databroker)
+        self.assertIsNone(merged.pull('a', 1, 'style'))
+        self.assertEqual(merged.pull('b', 1, 'style'), 'line b')
+        self.assertEqual(merged.pull('c', 1, 'style'), 'line c')
+        self.assertEqual(merged.pull('d', 1, 'plain'), 'line d')
+
+
 if __name__ == '__main__':
     unittest.main()
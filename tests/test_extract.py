@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+import dotdot
+import fake_env
+
+from pubs import content
+from pubs import extract
+
+
+class FakeDataBroker(object):
+
+    def __init__(self):
+        self.caches = {}
+
+    def pull_cache(self, name):
+        return self.caches[name]
+
+    def push_cache(self, name, data):
+        self.caches[name] = data
+
+    @contextlib.contextmanager
+    def lock(self, exclusive=False):
+        yield
+
+
+class UpperExtractor(extract.Extractor):
+
+    extensions = ('.up',)
+
+    def extract(self, path):
+        return content.read_text_file(path).upper()
+
+
+class CountingExtractor(extract.PlainTextExtractor):
+
+    extensions = ('.txt',)
+
+    def __init__(self):
+        self.calls = 0
+
+    def extract(self, path):
+        self.calls += 1
+        return super(CountingExtractor, self).extract(path)
+
+
+class TestExtractors(fake_env.TestFakeFs):
+
+    def test_plain_text(self):
+        content.write_file('doc.txt', u'Étude des chaînes')
+        self.assertEqual(extract.get_extractor('doc.txt').extract('doc.txt'),
+                         u'Étude des chaînes')
+
+    def test_postscript(self):
+        content.write_file('doc.ps',
+                           u'%!PS\n(Hello) show (\\(nested\\) w\\157rld) show\n')
+        self.assertEqual(extract.get_extractor('doc.ps').extract('doc.ps'),
+                         u'Hello (nested) world')
+
+    def test_no_extractor(self):
+        self.assertIsNone(extract.get_extractor('doc.djvu'))
+
+    def test_register_extractor(self):
+        extractor = CountingExtractor()
+        extract.register_extractor(extractor)
+        try:
+            self.assertIs(extract.get_extractor('doc.TXT'), extractor)
+        finally:
+            extract._extractors.remove(extractor)
+
+
+class TestTextCache(fake_env.TestFakeFs):
+
+    def setUp(self):
+        super(TestTextCache, self).setUp()
+        self.extractor = CountingExtractor()
+        extract.register_extractor(self.extractor)
+        content.write_file('a.txt', u'Some text')
+        content.write_file('b.ps', u'(More) show')
+        self.databroker = FakeDataBroker()
+        self.cache = extract.TextCache(self.databroker)
+
+    def tearDown(self):
+        extract._extractors.remove(self.extractor)
+        super(TestTextCache, self).tearDown()
+
+    def test_extract(self):
+        texts = self.cache.extract(['a.txt', 'b.ps', 'c.djvu'], processes=1)
+        self.assertEqual(texts, {'a.txt': u'Some text', 'b.ps': u'More',
+                                 'c.djvu': u''})
+
+    def test_get(self):
+        self.assertIsNone(self.cache.get('a.txt'))
+        self.assertEqual(self.cache.get('c.djvu'), u'')
+        self.cache.extract(['a.txt'])
+        self.assertEqual(self.cache.get('a.txt'), u'Some text')
+
+    def test_cached(self):
+        self.cache.extract(['a.txt'])
+        self.cache.flush()
+        other = extract.TextCache(self.databroker)
+        self.assertEqual(other.extract(['a.txt']), {'a.txt': u'Some text'})
+        self.assertEqual(self.extractor.calls, 1)
+
+    def test_touched_but_unchanged(self):
+        self.cache.extract(['a.txt'])
+        os.utime('a.txt', (0, 0))
+        self.assertIsNone(self.cache.get('a.txt'))
+        self.assertEqual(self.cache.extract(['a.txt']), {'a.txt': u'Some text'})
+        self.assertEqual(self.extractor.calls, 1)
+        self.assertEqual(self.cache.get('a.txt'), u'Some text')
+
+    def test_modified(self):
+        self.cache.extract(['a.txt'])
+        content.write_file('a.txt', u'Some other text')
+        self.assertEqual(self.cache.extract(['a.txt']),
+                         {'a.txt': u'Some other text'})
+        self.assertEqual(self.extractor.calls, 2)
+
+    def test_flush_merges(self):
+        self.cache.extract(['a.txt'])
+        self.cache.flush()
+        other = extract.TextCache(self.databroker)
+        other.extract(['b.ps'])
+        self.cache.rename('a.txt', 'c.txt')
+        other.flush()
+        self.cache.flush()
+        merged = extract.TextCache(self.databroker)
+        self.assertEqual(sorted(merged.entries), ['b.ps', 'c.txt'])
+
+    def test_job_extractor(self):
+        content.write_file('doc.up', u'Shout')
+        path, entry = extract._extract(('doc.up', None, UpperExtractor()))
+        self.assertEqual(entry.text, u'SHOUT')
+
+    def test_removed(self):
+        self.cache.extract(['a.txt'])
+        os.remove('a.txt')
+        self.assertIsNone(self.cache.get('a.txt'))
+        self.assertNotIn('a.txt', self.cache.entries)
+        self.assertEqual(self.cache.extract(['a.txt']), {'a.txt': u''})
+
+
+class TestParallelExtraction(unittest.TestCase):
+    """Runs on the real filesystem, since workers are separate processes."""
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.paths = []
+        for i in range(8):
+            path = os.path.join(self.tmpdir, 'doc{}.txt'.format(i))
+            with open(path, 'w') as f:
+                f.write('document number {}'.format(i))
+            self.paths.append(path)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def test_pool(self):
+        cache = extract.TextCache(FakeDataBroker())
+        texts = cache.extract(self.paths, processes=2)
+        self.assertEqual(texts, {path: u'document number {}'.format(i)
+                                 for i, path in enumerate(self.paths)})
+        self.assertEqual(len(cache.entries), 8)
+
+
+class TestBackgroundExtraction(unittest.TestCase):
+    """Runs on the real filesystem, since the extraction runs in a separate
+    process."""
+
+    def setUp(self):
+        from pubs.databroker import DataBroker
+        self.tmpdir = tempfile.mkdtemp()
+        self.databroker = DataBroker(os.path.join(self.tmpdir, 'pubs'),
+                                     os.path.join(self.tmpdir, 'doc'),
+                                     create=True)
+        self.extractor = UpperExtractor()
+        extract.register_extractor(self.extractor)
+
+    def tearDown(self):
+        extract._extractors.remove(self.extractor)
+        shutil.rmtree(self.tmpdir)
+
+    def test_registered_extractor(self):
+        path = os.path.join(self.tmpdir, 'doc.up')
+        content.write_file(path, u'in the background')
+        self.assertTrue(extract.extract_in_background(self.databroker, [path]))
+        for _ in range(200):
+            text = extract.TextCache(self.databroker).get(path)
+            if text is not None:
+                break
+            time.sleep(0.05)
+        self.assertEqual(text, u'IN THE BACKGROUND')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,11 @@ import fake_env
 from pubs import content, filebroker
 
 
+def listdir(path):
+    """Files of a directory, without the staging directory of transactions."""
+    return [f for f in os.listdir(path) if f != filebroker.STAGING_DIR]
+
+
 class TestFileBroker(fake_env.TestFakeFs):
 
     def test_pushpull1(self):
@@ -68,6 +73,142 @@ class TestFileBroker(fake_env.TestFakeFs):
             self.assertEqual(fb.pull_metafile('citekey1'), 'defg')
         self.assertFalse(fb.exists('citekey1'))
 
+    def test_unchanged_content_not_written(self):
+
+        fb = filebroker.FileBroker('testrepo', create = True)
+        self.assertTrue(fb.push_bibfile('citekey1', 'abc'))
+        fb.close()
+        mtime = fb.mtime_bibfile('citekey1')
+        fingerprint = fb.fingerprint()
+
+        fb = filebroker.FileBroker('testrepo')
+        self.assertFalse(fb.push_bibfile('citekey1', 'abc'))
+        self.assertEqual(fb.mtime_bibfile('citekey1'), mtime)
+        fb.close()
+        self.assertEqual(fb.fingerprint(), fingerprint)
+        self.assertTrue(fb.push_bibfile('citekey1', 'abcd'))
+        self.assertEqual(fb.pull_bibfile('citekey1'), 'abcd')
+
+    def test_no_temporary_files_left(self):
+
+        fb = filebroker.FileBroker('testrepo', create = True)
+        fb.push_bibfile('citekey1', 'abc')
+        fb.push_bibfile('citekey1', 'abcd')
+        self.assertEqual(listdir('testrepo/bib'), ['citekey1.bib'])
+
+    def test_transaction(self):
+
+        fb = filebroker.FileBroker('testrepo', create = True)
+        fb.push_bibfile('citekey1', 'abc')
+        fb.push_metafile('citekey1', 'abc')
+        with fb.transaction():
+            fb.push_bibfile('citekey2', 'def')
+            fb.push_metafile('citekey2', 'def')
+            fb.remove('citekey1')
+            # changes are seen inside the transaction...
+            self.assertEqual(fb.pull_bibfile('citekey2'), 'def')
+            self.assertTrue(fb.exists('citekey2', meta_check=True))
+            self.assertFalse(fb.exists('citekey1'))
+            with self.assertRaises(IOError):
+                fb.pull_bibfile('citekey1')
+            self.assertEqual(fb.listing(filestats=False),
+                             {'metafiles': ['citekey2'], 'bibfiles': ['citekey2']})
+            # ...but not applied yet
+            self.assertFalse(os.path.exists('testrepo/bib/citekey2.bib'))
+            self.assertTrue(os.path.exists('testrepo/bib/citekey1.bib'))
+        self.assertEqual(listdir('testrepo/bib'), ['citekey2.bib'])
+        self.assertEqual(listdir('testrepo/meta'), ['citekey2.yaml'])
+        self.assertEqual(fb.pull_bibfile('citekey2'), 'def')
+
+    def test_transaction_error(self):
+
+        fb = filebroker.FileBroker('testrepo', create = True)
+        fb.push_bibfile('citekey1', 'abc')
+        fb.push_metafile('citekey1', 'abc')
+        with self.assertRaises(ValueError):
+            with fb.transaction():
+                fb.push_bibfile('citekey1', 'def')
+                fb.push_bibfile('citekey2', 'def')
+                fb.remove('citekey1')
+                raise ValueError
+        self.assertEqual(listdir('testrepo/bib'), ['citekey1.bib'])
+        self.assertEqual(fb.pull_bibfile('citekey1'), 'abc')
+        self.assertFalse(fb.in_transaction)
+
+    def test_rename(self):
+
+        fb = filebroker.FileBroker('testrepo', create = True)
+        fb.push_bibfile('citekey1', 'abc')
+        fb.push_metafile('citekey1', 'def')
+        mtime = fb.mtime_bibfile('citekey1')
+        fb.rename('citekey1', 'citekey2')
+        self.assertEqual(listdir('testrepo/bib'), ['citekey2.bib'])
+        self.assertEqual(listdir('testrepo/meta'), ['citekey2.yaml'])
+        self.assertEqual(fb.pull_bibfile('citekey2'), 'abc')
+        self.assertEqual(fb.mtime_bibfile('citekey2'), mtime)
+
+    def test_rename_transaction(self):
+
+        fb = filebroker.FileBroker('testrepo', create = True)
+        fb.push_bibfile('citekey1', 'abc')
+        fb.push_metafile('citekey1', 'def')
+        with self.assertRaises(ValueError):
+            with fb.transaction():
+                fb.rename('citekey1', 'citekey2')
+                self.assertFalse(fb.exists('citekey1'))
+                self.assertEqual(fb.pull_metafile('citekey2'), 'def')
+                raise ValueError
+        self.assertEqual(listdir('testrepo/meta'), ['citekey1.yaml'])
+        with fb.transaction():
+            fb.rename('citekey1', 'citekey2')
+            fb.push_bibfile('citekey2', 'ghi')
+            self.assertEqual(listdir('testrepo/bib'), ['citekey1.bib'])
+        self.assertEqual(listdir('testrepo/bib'), ['citekey2.bib'])
+        self.assertEqual(listdir('testrepo/meta'), ['citekey2.yaml'])
+        self.assertEqual(fb.pull_bibfile('citekey2'), 'ghi')
+        self.assertEqual(fb.pull_metafile('citekey2'), 'def')
+
+    def test_transaction_fingerprint(self):
+
+        fb = filebroker.FileBroker('testrepo', create = True)
+        with fb.transaction():
+            fb.push_bibfile('citekey1', 'abc')
+        fb.close()
+        fingerprint = fb.fingerprint()
+        with fb.transaction():
+            fb.push_bibfile('citekey2', 'def')
+            fb.push_metafile('citekey2', 'def')
+            # readers keep seeing the committed state
+            self.assertEqual(fb.fingerprint(), fingerprint)
+        self.assertNotEqual(fb.fingerprint(), fingerprint)
+
+    def test_first_transaction_fingerprint(self):
+
+        fb = filebroker.FileBroker('testrepo', create = True)
+        fingerprint = fb.fingerprint()
+        with fb.transaction():
+            fb.push_bibfile('citekey1', 'abc')
+            fb.push_metafile('citekey1', 'def')
+            self.assertEqual(fb.fingerprint(), fingerprint)
+        self.assertNotEqual(fb.fingerprint(), fingerprint)
+
+    def test_fingerprint(self):
+
+        fb = filebroker.FileBroker('testrepo', create = True)
+        fingerprint = fb.fingerprint()
+        self.assertEqual(fb.fingerprint(), fingerprint)
+
+        fb.push_bibfile('citekey1', 'abc')
+        self.assertNotEqual(fb.fingerprint(), fingerprint)
+        fingerprint = fb.fingerprint()
+        fb.close()
+        self.assertNotEqual(fb.fingerprint(), fingerprint)
+
+        fb = filebroker.FileBroker('testrepo')
+        fingerprint = fb.fingerprint()
+        fb.close()
+        self.assertEqual(fb.fingerprint(), fingerprint)
+
 
 class TestDocBroker(fake_env.TestFakeFs):
 
@@ -89,6 +230,19 @@ class TestDocBroker(fake_env.TestFakeFs):
         with self.assertRaises(IOError):
             self.assertFalse(content.check_file(os.path.join('testrepo', 'doc/Page99.pdf'), fail=True))
 
+    def test_docrename(self):
+
+        self.fs.add_real_directory(os.path.join(self.rootpath, 'data'), read_only=False)
+
+        fb = filebroker.FileBroker('testrepo', create = True)
+        docb = filebroker.DocBroker('testrepo')
+
+        docpath = docb.add_doc('Page99', 'data/pagerank.pdf')
+        stat = os.stat('testrepo/doc/Page99.pdf')
+        self.assertEqual(docb.rename_doc(docpath, 'Larry99'), 'docsdir://Larry99.pdf')
+        self.assertEqual(os.listdir('testrepo/doc'), ['Larry99.pdf'])
+        self.assertEqual(os.stat('testrepo/doc/Larry99.pdf').st_ino, stat.st_ino)  # moved
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+import dotdot
+
+from pubs.commands import grep_cmd
+from pubs.utils import imap_in_pool
+
+
+BIB = b"""@article{Page99,
+  title = {The PageRank Citation Ranking:
+    Bringing Order to the Web},
+  author = {Page, Lawrence and Brin, Sergey},
+  year = {1999}
+}
+"""
+
+META = b"""docfile: null
+notes: []
+tags:
+- search
+- network
+"""
+
+
+class TestGrep(unittest.TestCase):
+    """Runs on the real filesystem, since files are memory-mapped."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = {}
+        for name, data in [('Page99.bib', BIB), ('Page99.yaml', META),
+                           ('empty.txt', b'')]:
+            path = os.path.join(self.tmpdir, name)
+            with open(path, 'wb') as f:
+                f.write(data)
+            self.files[name] = path
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def grep(self, pattern, kind, name, flags=0):
+        return grep_cmd._grep_file(re.compile(pattern, flags), kind,
+                                   self.files.get(name, name))
+
+    def test_bib_field_context(self):
+        matches = self.grep(b'Order', 'bib', 'Page99.bib')
+        self.assertEqual(matches, [(3, b'title', b'    Bringing Order to the Web},',
+                                    [(13, 18)])])
+        self.assertEqual(self.grep(b'Sergey', 'bib', 'Page99.bib')[0][:2],
+                         (4, b'author'))
+
+    def test_entry_header_has_no_field(self):
+        self.assertEqual(self.grep(b'Page99', 'bib', 'Page99.bib')[0][:2],
+                         (1, None))
+
+    def test_several_matches_on_a_line(self):
+        matches = self.grep(b'(?i)page', 'bib', 'Page99.bib')
+        self.assertEqual([m[0] for m in matches], [1, 2, 4])
+        self.assertEqual(matches[1][3], [(15, 19)])
+        self.assertEqual(len(self.grep(b'an', 'bib', 'Page99.bib')[0][3]), 2)
+
+    def test_meta_field_context(self):
+        matches = self.grep(b'network', 'meta', 'Page99.yaml')
+        self.assertEqual(matches, [(5, b'tags', b'- network', [(2, 9)])])
+
+    def test_missing_and_empty_files(self):
+        self.assertEqual(self.grep(b'x', 'notes', 'missing.txt'), [])
+        self.assertEqual(self.grep(b'x', 'notes', 'empty.txt'), [])
+
+    def test_shards_in_pool(self):
+        files = [('Page99', 'bib', self.files['Page99.bib']),
+                 ('Page99', 'meta', self.files['Page99.yaml'])]
+        jobs = [(b'search|Web', 0, [f]) for f in files]
+        results = [r for shard in imap_in_pool(grep_cmd._grep_shard, jobs, 2)
+                   for r in shard]
+        self.assertEqual(sorted((kind, len(matches))
+                                for _, kind, matches in results),
+                         [('bib', 1), ('meta', 1)])
+
+    def test_highlight(self):
+        self.assertEqual(grep_cmd._highlight(b'abcd', [(1, 2)]), u'abcd')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+import contextlib
+
+import dotdot
+import fake_env
+import fixtures
+
+from pubs import content
+
+from pubs import index
+
+
+class FakeFileBroker(object):
+
+    mtime = 1.
+
+    def mtime_bibfile(self, key):
+        return self.mtime
+
+    def mtime_metafile(self, key):
+        return self.mtime
+
+
+class FakeNoteBroker(object):
+
+    docdir = 'notes'
+
+
+class FakeDataBroker(object):
+
+    def __init__(self):
+        self.filebroker = FakeFileBroker()
+        self.notebroker = FakeNoteBroker()
+        self.caches = {}
+        self.generation = 1
+
+    @contextlib.contextmanager
+    def lock(self, exclusive=False):
+        yield
+
+    def fingerprint(self):
+        return self.generation
+
+    def pull_cache(self, name):
+        return self.caches[name]
+
+    def push_cache(self, name, data):
+        self.caches[name] = data
+
+    def real_notepath(self, citekey, extension):
+        return 'notes/{}.{}'.format(citekey, extension)
+
+
+class TestTrigrams(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(index.normalize(u'Gödel, Escher: Bach!'),
+                         ['godel', 'escher', 'bach'])
+
+    def test_trigrams(self):
+        self.assertEqual(index.trigrams('ab'), {'  a', ' ab', 'ab '})
+
+    def test_searchable_text(self):
+        text = index.searchable_text(fixtures.turing_bibdata)
+        self.assertIn('Computing machinery', text)
+        self.assertIn('Turing', text)
+        self.assertIn('Mind', text)
+        self.assertNotIn('Alan', text)
+
+
+class TestTrigramIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.databroker = FakeDataBroker()
+        self.index = index.TrigramIndex(self.databroker)
+        self.index.push('turing1950computing', fixtures.turing_bibdata)
+        self.index.push('Page99', fixtures.page_bibdata)
+        self.index.push('Doe2013', fixtures.doe_bibdata)
+
+    def test_search_exact(self):
+        self.assertEqual(self.index.search('pagerank')[0][0], 'Page99')
+
+    def test_search_typos(self):
+        results = self.index.search('compting machinry')
+        self.assertEqual(results[0][0], 'turing1950computing')
+        results = self.index.search('pagernk citaton')
+        self.assertEqual(results[0][0], 'Page99')
+
+    def test_search_author_and_journal(self):
+        self.assertEqual(self.index.search('turnig mind')[0][0],
+                         'turing1950computing')
+
+    def test_search_limit_and_threshold(self):
+        self.assertEqual(len(self.index.search('the', limit=1)), 1)
+        self.assertEqual(self.index.search('zzzzzz'), [])
+
+    def test_remove(self):
+        self.index.remove('Page99')
+        self.assertNotIn('Page99', self.index)
+        self.assertEqual(self.index.search('pagerank'), [])
+        self.index.remove('Page99')  # silent
+
+    def test_reindex(self):
+        bibdata = dict(fixtures.doe_bibdata)
+        bibdata['title'] = 'Another Heading'
+        self.index.push('Doe2013', bibdata)
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.search('nice title'), [])
+        self.assertEqual(self.index.search('heading')[0][0], 'Doe2013')
+
+    def test_rename(self):
+        self.index.rename('Page99', 'Page1999')
+        self.assertEqual(self.index.search('pagerank')[0][0], 'Page1999')
+
+    def test_compact(self):
+        for i in range(100):
+            self.index.push('Doe{}'.format(i), fixtures.doe_bibdata)
+        for i in range(100):
+            self.index.remove('Doe{}'.format(i))
+        self.assertLess(len(self.index.data['keys']), 100)
+        self.assertEqual(self.index.search('pagerank')[0][0], 'Page99')
+        self.assertEqual(self.index.search('nice title')[0][0], 'Doe2013')
+
+    def test_outdated(self):
+        citekeys = {'Page99', 'Doe2013', 'Franny1961'}
+        self.assertEqual(self.index.outdated(citekeys), ['Franny1961'])
+        self.assertNotIn('turing1950computing', self.index)
+        self.databroker.filebroker.mtime = 2.
+        self.assertEqual(set(self.index.outdated(citekeys)), citekeys)
+
+    def test_flush(self):
+        self.index.flush()
+        other = index.TrigramIndex(self.databroker)
+        self.assertEqual(other.search('pagerank')[0][0], 'Page99')
+
+    def test_state(self):
+        self.assertIsNone(self.index.state)
+        self.index.state = self.index.current_state()
+        self.index.flush()
+        other = index.TrigramIndex(self.databroker)
+        self.assertEqual(other.state, (1,))
+        self.databroker.generation = 2
+        self.assertNotEqual(other.state, other.current_state())
+
+    def test_advance(self):
+        self.index.state = (1,)
+        self.index.advance(1, 2)  # updated along
+        self.assertEqual(self.index.state, (2,))
+        self.index.flush()
+        other = index.TrigramIndex(self.databroker)
+        other.advance(2, 3)  # not loaded: only the state is written
+        other.advance(1, 4)  # not from its state
+        self.assertIsNone(other._data)
+        self.assertEqual(index.TrigramIndex(self.databroker).state, (3,))
+
+
+class TestFullTextIndex(fake_env.TestFakeFs):
+
+    def setUp(self):
+        super(TestFullTextIndex, self).setUp()
+        os.mkdir('notes')
+        content.write_file('notes/Doe2013.txt',
+                           u'Reread the section on markov chains.')
+        self.databroker = FakeDataBroker()
+        self.index = index.FullTextIndex(self.databroker, 'txt')
+        self.index.push('turing1950computing', fixtures.turing_bibdata)
+        self.index.push('Page99', fixtures.page_bibdata)
+        self.index.push('Doe2013', fixtures.doe_bibdata)
+
+    def test_terms(self):
+        self.assertEqual(index.terms('The importance of a Web page'),
+                         ['importance', 'web', 'page'])
+
+    def test_search_title(self):
+        self.assertEqual(self.index.search('machinery')[0][0],
+                         'turing1950computing')
+
+    def test_search_abstract(self):
+        self.assertEqual(self.index.search('random surfer'),
+                         [('Page99', self.index.search('random surfer')[0][1])])
+
+    def test_search_note(self):
+        self.assertEqual(self.index.search('Markov')[0][0], 'Doe2013')
+
+    def test_ranking(self):
+        results = self.index.search('web title')
+        self.assertEqual(set(c for c, _ in results), {'Page99', 'Doe2013'})
+        self.assertGreater(results[0][1], results[1][1])
+        self.assertEqual(len(self.index.search('web title', limit=1)), 1)
+
+    def test_no_match(self):
+        self.assertEqual(self.index.search('the zebra'), [])
+
+    def test_note_edit_outdates(self):
+        citekeys = {'turing1950computing', 'Page99', 'Doe2013'}
+        self.assertEqual(self.index.outdated(citekeys), [])
+        content.write_file('notes/Page99.txt', u'Markov')
+        self.assertEqual(self.index.outdated(citekeys), ['Page99'])
+        self.index.push('Page99', fixtures.page_bibdata)
+        self.assertEqual(set(c for c, _ in self.index.search('markov')),
+                         {'Page99', 'Doe2013'})
+
+    def test_doc_text(self):
+        self.index.push('Page99', fixtures.page_bibdata,
+                        u'Eigenvector of the link matrix.')
+        self.assertEqual(self.index.search('eigenvector')[0][0], 'Page99')
+
+    def test_pending_doc_text_outdates(self):
+        citekeys = {'turing1950computing', 'Page99', 'Doe2013'}
+        self.index.push('Page99', fixtures.page_bibdata, None)
+        self.assertEqual(self.index.outdated(citekeys), ['Page99'])
+        self.assertEqual(self.index.search('surfer')[0][0], 'Page99')
+
+    def test_docpath_change_outdates(self):
+        citekeys = {'turing1950computing', 'Page99', 'Doe2013'}
+        docpaths = {'Page99': '/page.pdf'}
+        self.assertEqual(self.index.outdated(citekeys, docpath=docpaths.get),
+                         ['Page99'])
+        self.index.push('Page99', fixtures.page_bibdata, docpath='/page.pdf')
+        self.assertEqual(self.index.outdated(citekeys, docpath=docpaths.get), [])
+        self.index.rename('Page99', 'Page1999', '/Page1999.pdf')
+        self.assertEqual(self.index.docpath('Page1999'), '/Page1999.pdf')
+        self.index.remove('Page1999')
+        self.assertIsNone(self.index.docpath('Page1999'))
+
+    def test_state_notes(self):
+        state = self.index.current_state()
+        self.assertEqual(state[0], 1)
+        os.utime('notes', (0, 0))
+        self.assertNotEqual(self.index.current_state(), state)
+
+    def test_pending(self):
+        self.assertEqual(self.index.pending(), [])
+        self.index.push('Page99', fixtures.page_bibdata, None)
+        self.assertEqual(self.index.pending(), ['Page99'])
+
+    def test_remove(self):
+        self.index.remove('Doe2013')
+        self.assertEqual(self.index.search('markov'), [])
+        self.assertEqual(self.index.data['total'],
+                         sum(self.index.data['sizes'][:2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
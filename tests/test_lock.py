@@ -0,0 +1,101 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import dotdot
+
+from pubs import lock
+
+
+# tries to lock the file, without waiting, in another process
+TRY_LOCK = """
+import fcntl, sys
+f = open(sys.argv[1], 'a')
+try:
+    fcntl.flock(f, (fcntl.LOCK_EX if sys.argv[2] == 'ex' else fcntl.LOCK_SH)
+                   | fcntl.LOCK_NB)
+except IOError:
+    sys.exit(1)
+"""
+
+# holds an exclusive lock on the file for a while
+HOLD_LOCK = """
+import fcntl, sys, time
+f = open(sys.argv[1], 'a')
+fcntl.flock(f, fcntl.LOCK_EX)
+sys.stdout.write('locked\\n')
+sys.stdout.flush()
+time.sleep(float(sys.argv[2]))
+"""
+
+
+@unittest.skipIf(lock.fcntl is None, 'no file locking on this platform')
+class TestFileLock(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'lock')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def lockable(self, exclusive):
+        """Whether another process may lock the file."""
+        return subprocess.call([sys.executable, '-c', TRY_LOCK, self.path,
+                                'ex' if exclusive else 'sh']) == 0
+
+    def test_shared(self):
+        with lock.locked(self.path):
+            self.assertTrue(self.lockable(exclusive=False))
+            self.assertFalse(self.lockable(exclusive=True))
+        self.assertTrue(self.lockable(exclusive=True))
+
+    def test_exclusive(self):
+        with lock.locked(self.path, exclusive=True):
+            self.assertFalse(self.lockable(exclusive=False))
+        self.assertTrue(self.lockable(exclusive=True))
+
+    def test_reentrant(self):
+        with lock.locked(self.path, exclusive=True):
+            with lock.locked(self.path):
+                with lock.locked(self.path, exclusive=True):
+                    pass
+                self.assertFalse(self.lockable(exclusive=False))
+            self.assertFalse(self.lockable(exclusive=False))
+        self.assertTrue(self.lockable(exclusive=True))
+
+    def test_downgrade(self):
+        with lock.locked(self.path):
+            with lock.locked(self.path, exclusive=True):
+                self.assertFalse(self.lockable(exclusive=False))
+            self.assertTrue(self.lockable(exclusive=False))
+            self.assertFalse(self.lockable(exclusive=True))
+
+    def test_forked(self):
+        filelock = lock.get(self.path)
+        self.assertIs(lock.get(self.path), filelock)
+        filelock.pid = -1  # as if inherited from the parent process
+        self.assertIsNot(lock.get(self.path), filelock)
+
+    def test_wait_stats(self):
+        holder = subprocess.Popen([sys.executable, '-c', HOLD_LOCK,
+                                   self.path, '0.3'], stdout=subprocess.PIPE)
+        try:
+            holder.stdout.readline()
+            waits = lock.stats['waits']
+            wait_time = lock.stats['wait_time']
+            with lock.locked(self.path):
+                pass
+            self.assertEqual(lock.stats['waits'], waits + 1)
+            self.assertGreater(lock.stats['wait_time'], wait_time + 0.1)
+            self.assertGreater(lock.stats['max_wait'], 0.1)
+        finally:
+            holder.wait()
+            holder.stdout.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import dotdot
+from pubs.commands.pick_cmd import PickIndex, parse_query, narrows
+from pubs.commands.list_cmd import InvalidQuery
+from pubs.paper import Paper
+
+import fixtures
+
+
+doe_paper = Paper.from_bibentry(fixtures.doe_bibentry)
+page_paper = Paper.from_bibentry(fixtures.page_bibentry)
+turing_paper = Paper.from_bibentry(fixtures.turing_bibentry,
+                                   metadata=fixtures.turing_metadata)
+PAPERS = [doe_paper, page_paper, turing_paper]
+
+
+class TestParseQuery(unittest.TestCase):
+
+    def test_blocks(self):
+        self.assertEqual(parse_query(u'a:doe  Turing tags:'),
+                         (('author', u'doe', False),
+                          ('text', u'Turing', True),
+                          ('tag', u'', True)))
+
+    def test_invalid(self):
+        with self.assertRaises(InvalidQuery):
+            parse_query(u'a:b:c')
+
+    def test_narrows(self):
+        self.assertTrue(narrows((), parse_query(u'a:d')))
+        self.assertTrue(narrows(parse_query(u'a:d'), parse_query(u'a:do')))
+        self.assertTrue(narrows(parse_query(u'a:do'), parse_query(u'a:do t:x')))
+        self.assertFalse(narrows(parse_query(u'a:do'), parse_query(u'a:d')))
+        self.assertFalse(narrows(parse_query(u'a'), parse_query(u'a:')))
+        self.assertFalse(narrows(parse_query(u'a:do t:x'), parse_query(u'a:dox')))
+
+
+class TestPickIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PickIndex(PAPERS, [u'[{}]'.format(p.citekey) for p in PAPERS])
+
+    def citekeys(self, query):
+        return [self.index.citekeys[i] for i in self.index.filter(query)]
+
+    def test_all(self):
+        self.assertEqual(len(self.index.filter(u'')), 3)
+
+    def test_fields(self):
+        self.assertEqual(self.citekeys(u'a:turing'), ['turing1950computing'])
+        self.assertEqual(self.citekeys(u'year:1999'), ['Page99'])
+        self.assertEqual(self.citekeys(u'tag:'), ['turing1950computing'])
+
+    def test_text(self):
+        self.assertEqual(self.citekeys(u'page'), ['Page99'])
+        self.assertEqual(self.citekeys(u'PAGE'), [])
+
+    def test_smart_case(self):
+        self.assertEqual(self.citekeys(u'a:Turing'), ['turing1950computing'])
+        self.assertEqual(self.citekeys(u'a:TURING'), [])
+
+    def test_typing(self):
+        for i in range(2, 9):
+            self.assertEqual(self.citekeys(u'a:turing'[:i] + u' t:machinery'),
+                             ['turing1950computing'])
+        self.assertEqual(self.citekeys(u'a:'), self.citekeys(u'author:'))
+
+    def test_narrowed_from_previous_results(self):
+        self.index.filter(u'a:t')
+        self.index._bibdata = None  # the author column is already built
+        self.index._history[-1] = (parse_query(u'a:t'), [0])
+        self.assertEqual(self.index.filter(u'a:tu'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
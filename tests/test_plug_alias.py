@@ -1,12 +1,20 @@
+import os
+import sys
 import shlex
+import shutil
+import socket
+import tempfile
 import unittest
 
 import dotdot
 
 import pubs
-from pubs import config
+from pubs import config, daemon
 from pubs.plugs.alias.alias import (Alias, AliasPlugin, CommandAlias,
-                                    ShellAlias)
+                                    ShellAlias, PubsServer, subprocess,
+                                    run_command)
+from pubs.color import setup as color_setup
+from pubs.pubs_cmd import execute
 
 
 def to_args(arg_strings):
@@ -16,6 +24,12 @@ def to_args(arg_strings):
     return o
 
 
+class FakeProcess(object):
+
+    def poll(self):
+        return 0
+
+
 class FakeExecuter(object):
 
     called = None
@@ -24,8 +38,13 @@ class FakeExecuter(object):
     def call(self, obj, shell=None):
         self.called = obj
 
-    def execute(self, obj):
+    def Popen(self, obj, shell=None, close_fds=None):
+        self.called = obj
+        return FakeProcess()
+
+    def execute(self, conf, obj):
         self.executed = obj
+        return 0
 
 
 class AliasTestCase(unittest.TestCase):
@@ -34,27 +53,31 @@ class AliasTestCase(unittest.TestCase):
         self.subprocess = FakeExecuter()
         pubs.plugs.alias.alias.subprocess = self.subprocess
         self.cmd_execute = FakeExecuter()
-        pubs.plugs.alias.alias.execute = self.cmd_execute.execute
+        pubs.plugs.alias.alias.run_command = self.cmd_execute.execute
+
+    def tearDown(self):
+        pubs.plugs.alias.alias.subprocess = subprocess
+        pubs.plugs.alias.alias.run_command = run_command
 
     def testAlias(self):
         alias = Alias.create_alias('print', 'open -w lpppp')
         alias.command(None, to_args(['CiteKey']))
         self.assertIsNone(self.subprocess.called)
         self.assertEqual(self.cmd_execute.executed,
-                         ['pubs', 'open', '-w', 'lpppp', 'CiteKey'])
+                         ['open', '-w', 'lpppp', 'CiteKey'])
 
     def testShellAlias(self):
         """This actually just test that subprocess.call is called.
         """
         alias = Alias.create_alias('count', '!pubs list -k | wc -l')
-        alias.command(None, to_args([]))
+        alias.command(config.load_default_conf(), to_args([]))
         self.assertIsNone(self.cmd_execute.executed)
         self.assertIsNotNone(self.subprocess.called)
 
     def testShellAliasEscapes(self):
         alias = Alias.create_alias('count', '!echo "$@"')
         args = ['a b c', "d,e f\""]
-        alias.command(None, to_args(args))
+        alias.command(config.load_default_conf(), to_args(args))
         self.assertIsNone(self.cmd_execute.executed)
         self.assertIsNotNone(self.subprocess.called)
         self.assertEqual(
@@ -62,6 +85,85 @@ class AliasTestCase(unittest.TestCase):
             args)
 
 
+@unittest.skipUnless(daemon.supported(), 'file descriptors cannot be passed')
+class ShellAliasServerTestCase(unittest.TestCase):
+    """Runs a real shell, whose pubs commands are run by a fake run_command."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.colors = False
+        pubs.plugs.alias.alias.run_command = self.run_command
+        pubs.plugs.alias.alias.color.setup = self.color_setup
+        pubs.pubs_cmd.execute = self.execute
+
+    def tearDown(self):
+        pubs.plugs.alias.alias.run_command = run_command
+        pubs.plugs.alias.alias.color.setup = color_setup
+        pubs.pubs_cmd.execute = execute
+        shutil.rmtree(self.tmpdir)
+
+    # commands run in forked children, that only report through their output
+
+    def run_command(self, conf, args):
+        out = ' '.join(args).upper() + (' COLORS' if self.colors else '')
+        os.write(1, out.encode('utf-8') + b'\n')
+        if args[0] == 'read':
+            os.write(2, sys.stdin.readline().upper().encode('utf-8'))
+        elif args[0] == 'many':  # more than a pipe holds
+            os.write(1, b'x\n' * 100000)
+        return 3 if args[0] == 'fail' else 0
+
+    def color_setup(self, conf, force_colors=False):
+        self.colors = force_colors
+
+    def execute(self, argv):
+        os.write(1, b'EXECUTE ' + ' '.join(argv).encode('utf-8') + b'\n')
+
+    def run_alias(self, definition, args):
+        path = os.path.join(self.tmpdir, 'out')
+        alias = Alias.create_alias('test', '!{{ {}; }} > {}'.format(definition, path))
+        alias.command(config.load_default_conf(), to_args(args))
+        with open(path) as f:
+            return f.read()
+
+    def testPubsFunction(self):
+        out = self.run_alias('pubs list -k "$@" | tr K Q; pubs fail; echo $?',
+                             ['a b', 'c'])
+        self.assertEqual(out, 'LIST -Q A B C\nFAIL\n3\n')
+
+    def testConcurrentCalls(self):
+        out = self.run_alias('pubs one | cat; pubs two & pubs three; wait', [])
+        self.assertEqual(sorted(out.splitlines()), ['ONE', 'THREE', 'TWO'])
+
+    def testPipeBetweenCalls(self):
+        out = self.run_alias('pubs many | { read k; pubs one; cat >/dev/null; }', [])
+        self.assertEqual(out, 'ONE\n')
+
+    def testStandardStreams(self):
+        out = self.run_alias('echo a | pubs read 2>&1', [])
+        self.assertEqual(out, 'READ\nA\n')
+
+    def testGlobalOptions(self):
+        out = self.run_alias('pubs --force-colors list; pubs -c conf list', [])
+        self.assertEqual(out, 'LIST COLORS\nEXECUTE pubs -c conf list\n')
+
+    def testInvalidRequests(self):
+        server = PubsServer(config.load_default_conf())
+        pubs.plugs.alias.alias.REQUEST_TIMEOUT = 0.1
+        try:
+            for request in (b'not json\n', b'{"request": "run"}\n',
+                            b'{"request": "run", "argv": ["pubs", "list"]'):
+                conn, caller = socket.socketpair()
+                caller.sendall(request)  # the last one is never completed
+                self.assertIsNone(server.handle(conn))
+                conn.close()
+                self.assertEqual(caller.recv(16), b'')  # dropped
+                caller.close()
+        finally:
+            pubs.plugs.alias.alias.REQUEST_TIMEOUT = 5.0
+            server.close()
+
+
 class AliasPluginTestCase(unittest.TestCase):
 
     def setUp(self):
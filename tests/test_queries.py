@@ -1,3 +1,4 @@
+import argparse
 import unittest
 
 import dotdot
@@ -5,6 +6,7 @@ from pubs.commands.list_cmd import (_check_author_match,
                                     _check_field_match,
                                     _check_query_block,
                                     filter_paper,
+                                    split_query,
                                     InvalidQuery)
 
 from pubs.paper import Paper
@@ -98,5 +100,17 @@ class TestFilterPaper(unittest.TestCase):
                                       ['author:doee', 'year:2014']))
 
 
+
+class TestSplitQuery(unittest.TestCase):
+
+    def test_split(self):
+        self.assertEqual(split_query('author:doe "title:deep learning"'),
+                         ['author:doe', 'title:deep learning'])
+
+    def test_invalid(self):
+        with self.assertRaises(argparse.ArgumentTypeError):
+            split_query('title:"unclosed')
+
+
 if __name__ == '__main__':
     unittest.main()
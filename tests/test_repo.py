@@ -1,3 +1,4 @@
+import os
 import unittest
 from datetime import datetime
 
@@ -7,7 +8,8 @@ import fixtures
 
 from pubs.repo import Repository, _base27, CiteKeyCollision, CiteKeyNotFound
 from pubs.paper import Paper
-from pubs import config
+from pubs import config, color, pretty, lock, repo, completion, index
+from pubs.content import write_file, system_path
 
 
 class TestRepo(fake_env.TestFakeFs):
@@ -35,6 +37,36 @@ class TestCitekeyGeneration(TestRepo):
         c = self.repo.unique_citekey('Doe2013')
         self.assertEqual(c, 'Doe2013b')
 
+    def test_many_generated_keys(self):
+        for _ in range(60):
+            citekey = self.repo.unique_citekey('Doe2013')
+            self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry,
+                                                     citekey=citekey))
+        self.assertEqual(citekey, 'Doe2013bg')
+        self.assertEqual(self.repo.unique_citekey('Doe2013'), 'Doe2013bh')
+        self.assertEqual(self.repo.unique_citekey('Doe'), 'Doe')
+
+    def test_generated_key_after_remove(self):
+        for citekey in ('Doe2013', 'Doe2013a', 'Doe2013b'):
+            self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry,
+                                                     citekey=citekey))
+        self.assertEqual(self.repo.unique_citekey('Doe2013'), 'Doe2013c')
+        self.repo.remove_paper('Doe2013a')
+        self.assertEqual(self.repo.unique_citekey('Doe2013'), 'Doe2013a')
+        paper = self.repo.pull_paper('Doe2013')
+        self.repo.rename_paper(paper, 'Doe')
+        self.assertEqual(self.repo.unique_citekey('Doe2013'), 'Doe2013')
+
+    def test_generated_key_after_failed_transaction(self):
+        with self.assertRaises(CiteKeyCollision):
+            with self.repo.transaction():
+                self.repo.push_paper(Paper.from_bibentry(
+                    fixtures.doe_bibentry,
+                    citekey=self.repo.unique_citekey('Doe2013')))
+                self.assertEqual(self.repo.unique_citekey('Doe2013'), 'Doe2013a')
+                self.repo.push_paper(Paper.from_bibentry(fixtures.turing_bibentry))
+        self.assertEqual(self.repo.unique_citekey('Doe2013'), 'Doe2013')
+
 
 class TestPushPaper(TestRepo):
 
@@ -88,6 +120,363 @@ class TestUpdatePaper(TestRepo):
 
     # TODO: should also check that associated files are updated
 
+    def test_rename_keeps_cache_entries(self):
+        self.repo.search('turing')  # builds the indexes
+        metacache = self.repo.databroker.metacache
+        entry = metacache.entries['turing1950computing']
+        paper = self.repo.pull_paper('turing1950computing')
+        self.repo.rename_paper(paper, 'Turing1950')
+        self.assertIs(metacache.entries['Turing1950'], entry)
+        self.assertIn('Turing1950', self.repo.trigrams)
+        self.assertEqual(self.repo.fulltext.outdated(self.repo.citekeys), [])
+        self.assertEqual(self.repo.search('turing'), ['Turing1950'])
+        self.assertEqual(self.repo.pull_paper('Turing1950').citekey, 'Turing1950')
+
+    def test_rename_papers_cycle(self):
+        self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+        turing = self.repo.pull_paper('turing1950computing')
+        doe = self.repo.pull_paper('Doe2013')
+        self.repo.rename_papers([(turing, 'Doe2013'),
+                                 (doe, 'turing1950computing')])
+        self.assertEqual(self.repo.citekeys,
+                         set(['Doe2013', 'turing1950computing']))
+        self.assertEqual(self.repo.pull_paper('Doe2013').bibentry['Doe2013'],
+                         fixtures.turing_bibentry['turing1950computing'])
+        self.assertEqual(turing.citekey, 'Doe2013')
+        self.assertEqual(doe.citekey, 'turing1950computing')
+
+    def test_rename_papers_chain(self):
+        self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+        turing = self.repo.pull_paper('turing1950computing')
+        doe = self.repo.pull_paper('Doe2013')
+        self.repo.rename_papers([(turing, 'Doe2013'), (doe, 'Doe2013a')])
+        self.assertEqual(self.repo.citekeys, set(['Doe2013', 'Doe2013a']))
+        self.assertEqual(self.repo.search('turing'), ['Doe2013'])
+
+    def test_rename_papers_collision(self):
+        self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+        turing = self.repo.pull_paper('turing1950computing')
+        with self.assertRaises(CiteKeyCollision):
+            self.repo.rename_papers([(turing, 'Doe2013')])
+        self.assertEqual(self.repo.citekeys,
+                         set(['Doe2013', 'turing1950computing']))
+
+    def test_reading_lists_papers_committed_meanwhile(self):
+        self.repo.close()
+        self.assertEqual(self.repo.citekeys, set(['turing1950computing']))
+        writer = Repository(self.repo.conf)
+        writer.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+        writer.close()
+        self.assertEqual(sorted(p.citekey for p in self.repo.all_papers()),
+                         ['Doe2013', 'turing1950computing'])
+
+    def test_rename_papers_failure_moves_files_back(self):
+        self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+        papers = [self.repo.pull_paper(c)
+                  for c in ('turing1950computing', 'Doe2013')]
+        ext = self.repo.conf['main']['note_extension']
+        for paper in papers:
+            paper.docpath = 'docsdir://{}.txt'.format(paper.citekey)
+            write_file(self.repo.databroker.real_docpath(paper.docpath), u'doc')
+            write_file(self.repo.databroker.real_notepath(paper.citekey, ext),
+                       u'note')
+            self.repo.push_paper(paper, overwrite=True)
+        rename_paper = self.repo._rename_paper
+        calls = []
+
+        def failing_rename(paper, old_citekey, new_citekey):
+            calls.append(old_citekey)
+            if len(calls) == 3:  # after the docs of both papers were moved
+                raise IOError('disk full')
+            rename_paper(paper, old_citekey, new_citekey)
+        self.repo._rename_paper = failing_rename
+
+        with self.assertRaises(IOError):  # a cycle, with a temporary citekey
+            self.repo.rename_papers([(papers[0], 'Doe2013'),
+                                     (papers[1], 'turing1950computing')])
+        self.assertEqual(self.repo.citekeys,
+                         set(['Doe2013', 'turing1950computing']))
+        for citekey in ('turing1950computing', 'Doe2013'):
+            docpath = self.repo.pull_paper(citekey).docpath
+            self.assertEqual(docpath, 'docsdir://{}.txt'.format(citekey))
+            self.assertTrue(os.path.exists(system_path(
+                self.repo.databroker.real_docpath(docpath))))
+            self.assertTrue(os.path.exists(system_path(
+                self.repo.databroker.real_notepath(citekey, ext))))
+        docdir = os.path.dirname(self.repo.databroker.real_docpath(
+            papers[0].docpath))
+        self.assertEqual(sorted(os.listdir(system_path(docdir))),
+                         ['Doe2013.txt', 'turing1950computing.txt'])
+        self.assertEqual([p.citekey for p in papers],
+                         ['turing1950computing', 'Doe2013'])
+
+    def test_regenerated_citekeys(self):
+        self.repo.push_paper(Paper.from_bibentry(fixtures.turing_bibentry,
+                                                 citekey='Turing1950'))
+        self.repo.push_paper(Paper.from_bibentry(fixtures.turing_bibentry,
+                                                 citekey='other'))
+        self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry,
+                                                 citekey='Doe2013b'))
+        papers = list(self.repo.all_papers())
+        papers.sort(key=lambda p: p.citekey)
+        renames, skipped = self.repo.regenerated_citekeys(papers)
+        self.assertEqual(skipped, [])
+        self.assertEqual([(p.citekey, c) for p, c in renames],
+                         [('other', 'Turing1950a'),
+                          ('turing1950computing', 'Turing1950b')])
+
+    def test_regenerated_citekeys_skips_anonymous(self):
+        bibentry = {'anon': {'type': 'misc', 'title': 'Anonymous',
+                             'year': '2000'}}
+        self.repo.push_paper(Paper.from_bibentry(bibentry))
+        paper = self.repo.pull_paper('anon')
+        renames, skipped = self.repo.regenerated_citekeys([paper])
+        self.assertEqual(renames, [])
+        self.assertEqual(skipped, [paper])
+
+    def test_remove_papers(self):
+        docsdir = system_path(self.repo.databroker.real_docpath('docsdir://'))
+        notesdir = system_path(os.path.dirname(
+            self.repo.databroker.real_notepath('Doe2013', 'txt')))
+        citekeys = ['Doe2013' + _base27(i) for i in range(40)]  # removed in threads
+        for citekey in citekeys:
+            write_file(os.path.join(docsdir, citekey + '.pdf'), 'pdf')
+            write_file(os.path.join(notesdir, citekey + '.txt'), 'note')
+            self.repo.push_paper(Paper.from_bibentry(
+                fixtures.doe_bibentry, citekey=citekey,
+                metadata={'docfile': 'docsdir://{}.pdf'.format(citekey)}))
+        self.repo.remove_papers(citekeys)
+        self.assertEqual(self.repo.citekeys, set(['turing1950computing']))
+        self.assertEqual(self.repo.search('doe'), [])
+        self.assertEqual(os.listdir(docsdir), [])
+        self.assertEqual(os.listdir(notesdir), [])
+
+    def test_remove_papers_keeps_external_doc(self):
+        write_file('/doe.pdf', 'pdf')
+        self.repo.push_paper(Paper.from_bibentry(
+            fixtures.doe_bibentry, metadata={'docfile': '/doe.pdf'}))
+        self.repo.remove_papers(['Doe2013', 'turing1950computing'])
+        self.assertEqual(self.repo.citekeys, set())
+        self.assertTrue(os.path.exists('/doe.pdf'))
+
+    def test_transaction(self):
+        with self.repo.transaction():
+            self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+            self.repo.remove_paper('turing1950computing')
+            self.assertIn('Doe2013', self.repo)
+            self.assertNotIn('turing1950computing', self.repo)
+        self.repo.close()
+        rp = Repository(self.repo.conf)
+        self.assertEqual(rp.citekeys, set(['Doe2013']))
+        self.assertEqual(rp.search('turing'), [])
+
+    def test_transaction_error(self):
+        with self.assertRaises(CiteKeyCollision):
+            with self.repo.transaction():
+                self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+                self.repo.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+        self.assertNotIn('Doe2013', self.repo)
+        self.assertEqual(self.repo.citekeys, set(['turing1950computing']))
+        self.assertEqual(self.repo.search('doe'), [])
+
+    def test_unchanged_bibfile_not_written(self):
+        self.repo.close()
+        rp = Repository(self.repo.conf)
+        filebroker = rp.databroker.databroker.filebroker
+        bib_mtime = filebroker.mtime_bibfile('turing1950computing')
+        paper = rp.pull_paper('turing1950computing')
+        paper.add_tag('computing')
+        rp.push_paper(paper, overwrite=True)
+        self.assertEqual(filebroker.mtime_bibfile('turing1950computing'),
+                         bib_mtime)
+        self.assertFalse(rp.trigrams.modified)
+        self.assertFalse(rp.fulltext.modified)
+        self.assertEqual(rp.pull_paper('turing1950computing').tags,
+                         set(['computing']))
+
+    def test_push_metadata(self):
+        self.repo.search_text('computing')  # builds the full-text index
+        self.repo.flush()
+        paper = self.repo.pull_paper('turing1950computing')
+        paper.add_tag('computing')
+        with self.repo.transaction():
+            self.assertTrue(self.repo.push_metadata(paper))
+            self.assertFalse(self.repo.push_metadata(paper))
+        self.assertEqual(self.repo.pull_paper('turing1950computing').tags,
+                         set(['computing']))
+        self.assertFalse(self.repo.trigrams.modified)
+        self.assertFalse(self.repo.fulltext.modified)
+        self.assertEqual(self.repo.fulltext.outdated(self.repo.citekeys), [])
+
+    def test_push_metadata_new_doc(self):
+        self.repo.search_text('computing')
+        paper = self.repo.pull_paper('turing1950computing')
+        paper.docpath = '/turing.pdf'
+        self.assertTrue(self.repo.push_metadata(paper))
+        self.assertEqual(self.repo.pull_paper('turing1950computing').docpath,
+                         '/turing.pdf')
+        self.assertEqual(self.repo.fulltext.outdated(self.repo.citekeys), [])
+
+
+    def test_fulltext_checked_after_outside_changes_only(self):
+        self.repo.close()
+        self.repo.search_text('computing')
+        self.repo.close()
+        checked = []
+        outdated = index.FullTextIndex.outdated
+
+        def checking(idx, citekeys, docpath=None):
+            checked.append(len(citekeys))
+            return outdated(idx, citekeys, docpath=docpath)
+        index.FullTextIndex.outdated = checking
+        try:
+            rp = Repository(self.repo.conf)
+            paper = rp.pull_paper('turing1950computing')
+            paper.add_tag('computing')
+            rp.push_metadata(paper)
+            rp.close()
+            rp.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+            rp.close()
+            self.assertEqual(Repository(rp.conf).search_text('nice title'),
+                             ['Doe2013'])
+            self.assertEqual(checked, [])
+            filebroker = rp.databroker.databroker.filebroker
+            os.remove(filebroker.bib_path('Doe2013'))
+            os.utime(filebroker.bibdir, (0, 0))  # not done by the fake fs
+            self.assertEqual(Repository(rp.conf).search_text('nice title'), [])
+            self.assertEqual(checked, [1])
+        finally:
+            index.FullTextIndex.outdated = outdated
+
+    def test_trigrams_checked_after_outside_changes_only(self):
+        self.repo.close()
+        self.repo.search('turing')
+        self.repo.close()
+        checked = []
+        outdated = index.TrigramIndex.outdated
+
+        def checking(idx, citekeys):
+            checked.append(len(citekeys))
+            return outdated(idx, citekeys)
+        index.TrigramIndex.outdated = checking
+        try:
+            rp = Repository(self.repo.conf)
+            rp.push_paper(Paper.from_bibentry(fixtures.doe_bibentry))
+            rp.close()
+            self.assertEqual(Repository(rp.conf).search('doe'), ['Doe2013'])
+            self.assertEqual(checked, [])
+            filebroker = rp.databroker.databroker.filebroker
+            os.remove(filebroker.bib_path('Doe2013'))
+            os.utime(filebroker.bibdir, (0, 0))  # not done by the fake fs
+            self.assertEqual(Repository(rp.conf).search('doe'), [])
+            self.assertEqual(checked, [1])
+        finally:
+            index.TrigramIndex.outdated = outdated
+
+    def test_locked_until_close(self):
+        self.repo.close()
+        rp = Repository(self.repo.conf)
+        filebroker = rp.databroker.databroker.filebroker
+        repo_lock = lock.get(filebroker.writelockpath)
+        held = repo_lock.exclusive  # by repositories of other tests
+        rp.pull_paper('turing1950computing')
+        self.assertEqual(repo_lock.exclusive, held)
+        rp.remove_paper('turing1950computing')
+        self.assertEqual(repo_lock.exclusive, held + 1)
+        rp.close()
+        self.assertEqual(repo_lock.exclusive, held)
+
+
+class TestCompletionSnapshot(TestRepo):
+
+    def setUp(self):
+        super(TestCompletionSnapshot, self).setUp()
+        self.repo.push_paper(Paper.from_bibentry(
+            fixtures.doe_bibentry, metadata={'tags': set(['ml', 'vision'])}))
+
+    def test_snapshot(self):
+        snapshot = self.repo.completion_snapshot()
+        self.assertEqual(snapshot['citekeys'], ['Doe2013', 'turing1950computing'])
+        self.assertEqual(snapshot['tags'], ['ml', 'vision'])
+        self.assertIn('tag', snapshot['fields'])
+        self.assertIn('journal', snapshot['fields'])
+        self.assertEqual(snapshot['values']['author'], ['Doe', 'Turing'])
+        self.assertEqual(snapshot['values']['year'], ['1950', '2013'])
+
+    def test_cached(self):
+        self.repo.close()
+        Repository(self.repo.conf).completion_snapshot()
+        rp = Repository(self.repo.conf)
+        rp._completion_counts = None  # not called if cached
+        self.assertEqual(rp.completion_snapshot()['tags'], ['ml', 'vision'])
+
+    def test_refreshed_on_change(self):
+        self.repo.completion_snapshot()
+        self.repo.remove_paper('Doe2013')
+        self.repo.close()
+        snapshot = Repository(self.repo.conf).completion_snapshot()
+        self.assertEqual(snapshot['citekeys'], ['turing1950computing'])
+        self.assertEqual(snapshot['tags'], [])
+
+    def test_load_snapshot(self):
+        self.repo.close()
+        pubsdir = self.repo.conf['main']['pubsdir']
+        self.assertIsNone(completion.load_snapshot(pubsdir))
+        snapshot = Repository(self.repo.conf).completion_snapshot()
+        self.assertEqual(completion.load_snapshot(pubsdir), snapshot)
+        filebroker = self.repo.databroker.databroker.filebroker
+        os.remove(filebroker.bib_path('Doe2013'))
+        os.utime(filebroker.bibdir, (0, 0))  # not done by the fake fs
+        self.assertIsNone(completion.load_snapshot(pubsdir))
+
+    def test_updated_by_writers(self):
+        self.repo.close()
+        self.repo.completion_snapshot()
+        rp = Repository(self.repo.conf)
+        rp._completion_counts = None  # the snapshot is not rebuilt
+        paper = rp.pull_paper('turing1950computing')
+        paper.add_tag('computing')
+        rp.push_metadata(paper)
+        rp.remove_paper('Doe2013')
+        rp.push_paper(Paper.from_bibentry(fixtures.page_bibentry))
+        rp.close()
+        snapshot = completion.load_snapshot(self.repo.conf['main']['pubsdir'])
+        self.assertEqual(snapshot['citekeys'], ['Page99', 'turing1950computing'])
+        self.assertEqual(snapshot['tags'], ['computing'])
+        self.assertIn('Page', snapshot['values']['author'])
+        self.assertNotIn('Doe', snapshot['values']['author'])
+        rebuilt = repo._completion_snapshot(
+            Repository(self.repo.conf)._completion_counts())
+        del snapshot['fingerprint']
+        self.assertEqual(snapshot, rebuilt)
+
+
+class TestPaperOneliner(TestRepo):
+
+    def setUp(self):
+        super(TestPaperOneliner, self).setUp()
+        color.setup(self.repo.conf)
+
+    def test_oneliner(self):
+        line = self.repo.paper_oneliner('turing1950computing')
+        self.assertEqual(line, pretty.paper_oneliner(
+            self.repo.pull_paper('turing1950computing')))
+
+    def test_cached(self):
+        line = self.repo.paper_oneliner('turing1950computing')
+        self.repo.close()
+        rp = Repository(self.repo.conf)
+        rp.pull_paper = None  # not called if cached
+        self.assertEqual(rp.paper_oneliner('turing1950computing'), line)
+
+    def test_updated(self):
+        self.repo.paper_oneliner('turing1950computing')
+        p = self.repo.pull_paper('turing1950computing')
+        p.add_tag('computing')
+        self.repo.push_paper(p, overwrite=True)
+        self.assertIn('| computing',
+                      self.repo.paper_oneliner('turing1950computing'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Checks that fast commands do not import slow modules, and start within
+their time budget.
+
+Commands are run in fresh interpreters, on the real filesystem.
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import dotdot
+
+from pubs import pubs_cmd
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('bibtexparser', 'yaml', 'dateutil', 'requests', 'bs4')
+
+# time to import pubs and run a fast command, interpreter startup excluded
+STARTUP_BUDGET = 0.1  # seconds
+
+SCRIPT = """
+import os
+import sys
+import time
+start = time.time()
+from pubs import pubs_cmd
+sys.stdout = open(os.devnull, 'w')
+try:
+    pubs_cmd.execute(['pubs'] + sys.argv[1:])
+except SystemExit:
+    pass
+elapsed = time.time() - start
+sys.stderr.write('\\nTIME {}\\n'.format(elapsed))
+sys.stderr.write('MODULES ' + ' '.join(sorted(sys.modules)) + '\\n')
+"""
+
+
+class TestStartupImports(unittest.TestCase):
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.env = dict(os.environ, HOME=self.home, PYTHONPATH=ROOT)
+        self.env.pop('_ARGCOMPLETE', None)
+        # timed with compiled modules, as when installed
+        self.env.pop('PYTHONDONTWRITEBYTECODE', None)
+        self.run_pubs('init')
+        self.run_pubs('import', os.path.join(ROOT, 'tests', 'data'))
+
+    def tearDown(self):
+        shutil.rmtree(self.home)
+
+    def run_pubs(self, *args):
+        """Run a pubs command, and return the modules it imported."""
+        return self._run(args)[1]
+
+    def startup_time(self, *args):
+        """Return the best time of a few runs of a pubs command."""
+        return min(self._run(args)[0] for _ in range(3))
+
+    def _run(self, args):
+        p = subprocess.Popen([sys.executable, '-c', SCRIPT] + list(args),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             cwd=self.home, env=self.env)
+        _, err = p.communicate()
+        lines = err.decode('utf-8').strip().splitlines()
+        self.assertTrue(lines[-1].startswith('MODULES '), msg=err)
+        self.assertTrue(lines[-2].startswith('TIME '), msg=err)
+        return float(lines[-2].split()[1]), set(lines[-1].split()[1:])
+
+    def assertNoHeavyImports(self, modules):
+        self.assertEqual([m for m in HEAVY_MODULES if m in modules], [])
+
+    def test_help(self):
+        self.assertNoHeavyImports(self.run_pubs('--help'))
+
+    def test_command_help(self):
+        self.assertNoHeavyImports(self.run_pubs('add', '--help'))
+
+    def test_list_citekeys_warm_cache(self):
+        self.run_pubs('list', '-k')
+        self.assertNoHeavyImports(self.run_pubs('list', '-k'))
+
+    def test_cached_configuration(self):
+        modules = self.run_pubs('list', '-k')
+        self.assertNotIn('configobj', modules)
+        self.assertNotIn('validate', modules)
+
+    def test_only_selected_command_is_imported(self):
+        modules = self.run_pubs('list', '-k')
+        self.assertIn('pubs.commands.list_cmd', modules)
+        self.assertNotIn('pubs.commands.add_cmd', modules)
+        self.assertNotIn('pubs.commands.tag_cmd', modules)
+
+    def test_heavy_modules_still_load_when_needed(self):
+        modules = self.run_pubs('export')
+        self.assertIn('bibtexparser', modules)
+
+    def test_config_option_is_not_a_command(self):
+        conf_path = os.path.join(self.home, '.pubsrc')
+        modules = self.run_pubs('-c', conf_path, 'list', '-k')
+        self.assertIn('pubs.commands.list_cmd', modules)
+        self.assertNotIn('pubs.commands.add_cmd', modules)
+
+    def test_help_time_budget(self):
+        self.assertLess(self.startup_time('--help'), STARTUP_BUDGET)
+
+    def test_list_citekeys_time_budget(self):
+        self.run_pubs('list', '-k')  # warm the cache
+        self.assertLess(self.startup_time('list', '-k'), STARTUP_BUDGET)
+
+
+class TestSelectedCommand(unittest.TestCase):
+
+    def test_selected_command(self):
+        self.assertEqual(pubs_cmd.selected_command(['list', '-k']), 'list')
+        self.assertIsNone(pubs_cmd.selected_command(['--help', 'list']))
+
+    def test_global_options_skipped(self):
+        for args in (['-c', 'FILE', 'list'], ['--config', 'FILE', 'list'],
+                     ['--force-colors', 'list'], ['--config=FILE', 'list']):
+            self.assertEqual(pubs_cmd.selected_command(args), 'list')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import sys
+import codecs
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import dotdot
+
+from pubs import uis, config
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# prints many lines to a reader that stops after the first one.
+BROKEN_PIPE = """
+from pubs import uis, config
+ui = uis.PrintUI(config.load_default_conf())
+ui.message_lines(str(i) for i in range(100000))
+"""
+
+
+class FakeTTY(object):
+
+    def isatty(self):
+        return True
+
+    def flush(self):
+        pass
+
+
+class TestMessageLines(unittest.TestCase):
+
+    def setUp(self):
+        self.ui = uis.PrintUI(config.load_default_conf())
+        self.out = io.BytesIO()
+        self.ui._stdout = codecs.getwriter('utf-8')(self.out)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lines(self):
+        self.ui.message_lines(iter([u'Étude', u'b']))
+        self.assertEqual(self.out.getvalue().decode('utf-8'), u'Étude\nb\n')
+
+    def test_no_pager_when_not_a_terminal(self):
+        self.ui.pager_cmd = 'false'
+        self.ui.message_lines([u'a'], page=True)
+        self.assertEqual(self.out.getvalue(), b'a\n')
+
+    def test_pager(self):
+        path = os.path.join(self.tmpdir, 'paged')
+        self.ui.pager_cmd = "sh -c 'tr a-z A-Z > {}'".format(path)
+        stdout, sys.stdout = sys.stdout, FakeTTY()
+        try:
+            self.ui.message_lines([u'a', u'b'], page=True)
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(self.out.getvalue(), b'')
+        with open(path) as f:
+            self.assertEqual(f.read(), 'A\nB\n')
+
+    def test_pager_quit_early(self):
+        self.ui.pager_cmd = 'head -c 1'
+        stdout, sys.stdout = sys.stdout, FakeTTY()
+        try:
+            self.ui.message_lines((u'line' for _ in range(100000)), page=True)
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(self.out.getvalue(), b'')
+
+    def test_broken_pipe(self):
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        p = subprocess.Popen('"{}" -c "{}" | head -1'.format(sys.executable,
+                                                             BROKEN_PIPE),
+                             shell=True, env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = p.communicate()
+        self.assertEqual(out, b'0\n')
+        self.assertEqual(err, b'')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ from __future__ import print_function, unicode_literals
 
 import unittest
 import os
+import json
 import re
 import sys
 import shutil
@@ -223,8 +224,8 @@ class TestAdd(URLContentTestCase):
         bib_dir = os.path.join(self.default_pubs_dir, 'bib')
         meta_dir = os.path.join(self.default_pubs_dir, 'meta')
         doc_dir = os.path.join(self.default_pubs_dir, 'doc')
-        self.assertEqual(set(os.listdir(bib_dir)), {'Page99.bib'})
-        self.assertEqual(set(os.listdir(meta_dir)), {'Page99.yaml'})
+        self.assertEqual(set(os.listdir(bib_dir)) - {filebroker.STAGING_DIR}, {'Page99.bib'})
+        self.assertEqual(set(os.listdir(meta_dir)) - {filebroker.STAGING_DIR}, {'Page99.yaml'})
         self.assertEqual(set(os.listdir(doc_dir)), {'Page99.pdf'})
 
     def test_add_bibutils(self):
@@ -233,7 +234,7 @@ class TestAdd(URLContentTestCase):
                 ]
         self.execute_cmds(cmds)
         bib_dir = os.path.join(self.default_pubs_dir, 'bib')
-        self.assertEqual(set(os.listdir(bib_dir)), {'Page99.bib'})
+        self.assertEqual(set(os.listdir(bib_dir)) - {filebroker.STAGING_DIR}, {'Page99.bib'})
 
     def test_add_other_repository_path(self):
         cmds = ['pubs init -p /not_default',
@@ -248,7 +249,7 @@ class TestAdd(URLContentTestCase):
                 ]
         self.execute_cmds(cmds)
         bib_dir = os.path.join(self.default_pubs_dir, 'bib')
-        self.assertEqual(set(os.listdir(bib_dir)), {'CustomCitekey.bib'})
+        self.assertEqual(set(os.listdir(bib_dir)) - {filebroker.STAGING_DIR}, {'CustomCitekey.bib'})
 
     def test_add_utf8_citekey(self):
         err = ("error: Invalid `hausdorff1949grundzüge` citekey; "
@@ -291,9 +292,9 @@ class TestAdd(URLContentTestCase):
                 ]
         self.execute_cmds(cmds)
         bib_dir = os.path.join(self.default_pubs_dir, 'bib')
-        self.assertEqual(set(os.listdir(bib_dir)), {'Page99.bib'})
+        self.assertEqual(set(os.listdir(bib_dir)) - {filebroker.STAGING_DIR}, {'Page99.bib'})
         meta_dir = os.path.join(self.default_pubs_dir, 'meta')
-        self.assertEqual(set(os.listdir(meta_dir)), {'Page99.yaml'})
+        self.assertEqual(set(os.listdir(meta_dir)) - {filebroker.STAGING_DIR}, {'Page99.yaml'})
         doc_dir = os.path.join(self.default_pubs_dir, 'doc')
         self.assertEqual(set(os.listdir(doc_dir)), {'Page99.pdf'})
 
@@ -365,6 +366,104 @@ class TestList(DataCommandTestCase):
         outs = self.execute_cmds(cmds)
         self.assertEqual(0 + 1, len(outs[-1].split('\n')))
 
+    def test_list_cached_results(self):
+        cmds = ['pubs init',
+                'pubs import data/',
+                'pubs list -k author:page',
+                'pubs list -k a:page',
+                'pubs list author:page',
+                'pubs tag Page99 network',
+                'pubs list -k tag:network',
+                'pubs remove -f Page99',
+                'pubs list -k author:page',
+                'pubs list -k tag:network',
+                ]
+        outs = self.execute_cmds(cmds)
+        self.assertEqual(outs[2], 'Page99\n')
+        self.assertEqual(outs[3], 'Page99\n')
+        self.assertEqual(outs[4].splitlines()[0][:8], '[Page99]')
+        self.assertEqual(outs[6], 'Page99\n')
+        self.assertEqual(outs[8], '')
+        self.assertEqual(outs[9], '')
+
+    def test_list_formats(self):
+        cmds = ['pubs init',
+                'pubs import data/',
+                'pubs tag Page99 network+search',
+                'pubs list --format json author:page',
+                'pubs list --format jsonl --fields citekey,year,tags',
+                'pubs list --format tsv --fields citekey,journal author:page',
+                'pubs list --format jsonl -k author:page',
+                ]
+        outs = self.execute_cmds(cmds)
+        records = json.loads(outs[3])
+        self.assertEqual(len(records), 1)
+        self.assertEqual(list(records[0].keys()),
+                         ['citekey', 'author', 'title', 'year', 'tags'])
+        self.assertEqual(records[0]['year'], '1999')
+        self.assertEqual(records[0]['tags'], ['network', 'search'])
+        records = [json.loads(line) for line in outs[4].splitlines()]
+        self.assertEqual(len(records), 4)
+        self.assertIn({'citekey': 'Page99', 'year': '1999',
+                       'tags': ['network', 'search']}, records)
+        self.assertEqual(outs[5], 'citekey\tjournal\nPage99\t\n')
+        self.assertEqual(outs[6], '{"citekey": "Page99"}\n')
+
+    def test_list_fields_requires_format(self):
+        with self.assertRaises(FakeSystemExit):
+            self.execute_cmds(['pubs init', 'pubs list --fields year'])
+
+
+class TestSearch(DataCommandTestCase):
+
+    def setUp(self):
+        super(TestSearch, self).setUp()
+        self.execute_cmds(['pubs init', 'pubs import data/'])
+
+    def test_search_typo(self):
+        cmds = ['pubs search -k babling robts',
+                'pubs search -k -n 1 informaton self organisation',
+                ]
+        outs = self.execute_cmds(cmds)
+        self.assertEqual(outs[0].splitlines()[0],
+                         '10.1371_journal.pone.0038236')
+        self.assertEqual(outs[1], '10.1371_journal.pone.0063400\n')
+
+    def test_search_after_rename_and_remove(self):
+        cmds = ['pubs rename Page99 Page1999',
+                'pubs search -k pagerank',
+                'pubs remove -f Page1999',
+                'pubs search -k pagerank',
+                ]
+        outs = self.execute_cmds(cmds)
+        self.assertEqual(outs[1], 'Page1999\n')
+        self.assertEqual(outs[3], '')
+
+    def test_search_text(self):
+        cmds = ['pubs search -k --text humanoid robot',
+                'pubs search -k --text page rank',
+                ('pubs note Page99', ['A humanoid robot surfing the web.']),
+                'pubs search -k --text -n 1 surfing humanoid',
+                ]
+        outs = self.execute_cmds(cmds)
+        self.assertEqual(set(outs[0].splitlines()),
+                         {'10.1371_journal.pone.0038236',
+                          '10.1371_journal.pone.0063400'})
+        self.assertEqual(outs[1], 'Page99\n')
+        self.assertEqual(outs[3], 'Page99\n')
+
+    def test_search_text_in_documents(self):
+        content.write_file('draft.txt', u'Eigenvector centrality of hyperlinks.')
+        content.write_file('slides.ps', u'(Universal) show (computation) show')
+        cmds = ['pubs add -k PageDraft -L -d draft.txt data/pagerank.bib',
+                'pubs add -k TuringSlides -L -d slides.ps data/turing1950.bib',
+                'pubs search -k --text eigenvector hyperlinks',
+                'pubs search -k --text universal computation',
+                ]
+        outs = self.execute_cmds(cmds)
+        self.assertEqual(outs[2], 'PageDraft\n')
+        self.assertEqual(outs[3], 'TuringSlides\n')
+
 
 class TestTag(DataCommandTestCase):
 
@@ -435,6 +534,104 @@ class TestTag(DataCommandTestCase):
         with self.assertRaises(FakeSystemExit):
             self.execute_cmds(cmds)
 
+    def test_tag_query(self):
+        cmds = ['pubs tag Turing1950 old',
+                'pubs tag --query year:1950 a+b-old',
+                'pubs tag -q author:page a',
+                'pubs list -k tag:a',
+                'pubs tag Turing1950',
+                ]
+        out = self.execute_cmds(cmds)
+        self.assertEqual(out[3].splitlines(), ['Page99', 'Turing1950'])
+        self.assertEqual(out[4], 'a b\n')
+
+    def test_tag_query_requires_tags(self):
+        with self.assertRaises(FakeSystemExit):
+            self.execute_cmds(['pubs tag -q author:page'])
+
+
+class TestMeta(DataCommandTestCase):
+
+    def setUp(self):
+        super(TestMeta, self).setUp()
+        self.execute_cmds(['pubs init',
+                           'pubs add data/pagerank.bib',
+                           'pubs add -k Turing1950 data/turing1950.bib',
+                           'pubs tag Turing1950 ai'])
+
+    def metadata(self, citekey):
+        path = os.path.join(self.default_pubs_dir, 'meta', citekey + '.yaml')
+        return endecoder.EnDecoder().decode_metadata(content.get_content(path))
+
+    def test_set(self):
+        bib_path = os.path.join(self.default_pubs_dir, 'bib', 'Turing1950.bib')
+        bib_mtime = os.path.getmtime(bib_path)
+        self.execute_cmds(['pubs meta set -q year:1950 project=thesis read=true rating=3'])
+        metadata = self.metadata('Turing1950')
+        self.assertEqual(metadata['project'], 'thesis')
+        self.assertIs(metadata['read'], True)
+        self.assertEqual(metadata['rating'], 3)
+        self.assertEqual(metadata['tags'], {'ai'})
+        self.assertNotIn('project', self.metadata('Page99'))
+        self.assertEqual(os.path.getmtime(bib_path), bib_mtime)
+
+    def test_unset(self):
+        self.execute_cmds(['pubs meta set project=thesis',
+                           'pubs meta unset --query author:page project'])
+        self.assertEqual(self.metadata('Turing1950')['project'], 'thesis')
+        self.assertNotIn('project', self.metadata('Page99'))
+
+    def test_reserved_field(self):
+        with self.assertRaises(FakeSystemExit):
+            self.execute_cmds(['pubs meta set tags=x'])
+        self.assertEqual(self.metadata('Turing1950')['tags'], {'ai'})
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(FakeSystemExit):
+            self.execute_cmds(['pubs meta set project -q year:1950'])
+        with self.assertRaises(FakeSystemExit):
+            self.execute_cmds(['pubs meta set =thesis'])
+
+
+class TestBatch(DataCommandTestCase):
+
+    def setUp(self):
+        super(TestBatch, self).setUp()
+        self.execute_cmds(['pubs init', 'pubs add data/pagerank.bib'])
+
+    def test_batch(self):
+        content.write_file('cmds.txt', '\n'.join([
+            '# tag a paper, then list it',
+            'pubs add -k Turing1950 data/turing1950.bib',
+            'tag Page99 "search engine"+network',
+            '',
+            'list -k tag:network',
+            ]))
+        out = self.execute_cmds(['pubs batch cmds.txt', 'pubs list'])
+        self.assertEqual(out[0].splitlines()[-1], 'Page99')
+        self.assertEqual(out[1].splitlines(), [
+            '[Page99] Page, Lawrence et al. "The PageRank Citation Ranking: '
+            'Bringing Order to the Web." (1999) | network,search engine',
+            '[Turing1950] Turing, Alan M "Computing machinery and intelligence" '
+            'Mind (1950) '])
+
+    def test_batch_errors(self):
+        content.write_file('cmds.txt', 'tag Page999 a\nbatch\ntag Page99 a\n')
+        with self.assertRaises(FakeSystemExit):
+            self.execute_cmds(['pubs batch cmds.txt'])
+        self.assertEqual(self.execute_cmds(['pubs list -k tag:a']), ['Page99\n'])
+
+    def test_stop_on_error(self):
+        content.write_file('cmds.txt', 'tag Page999 a\ntag Page99 a\n')
+        with self.assertRaises(FakeSystemExit):
+            self.execute_cmds(['pubs batch -x cmds.txt'])
+        self.assertEqual(self.execute_cmds(['pubs list -k tag:a']), [''])
+
+    def test_shell(self):
+        out = self.execute_cmds([('pubs shell', ['tag Page99 a', 'list -k tag:a',
+                                                 'exit'])])
+        self.assertIn('Page99\n', out[0])
+
 
 class TestNote(DataCommandTestCase):
 
@@ -549,6 +746,45 @@ class TestUsecase(DataCommandTestCase):
         docdir = os.path.expanduser('~/.pubs/doc/')
         self.assertNotIn('turing-mind-1950.pdf', os.listdir(docdir))
 
+    def test_remove_query(self):
+        cmds = ['pubs init',
+                'pubs add data/10.1371%2Fjournal.pone.0038236.bib',
+                'pubs add data/turing1950.bib',
+                'pubs add data/martius.bib',
+                'pubs tag turing1950computing obsolete',
+                'pubs tag 10.1371_journal.pone.0038236 obsolete',
+                ('pubs note turing1950computing', ['xxx']),
+                'pubs remove -f --query tag:obsolete',
+                'pubs list -k',
+                'pubs remove -f -q tag:obsolete',
+                ]
+        outs = self.execute_cmds(cmds)
+        self.assertEqual(outs[7].splitlines()[-1],
+                         'The publication(s) [10.1371_journal.pone.0038236, '
+                         'turing1950computing] were removed')
+        self.assertEqual(outs[8], '10.1371_journal.pone.0063400\n')
+        self.assertEqual(outs[9], 'No publication matches the query.\n')
+        self.assertEqual(os.listdir(os.path.expanduser('~/.pubs/notes/')), [])
+
+    def test_remove_query_and_citekeys(self):
+        cmds = ['pubs init',
+                'pubs add data/turing1950.bib',
+                'pubs add data/pagerank.bib',
+                'pubs add data/martius.bib',
+                'pubs tag Page99 obsolete',
+                'pubs remove -f -q tag:obsolete turing1950computing',
+                'pubs list -k',
+                ]
+        outs = self.execute_cmds(cmds)
+        self.assertEqual(outs[5].splitlines()[-1],
+                         'The publication(s) [turing1950computing, Page99] '
+                         'were removed')
+        self.assertEqual(outs[6], '10.1371_journal.pone.0063400\n')
+
+    def test_remove_without_citekey(self):
+        with self.assertRaises(FakeSystemExit):
+            self.execute_cmds(['pubs init', 'pubs remove -f'])
+
     def test_tag_list(self):
         correct = ['Initializing pubs in /paper_first\n',
                    '',
@@ -661,6 +897,19 @@ class TestUsecase(DataCommandTestCase):
         outs = self.execute_cmds(cmds)
         self.assertEqual(1 + 1, len(outs[-1].split('\n')))
 
+    def test_import_rolled_back_copies_no_document(self):
+        content.write_file('draft.txt', u'A draft.')
+        content.write_file('drafts.bib', u'@article{{Draft2020,\n'
+                           u'title={{A draft}},\nauthor={{Doe, John}},\n'
+                           u'year={{2020}},\nfile={{{}}}\n}}\n'.format(
+                               os.path.abspath('draft.txt'))
+                           + content.read_text_file('data/pagerank.bib'))
+        docdir = os.path.expanduser('~/.pubs/doc/')
+        self.execute_cmds(['pubs init', 'pubs add data/pagerank.bib'])
+        with self.assertRaises(FakeSystemExit):  # Page99 exists: rolled back
+            self.execute_cmds(['pubs import drafts.bib Draft2020 Page99'])
+        self.assertEqual(os.listdir(docdir), [])
+
     def test_update(self):
         cmds = ['pubs init',
                 'pubs add data/pagerank.bib',
@@ -730,6 +979,37 @@ class TestUsecase(DataCommandTestCase):
         self.execute_cmds(cmds)
         self.assertIn('page100.pdf', os.listdir('/'))
 
+    def test_rename_regenerate(self):
+        cmds = ['pubs init',
+                'pubs add -k turing data/turing1950.bib',
+                'pubs add -k Page1999 data/pagerank.bib',
+                ('pubs note turing', ['xxx']),
+                'pubs rename --regenerate --dry-run',
+                'pubs list -k',
+                'pubs rename --regenerate',
+                'pubs list -k',
+                'pubs rename --regenerate',
+                ]
+        outs = self.execute_cmds(cmds)
+        self.assertEqual(outs[4], 'turing\tTuring1950\n')
+        self.assertEqual(outs[5].splitlines(), ['turing', 'Page1999'])
+        self.assertEqual(outs[6], 'turing\tTuring1950\n')
+        self.assertEqual(outs[7].splitlines(), ['Turing1950', 'Page1999'])
+        self.assertEqual(outs[8], '')
+        note_dir = os.path.expanduser('~/.pubs/notes')
+        self.assertEqual(os.listdir(note_dir), ['Turing1950.txt'])
+
+    def test_rename_regenerate_query(self):
+        cmds = ['pubs init',
+                'pubs add -k turing data/turing1950.bib',
+                'pubs add -k page data/pagerank.bib',
+                'pubs rename --regenerate --query author:page',
+                'pubs list -k',
+                ]
+        outs = self.execute_cmds(cmds)
+        self.assertEqual(outs[3], 'page\tPage1999\n')
+        self.assertEqual(outs[4].splitlines(), ['turing', 'Page1999'])
+
 
     def test_alternate_config(self):
         alt_conf = os.path.expanduser('~/.alt_conf')